@@ -0,0 +1,165 @@
+from datetime import datetime
+from storage import read_collection, read_snapshot, transaction, read_log, last_log_seq
+from inventory import BLOOD_GROUPS, get_stock, ledger_name, list_banks, shard_slug
+from notifications import send_email_notification, send_sms_notification
+
+# Stock of each blood group at each bank is 'ok', 'low' or 'critical'. A
+# level is entered as soon as stock falls to its threshold, but only left
+# once stock climbs more than ``hysteresis`` ml above it, so stock hovering
+# around a threshold raises one alert rather than one per donation.
+ALERT_RULES = "alert_rules"
+ALERT_STATE = "stock_alerts"
+
+# Each bank's alert state is its own collection under ALERT_STATE, so checks
+# for different banks never contend. State kept in one ALERT_STATE file
+# before then seeds a bank's state the first time it is checked.
+
+LEVELS = ['ok', 'low', 'critical']
+DEFAULT_RULE = {'low': 1000, 'critical': 500, 'hysteresis': 100}
+
+# Rules are stored as {bank or '*': {blood group or '*': partial rule}};
+# the most specific entry wins field by field
+ANY = '*'
+
+def get_rules():
+    """Get every configured alert rule"""
+    return read_collection(ALERT_RULES) or {}
+
+def get_rule(rules, blood_bank, blood_group):
+    """Get the thresholds that apply to one bank and blood group"""
+    rule = dict(DEFAULT_RULE)
+    for bank in (ANY, blood_bank):
+        for group in (ANY, blood_group):
+            rule.update(rules.get(bank, {}).get(group, {}))
+    return rule
+
+def set_alert_rule(low=None, critical=None, hysteresis=None, blood_bank=None, blood_group=None):
+    """Set thresholds for one bank and/or group (None means every bank or group)"""
+    fields = {'low': low, 'critical': critical, 'hysteresis': hysteresis}
+    fields = {key: value for key, value in fields.items() if value is not None}
+    with transaction(ALERT_RULES) as uow:
+        rules = uow.get(ALERT_RULES) or {}
+        rules.setdefault(blood_bank or ANY, {}).setdefault(blood_group or ANY, {}).update(fields)
+        uow.set(ALERT_RULES, rules)
+    return True
+
+def _threshold(rule, level):
+    return rule[level] if level != 'ok' else None
+
+def stock_level(quantity, rule, current=None):
+    """Get the alert level for a quantity, staying at ``current`` inside its hysteresis band"""
+    raw = 'critical' if quantity <= rule['critical'] else 'low' if quantity <= rule['low'] else 'ok'
+    if current is None or LEVELS.index(raw) >= LEVELS.index(current):
+        return raw
+    # Recover one level at a time, each only once clear of its band
+    level = current
+    while level != raw and quantity > _threshold(rule, level) + rule['hysteresis']:
+        level = LEVELS[LEVELS.index(level) - 1]
+    return level
+
+def alert_state_name(blood_bank):
+    """Get the storage name of a bank's alert state"""
+    return f"{ALERT_STATE}/{shard_slug(blood_bank)}"
+
+def _empty_bank_state():
+    return {'offset': 0, 'ledger_seq': 0, 'levels': {}}
+
+def _bank_state(uow, name, blood_bank):
+    state = uow.get(name)
+    if not state:
+        legacy = read_snapshot(ALERT_STATE) or {'banks': {}}
+        state = dict(legacy['banks'].get(blood_bank) or _empty_bank_state())
+        state['levels'] = dict(state['levels'])
+    return state
+
+def _bank_contacts(blood_bank):
+    bank = next((b for b in read_snapshot("blood_banks") if b.get('name') == blood_bank), {})
+    return bank.get('email'), bank.get('contact')
+
+def _notify(uow, blood_bank, blood_group, level, previous, quantity, rule):
+    email, phone = _bank_contacts(blood_bank)
+    if LEVELS.index(level) < LEVELS.index(previous):
+        subject = f"Stock recovered: {blood_group} at {blood_bank}"
+        summary = f"{blood_group} stock at {blood_bank} is back up to {quantity} ml ({level}, was {previous})."
+    else:
+        subject = f"{level.title()} stock: {blood_group} at {blood_bank}"
+        summary = (f"{blood_group} stock at {blood_bank} is down to {quantity} ml, "
+                   f"at or below the {level} threshold of {rule[level]} ml.")
+    if email:
+        send_email_notification(email, subject, f"""
+{summary}
+
+Best regards,
+Blood Bank Management Team
+""", uow)
+    if phone:
+        send_sms_notification(phone, summary, uow)
+
+def _bank_rules(rules, blood_bank):
+    """Get the thresholds of every blood group at one bank"""
+    return {blood_group: get_rule(rules, blood_bank, blood_group) for blood_group in BLOOD_GROUPS}
+
+def check_stock_alerts(blood_bank):
+    """Re-evaluate a bank's alert levels for the groups its ledger touched since the last check.
+
+    Call after committing an inventory change. Only events appended since
+    the previous check are read, and a level change commits together with
+    its notifications. A bank's first check, and its first check after the
+    rules that apply to it changed, evaluates every group. Returns the
+    changes as [(blood group, old, new)].
+    """
+    ledger = ledger_name(blood_bank)
+    name = alert_state_name(blood_bank)
+    bank_rules = _bank_rules(read_snapshot(ALERT_RULES) or {}, blood_bank)
+    known = read_snapshot(name) or {}
+    if known.get('rules') == bank_rules and last_log_seq(ledger) == known.get('ledger_seq', 0):
+        return []
+
+    # Only this bank's state is locked, and notifications only when a level
+    # changes: a first pass finds the changes, and if there are any, a second
+    # one under both locks records them with their notifications
+    for names in ((name,), (name, "notifications")):
+        with transaction(*names) as uow:
+            state = _bank_state(uow, name, blood_bank)
+            touched = set(BLOOD_GROUPS) if state.get('rules') != bank_rules else set()
+            state['rules'] = bank_rules
+            for offset, event in read_log(ledger, state['offset']):
+                touched.add(event['blood_group'])
+                state['offset'] = offset
+                state['ledger_seq'] = event['seq']
+            if not touched:
+                uow.set(name, state)  # written only if just seeded from ALERT_STATE
+                return []
+
+            stock = get_stock(blood_bank)
+            changes = []
+            for blood_group in sorted(touched):
+                current = state['levels'].get(blood_group, {}).get('level', 'ok')
+                level = stock_level(stock.get(blood_group, 0), bank_rules[blood_group], current)
+                if level != current:
+                    changes.append((blood_group, current, level))
+            if changes and "notifications" not in names:
+                uow.discard()
+                continue
+            for blood_group, current, level in changes:
+                state['levels'][blood_group] = {'level': level, 'since': datetime.now().isoformat()}
+                _notify(uow, blood_bank, blood_group, level, current, stock.get(blood_group, 0),
+                        bank_rules[blood_group])
+            uow.set(name, state)
+            return changes
+
+def check_all_stock_alerts():
+    """Catch every bank's alerts up with its ledger; returns the number of level changes"""
+    return sum(len(check_stock_alerts(bank)) for bank in list_banks())
+
+def get_active_alerts(blood_bank=None):
+    """Get every bank and group currently at 'low' or 'critical', most severe first"""
+    banks = list_banks() if blood_bank is None else [blood_bank]
+    alerts = [
+        {'blood_bank': bank, 'blood_group': group, 'level': entry['level'], 'since': entry['since']}
+        for bank in banks
+        for group, entry in (read_snapshot(alert_state_name(bank)) or {'levels': {}})['levels'].items()
+        if entry['level'] != 'ok'
+    ]
+    alerts.sort(key=lambda a: (-LEVELS.index(a['level']), a['since']))
+    return alerts
@@ -0,0 +1,237 @@
+import heapq
+from blood_management import get_compatible_donors, check_blood_compatibility
+from storage import read_partitioned
+from inventory import BLOOD_GROUPS, get_stock_by_bank
+from request_queue import iter_pending_ids
+
+# Value of one ml delivered to each urgency tier. Each tier is worth more
+# than any amount of a lower tier's substitution penalties, so the solver
+# never gives up Critical/High demand to save universal donor blood.
+URGENCY_WEIGHTS = {'Critical': 10000, 'High': 1000, 'Medium': 100, 'Low': 10}
+PRIORITY_URGENCIES = ('Critical', 'High')
+
+# Issuing a different (compatible) group costs more the more recipients
+# that group could otherwise serve; O- can serve everyone and costs most.
+EXACT_MATCH_PENALTY = 0
+O_NEG_EXTRA_PENALTY = 1
+
+class MinCostFlow:
+    """Successive-shortest-path min-cost flow with Johnson potentials.
+
+    Negative edge costs are allowed: potentials are seeded with one
+    Bellman-Ford pass, after which every augmentation is a Dijkstra search.
+    """
+
+    def __init__(self, num_nodes):
+        self.num_nodes = num_nodes
+        self.graph = [[] for _ in range(num_nodes)]
+
+    def add_edge(self, u, v, capacity, cost):
+        """Add a directed edge and return a handle for reading its flow"""
+        self.graph[u].append([v, capacity, cost, len(self.graph[v])])
+        self.graph[v].append([u, 0, -cost, len(self.graph[u]) - 1])
+        return (u, len(self.graph[u]) - 1, capacity)
+
+    def edge_flow(self, handle):
+        """Get the flow pushed through an edge returned by add_edge"""
+        u, index, capacity = handle
+        return capacity - self.graph[u][index][1]
+
+    def _bellman_ford(self, source):
+        dist = [float('inf')] * self.num_nodes
+        dist[source] = 0
+        for _ in range(self.num_nodes - 1):
+            changed = False
+            for u in range(self.num_nodes):
+                if dist[u] == float('inf'):
+                    continue
+                for v, capacity, cost, _ in self.graph[u]:
+                    if capacity > 0 and dist[u] + cost < dist[v]:
+                        dist[v] = dist[u] + cost
+                        changed = True
+            if not changed:
+                break
+        return [d if d != float('inf') else 0 for d in dist]
+
+    def solve(self, source, sink, max_flow=float('inf'), stop_when_unprofitable=False):
+        """Push flow from source to sink at minimum cost.
+
+        With ``stop_when_unprofitable`` augmentation stops as soon as the
+        cheapest remaining path no longer lowers the total cost, which gives a
+        minimum-cost flow of any size rather than a maximum flow.
+        Returns ``(flow, cost)``.
+        """
+        potential = self._bellman_ford(source)
+        flow = cost = 0
+        while flow < max_flow:
+            dist = [float('inf')] * self.num_nodes
+            prev = [None] * self.num_nodes
+            dist[source] = 0
+            heap = [(0, source)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                if u == sink:
+                    break  # nodes further than the sink cannot lie on this path
+                for index, (v, capacity, edge_cost, _) in enumerate(self.graph[u]):
+                    if capacity <= 0:
+                        continue
+                    nd = d + edge_cost + potential[u] - potential[v]
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        prev[v] = (u, index)
+                        heapq.heappush(heap, (nd, v))
+            if dist[sink] == float('inf'):
+                break
+            # Capping at the sink's distance keeps every reduced cost non-negative
+            for v in range(self.num_nodes):
+                potential[v] += min(dist[v], dist[sink])
+
+            path_cost = potential[sink] - potential[source]
+            if stop_when_unprofitable and path_cost >= 0:
+                break
+
+            push = max_flow - flow
+            v = sink
+            while v != source:
+                u, index = prev[v]
+                push = min(push, self.graph[u][index][1])
+                v = u
+            v = sink
+            while v != source:
+                u, index = prev[v]
+                edge = self.graph[u][index]
+                edge[1] -= push
+                self.graph[v][edge[3]][1] += push
+                v = u
+            flow += push
+            cost += push * path_cost
+        return flow, cost
+
+def substitution_penalty(donor_group, recipient_group):
+    """Get the cost of issuing donor_group blood to a recipient_group patient"""
+    if donor_group == recipient_group:
+        return EXACT_MATCH_PENALTY
+    versatility = sum(check_blood_compatibility(donor_group, bg) for bg in BLOOD_GROUPS)
+    return versatility + (O_NEG_EXTRA_PENALTY if donor_group == 'O-' else 0)
+
+def allocate_requests(requests=None, stock_by_bank=None, o_neg_reserve=0):
+    """Compute an allocation of bank stock to pending blood requests.
+
+    Requests with the same blood group and urgency are interchangeable for
+    the objective, so the flow network has one demand node per
+    (blood group, urgency) class instead of one per request: its size is
+    independent of the backlog. Up to ``o_neg_reserve`` ml of O- is held
+    back for Critical and High requests only. Each class's share is then
+    handed to its requests in order of ``required_date``, and drawn from the
+    banks holding the most of each group.
+
+    Returns a dict with the ``allocations`` list ({request_id, blood_group,
+    blood_bank, quantity}), per-request ``fulfilled`` amounts and an
+    ``unmet`` total per urgency.
+    """
+    if requests is None:
+        requests_by_id = {r.get('id'): r for r in read_partitioned("requests", sealed=False)}
+        requests = [requests_by_id[i] for i in iter_pending_ids() if i in requests_by_id]
+    if stock_by_bank is None:
+        stock_by_bank = get_stock_by_bank()
+
+    supply = {bg: 0 for bg in BLOOD_GROUPS}
+    for groups in stock_by_bank.values():
+        for bg, quantity in groups.items():
+            supply[bg] = supply.get(bg, 0) + max(0, quantity)
+
+    demand = {}
+    for request in requests:
+        key = (request['blood_group'], request['urgency'])
+        demand[key] = demand.get(key, 0) + request['quantity']
+
+    # Nodes: source, one per supply pool, one per demand class, sink.
+    # O- is split into a free pool and a reserve only priority demand may use.
+    reserve = min(o_neg_reserve, supply.get('O-', 0))
+    pools = [(bg, supply[bg] - (reserve if bg == 'O-' else 0), False) for bg in BLOOD_GROUPS]
+    pools.append(('O-', reserve, True))
+    classes = list(demand)
+    source, sink = 0, 1 + len(pools) + len(classes)
+    network = MinCostFlow(sink + 1)
+
+    for i, (_, capacity, _) in enumerate(pools):
+        network.add_edge(source, 1 + i, capacity, 0)
+    for j, key in enumerate(classes):
+        network.add_edge(1 + len(pools) + j, sink, demand[key], 0)
+
+    handles = []
+    for i, (donor_group, capacity, is_reserve) in enumerate(pools):
+        if capacity <= 0:
+            continue
+        for j, (recipient_group, urgency) in enumerate(classes):
+            if donor_group not in get_compatible_donors(recipient_group):
+                continue
+            if is_reserve and urgency not in PRIORITY_URGENCIES:
+                continue
+            cost = -URGENCY_WEIGHTS.get(urgency, 0) + substitution_penalty(donor_group, recipient_group)
+            handle = network.add_edge(1 + i, 1 + len(pools) + j, capacity, cost)
+            handles.append((donor_group, (recipient_group, urgency), handle))
+
+    network.solve(source, sink, stop_when_unprofitable=True)
+
+    # How much of each donor group every demand class received
+    class_supply = {}
+    for donor_group, key, handle in handles:
+        amount = network.edge_flow(handle)
+        if amount:
+            groups = class_supply.setdefault(key, {})
+            groups[donor_group] = groups.get(donor_group, 0) + amount
+
+    # One max-heap of banks per blood group, keyed on remaining stock
+    bank_heaps = {
+        bg: [(-groups.get(bg, 0), bank) for bank, groups in stock_by_bank.items() if groups.get(bg, 0) > 0]
+        for bg in BLOOD_GROUPS
+    }
+    for heap in bank_heaps.values():
+        heapq.heapify(heap)
+    allocations = []
+    fulfilled = {}
+    unmet = {urgency: 0 for urgency in URGENCY_WEIGHTS}
+
+    by_class = {}
+    for request in requests:
+        by_class.setdefault((request['blood_group'], request['urgency']), []).append(request)
+
+    for key, class_requests in by_class.items():
+        # Exact matches first, most versatile (O-) last
+        groups = sorted(class_supply.get(key, {}).items(), key=lambda item: substitution_penalty(item[0], key[0]))
+        class_requests.sort(key=lambda r: (r['required_date'], r['date']))
+        for request in class_requests:
+            needed = request['quantity']
+            for index, (donor_group, available) in enumerate(groups):
+                if needed == 0:
+                    break
+                take = min(needed, available)
+                if take == 0:
+                    continue
+                groups[index] = (donor_group, available - take)
+                needed -= take
+                allocations.extend(_draw_from_banks(bank_heaps[donor_group], request['id'], donor_group, take))
+            fulfilled[request['id']] = request['quantity'] - needed
+            unmet[request['urgency']] = unmet.get(request['urgency'], 0) + needed
+
+    return {'allocations': allocations, 'fulfilled': fulfilled, 'unmet': unmet}
+
+def _draw_from_banks(bank_heap, request_id, blood_group, quantity):
+    """Take quantity of a group from the best-stocked banks first"""
+    allocations = []
+    while quantity > 0 and bank_heap:
+        negative_stock, bank = heapq.heappop(bank_heap)
+        take = min(quantity, -negative_stock)
+        quantity -= take
+        if take < -negative_stock:
+            heapq.heappush(bank_heap, (negative_stock + take, bank))
+        allocations.append({
+            'request_id': request_id,
+            'blood_group': blood_group,
+            'blood_bank': bank,
+            'quantity': take
+        })
+    return allocations
@@ -1,7 +1,7 @@
 import streamlit as st
 import json
 import os
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import pandas as pd
 
 # Import modules conditionally to avoid import errors
@@ -11,10 +11,12 @@ try:
         login_user, logout_user, register_user,
         initiate_password_reset, reset_password
     )
-    from blood_management import donate_blood, request_blood, get_blood_inventory, load_donations, load_requests
+    from blood_management import donate_blood, request_blood, get_donor_donations, get_requester_requests
     from maps import show_blood_bank_map
-    from request_management import get_pending_requests_for_donor, respond_to_request, get_requester_notifications
+    from request_management import get_pending_requests_page, respond_to_request, get_requester_notifications
     from notifications import get_user_notifications
+    from eligibility import get_eligibility
+    from records import to_storage
     IMPORTS_SUCCESS = True
 except ImportError as e:
     IMPORTS_SUCCESS = False
@@ -193,9 +195,16 @@ def register_form():
                 blood_group = st.selectbox("Blood Group", ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
             with col4:
                 age = st.number_input("Age", min_value=18, max_value=65, value=25)
+            st.caption("Optional: share where you live so we can contact you for requests nearby.")
+            col5, col6 = st.columns(2)
+            with col5:
+                lat = st.number_input("Latitude", min_value=-90.0, max_value=90.0, value=None, format="%.4f")
+            with col6:
+                lng = st.number_input("Longitude", min_value=-180.0, max_value=180.0, value=None, format="%.4f")
         else:
             blood_group = None
             age = None
+            lat = lng = None
         
         submitted = st.form_submit_button("Create Account")
         
@@ -206,7 +215,9 @@ def register_form():
                 elif len(password) < 6:
                     st.error("Password must be at least 6 characters long.")
                 else:
-                    result = register_user(username, email, phone, password, user_type, blood_group, age)
+                    if (lat is None) != (lng is None):
+                        lat = lng = None  # a single coordinate is not a location
+                    result = register_user(username, email, phone, password, user_type, blood_group, age, lat, lng)
                     if result['success']:
                         st.success("🎉 Registration successful! Please login to continue.")
                         st.balloons()
@@ -289,7 +300,11 @@ def donate_blood_page():
         
         if submitted:
             if donor_name and blood_group and quantity and blood_bank:
-                if donate_blood(donor_name, blood_group, quantity, donation_date, blood_bank, notes):
+                eligibility = get_eligibility(donor_name, donation_date)
+                if not eligibility['eligible']:
+                    st.error(f"{donor_name} is not eligible to donate until {eligibility['next_eligible_date']} "
+                             f"(last donation: {eligibility['last_donation'] or 'none'}).")
+                elif donate_blood(donor_name, blood_group, quantity, donation_date, blood_bank, notes):
                     st.success("Blood donation recorded successfully!")
                     st.balloons()
                 else:
@@ -314,12 +329,16 @@ def request_blood_page():
             required_date = st.date_input("Required By", value=datetime.now().date())
             reason = st.text_area("Reason for Request")
             contact_info = st.text_input("Contact Information")
+            lat = st.number_input("Hospital Latitude (optional)", min_value=-90.0, max_value=90.0, value=None, format="%.4f")
+            lng = st.number_input("Hospital Longitude (optional)", min_value=-180.0, max_value=180.0, value=None, format="%.4f")
         
         submitted = st.form_submit_button("Submit Request")
         
         if submitted:
             if requester_name and blood_group and quantity and reason and contact_info:
-                result = request_blood(requester_name, blood_group, quantity, urgency, required_date, reason, contact_info)
+                if (lat is None) != (lng is None):
+                    lat = lng = None  # a single coordinate is not a location
+                result = request_blood(requester_name, blood_group, quantity, urgency, required_date, reason, contact_info, lat, lng)
                 if result['success']:
                     st.success("Blood request submitted successfully!")
                     st.info(f"Request ID: {result['request_id']}")
@@ -333,42 +352,90 @@ def show_blood_requests_for_donor():
     """Display blood requests for donor"""
     st.header("🩸 Available Blood Requests")
     
-    requests = get_pending_requests_for_donor(st.session_state.username)
+    # Filters and sorting
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        urgencies = st.multiselect("Urgency", ["Critical", "High", "Medium", "Low"])
+    with col2:
+        sort_labels = {"Most urgent first": "urgency", "Required soonest": "required_date", "Newest first": "newest"}
+        sort_by = sort_labels[st.selectbox("Sort by", list(sort_labels.keys()))]
+    with col3:
+        page_size = st.selectbox("Per page", [10, 25, 50])
     
-    if requests:
-        for request in requests:
-            with st.expander(f"Request #{request['id']} - {request['blood_group']} - {request['urgency']} Priority"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.write(f"**Requester:** {request['requester']}")
-                    st.write(f"**Blood Group:** {request['blood_group']}")
-                    st.write(f"**Quantity:** {request['quantity']} ml")
-                    st.write(f"**Urgency:** {request['urgency']}")
-                
-                with col2:
-                    st.write(f"**Required By:** {request['required_date']}")
-                    st.write(f"**Reason:** {request['reason']}")
-                    st.write(f"**Contact:** {request['contact_info']}")
-                
-                # Response form
-                with st.form(f"response_form_{request['id']}"):
-                    response_type = st.selectbox("Response", ["accept", "decline"], key=f"response_{request['id']}")
-                    if response_type == "accept":
-                        quantity_offered = st.number_input("Quantity You Can Offer (ml)", min_value=100, max_value=request['quantity'], value=request['quantity'], key=f"quantity_{request['id']}")
-                    else:
-                        quantity_offered = 0
-                    
-                    message = st.text_area("Message to Requester", key=f"message_{request['id']}")
-                    
-                    if st.form_submit_button(f"Submit Response", key=f"submit_{request['id']}"):
-                        if respond_to_request(request['id'], st.session_state.username, response_type, message, quantity_offered):
-                            st.success("Response submitted successfully!")
-                            st.rerun()
-                        else:
-                            st.error("Failed to submit response.")
-    else:
+    if 'request_page' not in st.session_state:
+        st.session_state.request_page = 1
+    
+    result = get_pending_requests_page(
+        st.session_state.username,
+        page=st.session_state.request_page,
+        page_size=page_size,
+        sort_by=sort_by,
+        urgencies=urgencies
+    )
+    requests = result['requests']
+    
+    if not requests:
         st.info("No blood requests available for your blood group at the moment.")
+        return
+    
+    eligibility = get_eligibility(st.session_state.username)
+    if not eligibility['eligible']:
+        st.warning(f"You can respond to requests, but you are not eligible to donate until {eligibility['next_eligible_date']}.")
+    
+    st.caption(f"Showing page {result['page']} of {result['pages']} ({result['total']} matching requests)")
+    
+    # One table for the whole page instead of a widget tree per request
+    df = pd.DataFrame(to_storage(requests))
+    st.dataframe(df[['id', 'blood_group', 'quantity', 'urgency', 'required_date', 'requester']], use_container_width=True, hide_index=True)
+    
+    nav1, nav2, nav3 = st.columns([1, 2, 1])
+    with nav1:
+        if st.button("⬅️ Previous", disabled=result['page'] <= 1):
+            st.session_state.request_page = result['page'] - 1
+            st.rerun()
+    with nav3:
+        if st.button("Next ➡️", disabled=result['page'] >= result['pages']):
+            st.session_state.request_page = result['page'] + 1
+            st.rerun()
+    
+    # Only the selected request gets a detail view and response form
+    requests_by_id = {r.id: r for r in requests}
+    selected_id = st.selectbox(
+        "Select a request to respond to",
+        list(requests_by_id.keys()),
+        format_func=lambda rid: f"Request #{rid} - {requests_by_id[rid].blood_group} - {requests_by_id[rid].urgency} Priority"
+    )
+    request = requests_by_id[selected_id]
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.write(f"**Requester:** {request.requester}")
+        st.write(f"**Blood Group:** {request.blood_group}")
+        st.write(f"**Quantity:** {request.quantity} ml")
+        st.write(f"**Urgency:** {request.urgency}")
+    
+    with col2:
+        st.write(f"**Required By:** {request.required_date}")
+        st.write(f"**Reason:** {request.reason}")
+        st.write(f"**Contact:** {request.contact_info}")
+    
+    # Response form
+    with st.form(f"response_form_{request.id}"):
+        response_type = st.selectbox("Response", ["accept", "decline"], key=f"response_{request.id}")
+        if response_type == "accept":
+            quantity_offered = st.number_input("Quantity You Can Offer (ml)", min_value=100, max_value=request.quantity, value=request.quantity, key=f"quantity_{request.id}")
+        else:
+            quantity_offered = 0
+        
+        message = st.text_area("Message to Requester", key=f"message_{request.id}")
+        
+        if st.form_submit_button("Submit Response"):
+            if respond_to_request(request.id, st.session_state.username, response_type, message, quantity_offered):
+                st.success("Response submitted successfully!")
+                st.rerun()
+            else:
+                st.error("Failed to submit response.")
 
 def show_request_responses():
     """Display request responses for receiver"""
@@ -377,38 +444,46 @@ def show_request_responses():
     responses = get_requester_notifications(st.session_state.username)
     
     if responses:
-        for response in responses:
-            with st.expander(f"Response to Request #{response['request_id']} - {response['response_type'].title()}"):
+        for response, request in responses:
+            with st.expander(f"Response to Request #{response.request_id} - {response.response_type.title()}"):
                 col1, col2 = st.columns(2)
                 
                 with col1:
-                    st.write(f"**Donor:** {response['donor_username']}")
-                    st.write(f"**Response:** {response['response_type'].title()}")
-                    st.write(f"**Date:** {response['response_date']}")
+                    st.write(f"**Donor:** {response.donor_username}")
+                    st.write(f"**Response:** {response.response_type.title()}")
+                    st.write(f"**Date:** {response.response_date}")
                     
                 with col2:
-                    if response['response_type'] == 'accept':
-                        st.write(f"**Quantity Offered:** {response['quantity_offered']} ml")
-                    st.write(f"**Message:** {response['message']}")
+                    if response.response_type == 'accept':
+                        st.write(f"**Quantity Offered:** {response.quantity_offered} ml")
+                    st.write(f"**Message:** {response.message}")
                     
                 st.markdown("**Original Request:**")
-                st.write(f"Blood Group: {response['request_details']['blood_group']}, Quantity: {response['request_details']['quantity']} ml")
+                st.write(f"Blood Group: {request.blood_group}, Quantity: {request.quantity} ml")
     else:
         st.info("No responses received yet.")
 
+# Period choices for the history pages: label -> days back (None for all time)
+HISTORY_PERIODS = {"Last 3 months": 90, "Last 12 months": 365, "All time": None}
+
+def _period_start(period):
+    days = HISTORY_PERIODS[period]
+    return date.today() - timedelta(days=days) if days is not None else None
+
 def show_my_donations():
     """Display user's donations"""
     st.header("📋 My Donations")
     
-    donations = load_donations()
-    user_donations = [d for d in donations if d['donor'] == st.session_state.username]
+    # A bounded period only opens that period's monthly partitions
+    period = st.selectbox("Period", list(HISTORY_PERIODS), key="my_donations_period")
+    user_donations = get_donor_donations(st.session_state.username, since=_period_start(period))
     
     if user_donations:
-        df = pd.DataFrame(user_donations)
+        df = pd.DataFrame(to_storage(user_donations))
         st.dataframe(df[['date', 'blood_group', 'quantity', 'blood_bank', 'notes']], use_container_width=True)
         
         # Summary
-        total_donated = sum(d['quantity'] for d in user_donations)
+        total_donated = sum(d.quantity for d in user_donations)
         st.metric("Total Donated", f"{total_donated} ml")
     else:
         st.info("No donations recorded yet.")
@@ -417,11 +492,11 @@ def show_my_requests():
     """Display user's requests"""
     st.header("📋 My Requests")
     
-    requests = load_requests()
-    user_requests = [r for r in requests if r['requester'] == st.session_state.username]
+    period = st.selectbox("Period", list(HISTORY_PERIODS), key="my_requests_period")
+    user_requests = get_requester_requests(st.session_state.username, since=_period_start(period))
     
     if user_requests:
-        df = pd.DataFrame(user_requests)
+        df = pd.DataFrame(to_storage(user_requests))
         st.dataframe(df[['date', 'blood_group', 'quantity', 'urgency', 'status', 'reason']], use_container_width=True)
     else:
         st.info("No requests submitted yet.")
@@ -439,11 +514,11 @@ def show_my_notifications():
         
         if notifications:
             for notification in notifications:
-                with st.expander(f"{notification['type'].upper()} - {notification['timestamp'][:10]}"):
-                    if notification['type'] == 'email':
-                        st.write(f"**Subject:** {notification['subject']}")
-                    st.write(f"**Message:** {notification['message']}")
-                    st.write(f"**Status:** {notification['status']}")
+                with st.expander(f"{notification.type.upper()} - {notification.timestamp[:10]}"):
+                    if notification.type == 'email':
+                        st.write(f"**Subject:** {notification.subject}")
+                    st.write(f"**Message:** {notification.message}")
+                    st.write(f"**Status:** {notification.status}")
         else:
             st.info("No notifications yet.")
     else:
@@ -1,7 +1,5 @@
-import json
 import hashlib
 import streamlit as st
-import os
 from datetime import datetime
 from notifications import (
     generate_otp, send_sms_notification, store_otp, verify_otp, 
@@ -9,6 +7,7 @@ from notifications import (
     store_reset_token, send_password_reset_email, verify_reset_token,
     send_email_notification
 )
+from storage import read_collection, read_snapshot, write_collection, transaction, update_record, StorageError
 
 def hash_password(password):
     """Hash password using SHA256"""
@@ -16,33 +15,18 @@ def hash_password(password):
 
 def load_users():
     """Load users from JSON file"""
-    try:
-        with open("data/users.json", 'r') as f:
-            return json.load(f)
-    except:
-        return []
+    return read_collection("users")
 
 def save_users(users):
     """Save users to JSON file"""
     try:
-        os.makedirs("data", exist_ok=True)
-        with open("data/users.json", 'w') as f:
-            json.dump(users, f, indent=2)
+        write_collection("users", users)
         return True
-    except:
+    except (OSError, StorageError):
         return False
 
-def register_user(username, email, phone, password, user_type, blood_group=None, age=None):
-    """Register a new user"""
-    users = load_users()
-    
-    # Check if username or email already exists
-    if any(user['username'] == username for user in users):
-        return {'success': False, 'error': 'Username already exists'}
-    
-    if any(user['email'] == email for user in users):
-        return {'success': False, 'error': 'Email already registered'}
-    
+def register_user(username, email, phone, password, user_type, blood_group=None, age=None, lat=None, lng=None):
+    """Register a new user, optionally with home coordinates"""
     # Create new user
     new_user = {
         'username': username,
@@ -53,19 +37,32 @@ def register_user(username, email, phone, password, user_type, blood_group=None,
         'registration_date': datetime.now().isoformat(),
         'blood_group': blood_group,
         'age': age,
+        'lat': lat,
+        'lng': lng,
         'email_verified': False,
-        'phone_verified': False
+        'phone_verified': False,
+        'version': 1
     }
     
-    users.append(new_user)
-    success = save_users(users)
-    
-    if success:
-        # Send registration confirmation email
-        send_registration_email(email, username)
-        return {'success': True, 'message': 'Registration successful'}
-    else:
+    try:
+        with transaction("users", "notifications") as uow:
+            users = uow.get("users")
+            
+            # Check if username or email already exists
+            if any(user['username'] == username for user in users):
+                return {'success': False, 'error': 'Username already exists'}
+            
+            if any(user['email'] == email for user in users):
+                return {'success': False, 'error': 'Email already registered'}
+            
+            users.append(new_user)
+            
+            # Send registration confirmation email in the same commit
+            send_registration_email(email, username, uow)
+    except OSError:
         return {'success': False, 'error': 'Failed to save user data'}
+    
+    return {'success': True, 'message': 'Registration successful'}
 
 def send_email_otp(email):
     """Send OTP to email"""
@@ -133,36 +130,59 @@ def reset_password(email, token, new_password):
     if not verify_reset_token(email, token):
         return {'success': False, 'error': 'Invalid or expired reset token'}
     
-    users = load_users()
+    user = next((u for u in load_users() if u['email'] == email), None)
+    if not user:
+        return {'success': False, 'error': 'User not found'}
     
-    # Find and update user password
-    for user in users:
-        if user['email'] == email:
-            user['password'] = hash_password(new_password)
-            if save_users(users):
-                return {'success': True, 'message': 'Password reset successfully'}
-            else:
-                return {'success': False, 'error': 'Failed to update password'}
+    def set_password(user):
+        user['password'] = hash_password(new_password)
+        return user
+    
+    try:
+        if update_record("users", user['username'], set_password) is None:
+            return {'success': False, 'error': 'User not found'}
+    except OSError:
+        return {'success': False, 'error': 'Failed to update password'}
     
-    return {'success': False, 'error': 'User not found'}
+    return {'success': True, 'message': 'Password reset successfully'}
 
 def change_password(username, current_password, new_password):
     """Change password with current password verification"""
-    users = load_users()
+    wrong_password = []
     
-    # Find user and verify current password
-    for user in users:
-        if user['username'] == username:
-            if user['password'] == hash_password(current_password):
-                user['password'] = hash_password(new_password)
-                if save_users(users):
-                    return {'success': True, 'message': 'Password changed successfully'}
-                else:
-                    return {'success': False, 'error': 'Failed to update password'}
-            else:
-                return {'success': False, 'error': 'Current password is incorrect'}
+    def set_password(user):
+        # Verify the current password against the freshest copy of the user
+        if user['password'] != hash_password(current_password):
+            wrong_password.append(True)
+            return None
+        user['password'] = hash_password(new_password)
+        return user
     
-    return {'success': False, 'error': 'User not found'}
+    try:
+        updated = update_record("users", username, set_password)
+    except OSError:
+        return {'success': False, 'error': 'Failed to update password'}
+    
+    if wrong_password:
+        return {'success': False, 'error': 'Current password is incorrect'}
+    if updated is None:
+        return {'success': False, 'error': 'User not found'}
+    return {'success': True, 'message': 'Password changed successfully'}
+
+def update_user_location(username, lat, lng):
+    """Set (or with None, clear) a user's home coordinates"""
+    def set_location(user):
+        user['lat'] = lat
+        user['lng'] = lng
+        return user
+    
+    try:
+        if update_record("users", username, set_location) is None:
+            return {'success': False, 'error': 'User not found'}
+    except OSError:
+        return {'success': False, 'error': 'Failed to update location'}
+    
+    return {'success': True, 'message': 'Location updated'}
 
 def login_user(username, password, user_type):
     """Authenticate user login"""
@@ -190,18 +210,18 @@ def logout_user():
 
 def get_user_info(username):
     """Get user information"""
-    users = load_users()
+    users = read_snapshot("users")
     for user in users:
         if user['username'] == username:
-            return user
+            return dict(user)
     return None
 
 def get_total_users():
     """Get total number of registered users"""
-    users = load_users()
+    users = read_snapshot("users")
     return len(users)
 
 def get_users_by_type(user_type):
     """Get users by type (donor/receiver)"""
-    users = load_users()
+    users = read_snapshot("users")
     return [user for user in users if user['user_type'] == user_type]
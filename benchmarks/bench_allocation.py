@@ -0,0 +1,61 @@
+"""Benchmark the batch allocator on a synthetic backlog.
+
+Run from the repository root:
+
+    python benchmarks/bench_allocation.py [num_requests] [num_banks]
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from allocation import allocate_requests, URGENCY_WEIGHTS
+from inventory import BLOOD_GROUPS
+
+# Rough population frequencies, used for both supply and demand
+GROUP_WEIGHTS = [34, 6, 9, 2, 3, 1, 38, 7]
+
+def make_backlog(num_requests, num_banks, seed=42):
+    rng = random.Random(seed)
+    today = date.today()
+    requests = [
+        {
+            'id': f"REQ_{i}",
+            'blood_group': rng.choices(BLOOD_GROUPS, GROUP_WEIGHTS)[0],
+            'urgency': rng.choices(list(URGENCY_WEIGHTS), [1, 3, 4, 2])[0],
+            'quantity': rng.choice([350, 450, 700, 900]),
+            'required_date': (today + timedelta(days=rng.randint(0, 14))).isoformat(),
+            'date': (today - timedelta(days=rng.randint(0, 30))).isoformat(),
+        }
+        for i in range(num_requests)
+    ]
+    stock_by_bank = {
+        f"Bank {b}": {bg: rng.randint(0, 12) * 350 * w // 10 for bg, w in zip(BLOOD_GROUPS, GROUP_WEIGHTS)}
+        for b in range(num_banks)
+    }
+    return requests, stock_by_bank
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    num_banks = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    requests, stock_by_bank = make_backlog(num_requests, num_banks)
+
+    started = time.perf_counter()
+    result = allocate_requests(requests, stock_by_bank, o_neg_reserve=5000)
+    elapsed = time.perf_counter() - started
+
+    demand = {u: 0 for u in URGENCY_WEIGHTS}
+    for request in requests:
+        demand[request['urgency']] += request['quantity']
+
+    print(f"{num_requests} requests, {num_banks} banks: {elapsed * 1000:.1f} ms, "
+          f"{len(result['allocations'])} allocations")
+    for urgency, total in demand.items():
+        met = total - result['unmet'][urgency]
+        print(f"  {urgency:<8} {met:>9,} / {total:>9,} ml met")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark commit throughput and latency under each durability mode.
+
+Each writer thread commits small changes to its own collection, so commits
+only share the WAL. Runs in a throwaway data directory; run from the
+repository root:
+
+    python benchmarks/bench_durability.py [threads] [commits_per_thread]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench_durability_"))
+
+import storage
+
+def writer(name, commits, latencies):
+    for i in range(commits):
+        started = time.perf_counter()
+        with storage.transaction(name) as uow:
+            uow.set(name, {'count': i, 'note': "x" * 200})
+        latencies.append(time.perf_counter() - started)
+
+def run(mode, threads, commits):
+    storage.set_durability("bench", mode)
+    latencies = []
+    before = storage.get_durability_metrics()['fsyncs']
+    workers = [
+        threading.Thread(target=writer, args=(f"bench/{mode}-{t}", commits, latencies))
+        for t in range(threads)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    storage.checkpoint()
+    fsyncs = storage.get_durability_metrics()['fsyncs'] - before
+
+    latencies.sort()
+    total = threads * commits
+    print(f"  {mode:6s} {total / elapsed:9,.0f} commits/s  p50 {latencies[total // 2] * 1000:6.2f} ms  "
+          f"p99 {latencies[int(total * 0.99)] * 1000:6.2f} ms  {fsyncs:5,} WAL syncs")
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    commits = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"{threads} writer threads x {commits} commits")
+    for mode in storage.DURABILITY_MODES:
+        run(mode, threads, commits)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark bursts of concurrent donation-style writes with and without group commit.
+
+Each call appends a record to a collection that already holds
+``num_records`` and an event to a ledger, as donate_blood does. Runs in a
+throwaway data directory; run from the repository root:
+
+    python benchmarks/bench_group_commit.py [threads] [calls_per_thread] [num_records]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench_group_commit_"))
+
+import storage
+
+NAMES = ("bench_donations", "bench_ledger")
+
+def make_operation(thread, i):
+    def operation(uow):
+        uow.get("bench_donations").append({'id': f"DON_{thread}_{i}", 'donor': f"donor{thread}", 'quantity': 350})
+        uow.append("bench_ledger", {'type': 'credit', 'quantity': 350, 'ref': f"DON_{thread}_{i}"})
+        return True
+    return operation
+
+def individually(operation):
+    with storage.transaction(*NAMES) as uow:
+        return operation(uow)
+
+def batched(operation):
+    return storage.group_commit(NAMES, operation)
+
+def run(label, commit, threads, calls):
+    latencies = []
+
+    def caller(thread):
+        for i in range(calls):
+            started = time.perf_counter()
+            commit(make_operation(thread, i))
+            latencies.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=caller, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    total = threads * calls
+    print(f"  {label:12s} {total / elapsed:8,.0f} calls/s  p50 {latencies[total // 2] * 1000:7.2f} ms  "
+          f"p99 {latencies[int(total * 0.99)] * 1000:7.2f} ms")
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    num_records = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+    storage.write_collection("bench_donations", [
+        {'id': f"OLD_{i}", 'donor': f"donor{i}", 'quantity': 350} for i in range(num_records)
+    ])
+    print(f"{threads} threads x {calls} calls onto {num_records:,} existing records")
+    run("individual", individually, threads, calls)
+    run("group commit", batched, threads, calls)
+    metrics = storage.get_group_commit_metrics()
+    print(f"  {metrics['calls']:,} calls in {metrics['batches']:,} commits "
+          f"(largest {metrics['max_batch']}), {metrics['fallbacks']} fallbacks")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark date-bounded reads of month-partitioned donations against full scans.
+
+Run from the repository root:
+
+    python benchmarks/bench_partitions.py [months] [donations_per_month]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench_partitions_"))
+
+import storage
+import blood_management
+import ids
+
+def make_history(months, per_month, seed=42):
+    rng = random.Random(seed)
+    today = date.today()
+    donations = []
+    for back in range(months):
+        month = storage._shift_month(today.strftime("%Y-%m"), -back)
+        year, number = int(month[:4]), int(month[5:])
+        for i in range(per_month):
+            created = datetime(year, number, rng.randint(1, 28), rng.randint(0, 23))
+            millis = int(created.timestamp() * 1000) - ids.EPOCH_MS
+            donations.append({
+                'id': f"DON_{(millis << ids.TIME_SHIFT) + i:0{ids.ID_DIGITS}d}",
+                'donor': f"donor{rng.randrange(2000)}",
+                'blood_group': rng.choice(["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]),
+                'quantity': 450,
+                'date': created.date().isoformat(),
+                'blood_bank': "City Blood Bank",
+                'timestamp': created.isoformat()
+            })
+    return donations
+
+def timed(label, func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        storage._snapshots.clear()  # measure cold reads
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:34s} {best * 1000:9.1f} ms")
+    return result
+
+def main():
+    months = int(sys.argv[1]) if len(sys.argv) > 1 else 36
+    per_month = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    storage.write_collection("donations", make_history(months, per_month))
+    since = date.today().replace(day=1)
+    print(f"{months} months x {per_month:,} donations")
+
+    timed("full scan, latest 5", lambda: sorted(storage.read_collection("donations"),
+                                                key=lambda d: d['timestamp'], reverse=True)[:5])
+    timed("partitions, latest 5", lambda: blood_management.get_recent_donations(5))
+    timed("full scan, one donor this month", lambda: [
+        d for d in storage.read_collection("donations") if d['donor'] == "donor7" and d['date'] >= since.isoformat()])
+    timed("partitions, one donor this month", lambda: blood_management.get_donor_donations("donor7", since))
+    timed("rollup by group, all open", blood_management.get_donations_by_blood_group)
+
+    sealed = blood_management.seal_history()
+    print(f"  sealed {len(sealed['donations'])} months")
+    timed("rollup by group, old months sealed", blood_management.get_donations_by_blood_group)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark rendering one page of a donor's pending requests as the backlog grows.
+
+Run from the repository root:
+
+    python benchmarks/bench_pending_page.py [backlog sizes...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench_pending_page_"))
+
+import storage
+import request_queue
+import request_management
+from ids import new_id
+
+def add_requests(count, seed=42):
+    rng = random.Random(seed)
+    today = date.today()
+    with storage.transaction("requests", request_queue.QUEUE_LOG) as uow:
+        for _ in range(count):
+            request = {
+                'id': new_id('request'),
+                'requester': f"user{rng.randrange(500)}",
+                'blood_group': rng.choice(["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]),
+                'quantity': 350,
+                'urgency': rng.choice(["Critical", "High", "Medium", "Low"]),
+                'required_date': (today + timedelta(days=rng.randint(1, 60))).isoformat(),
+                'reason': "surgery",
+                'contact_info': "+911234567890",
+                'date': today.isoformat(),
+                'status': 'pending',
+                'version': 1
+            }
+            uow.get(storage.partition_of("requests", request['id'])).append(request)
+            request_queue.enqueue(uow, request)
+
+def timed(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    storage.write_collection("users", [{'username': "donor", 'user_type': "donor", 'blood_group': "O-"}])
+    added = 0
+    for size in sizes:
+        add_requests(size - added, seed=size)
+        added = size
+        # The first call after a commit re-reads the changed partition
+        request_management.get_pending_requests_page("donor")
+        result, elapsed = timed(lambda: request_management.get_pending_requests_page("donor"))
+        _, filtered = timed(lambda: request_management.get_pending_requests_page("donor", page=3, urgencies=["Critical"]))
+        print(f"  {size:7,d} pending: page 1 {elapsed * 1000:6.2f} ms, critical page 3 {filtered * 1000:6.2f} ms "
+              f"({result['total']:,} matching)")
+
+if __name__ == "__main__":
+    main()
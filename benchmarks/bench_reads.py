@@ -0,0 +1,68 @@
+"""Benchmark collection reads while a writer keeps the collection busy.
+
+Compares the old locked read with the lock-free read_collection and the
+cached read_snapshot, in a throwaway data directory. Run from the
+repository root:
+
+    python benchmarks/bench_reads.py [num_records] [seconds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench_reads_"))
+
+import storage
+
+# A plain (unpartitioned) collection shaped like requests
+COLLECTION = "bench_requests"
+
+# How long each write transaction holds the collection lock
+WRITE_HOLD_SECONDS = 0.02
+
+def locked_read(name):
+    with storage.read_lock(name):
+        return storage._read_file(name)
+
+def writer(stop, num_records):
+    i = 0
+    while not stop.is_set():
+        with storage.transaction(COLLECTION) as uow:
+            requests = uow.get(COLLECTION)
+            requests[i % num_records]['quantity'] += 1
+            time.sleep(WRITE_HOLD_SECONDS)
+        i += 1
+
+def measure(read, seconds):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        read(COLLECTION)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return len(latencies), latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+def main():
+    num_records = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    storage.write_collection(COLLECTION, [
+        {'id': f"REQ_{i}", 'blood_group': "O+", 'quantity': 350, 'status': 'pending'} for i in range(num_records)
+    ])
+
+    stop = threading.Event()
+    thread = threading.Thread(target=writer, args=(stop, num_records), daemon=True)
+    thread.start()
+    print(f"{num_records:,} records, writer holding the lock {WRITE_HOLD_SECONDS * 1000:.0f} ms per commit")
+    for label, read in (("locked read", locked_read), ("read_collection", storage.read_collection),
+                        ("read_snapshot", storage.read_snapshot)):
+        reads, p50, p99 = measure(read, seconds)
+        print(f"  {label:16s} {reads / seconds:10,.0f} reads/s  p50 {p50 * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms")
+    stop.set()
+    thread.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark slotted request records against the stored dicts.
+
+Run from the repository root:
+
+    python benchmarks/bench_records.py [num_requests]
+"""
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import Request, from_storage, to_storage
+
+def make_requests(num_requests, seed=42):
+    rng = random.Random(seed)
+    return [
+        {
+            'id': f"REQ_{i:022d}",
+            'requester': f"user{rng.randrange(500)}",
+            'blood_group': rng.choice(["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]),
+            'quantity': rng.choice([350, 450]),
+            'urgency': rng.choice(["Critical", "High", "Medium", "Low"]),
+            'required_date': f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'reason': "surgery",
+            'contact_info': "+911234567890",
+            'lat': None,
+            'lng': None,
+            'date': "2026-01-01T10:00:00",
+            'status': rng.choice(["pending", "fulfilled", "expired"]),
+            'version': 1
+        }
+        for i in range(num_requests)
+    ]
+
+def measure(build):
+    """Return (result, bytes still allocated, best seconds) for building the records"""
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        build()
+        best = min(best, time.perf_counter() - started)
+    # Timed without tracing, which slows allocation down several times
+    tracemalloc.start()
+    result = build()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, allocated, best
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    # Parse as storage does, so each dict gets its own keys and strings
+    text = json.dumps(make_requests(num_requests))
+
+    dicts, dict_bytes, dict_elapsed = measure(lambda: json.loads(text))
+    records, record_bytes, record_elapsed = measure(lambda: from_storage(Request, json.loads(text)))
+    assert to_storage(records) == dicts
+
+    started = time.perf_counter()
+    to_storage(records)
+    back_elapsed = time.perf_counter() - started
+
+    print(f"{num_requests:,} requests")
+    print(f"  dicts    {dict_bytes / num_requests:6.0f} B/record   load {dict_elapsed * 1000:7.1f} ms")
+    print(f"  records  {record_bytes / num_requests:6.0f} B/record   load {record_elapsed * 1000:7.1f} ms")
+    print(f"  back to dicts {back_elapsed * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
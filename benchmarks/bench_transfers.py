@@ -0,0 +1,55 @@
+"""Benchmark the inter-bank transfer planner on synthetic banks.
+
+Run from the repository root:
+
+    python benchmarks/bench_transfers.py [num_banks]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transfers
+from inventory import BLOOD_GROUPS
+
+def make_banks(num_banks, seed=42):
+    rng = random.Random(seed)
+    banks = [
+        {'name': f"Bank {b}", 'lat': rng.uniform(8, 35), 'lng': rng.uniform(68, 97)}
+        for b in range(num_banks)
+    ]
+    stock_by_bank = {
+        bank['name']: {bg: rng.randint(0, 8) * 350 for bg in BLOOD_GROUPS}
+        for bank in banks
+    }
+    return banks, stock_by_bank
+
+def main():
+    num_banks = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    banks, stock_by_bank = make_banks(num_banks)
+    transfers.read_snapshot = lambda name: banks
+
+    started = time.perf_counter()
+    transfers.get_distance_matrix()
+    matrix_elapsed = time.perf_counter() - started
+
+    banks.append({'name': "Bank new", 'lat': 20.0, 'lng': 80.0})
+    started = time.perf_counter()
+    transfers.get_distance_matrix()
+    extend_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    result = transfers.plan_transfers(stock_by_bank, targets=1400)
+    plan_elapsed = time.perf_counter() - started
+
+    moved = sum(t['quantity'] for t in result['transfers'])
+    distance = sum(t['quantity'] * t['distance_km'] for t in result['transfers']) / max(1, moved)
+    print(f"{num_banks} banks: matrix {matrix_elapsed * 1000:.1f} ms, add one bank {extend_elapsed * 1000:.2f} ms, "
+          f"plan {plan_elapsed * 1000:.1f} ms")
+    print(f"  {len(result['transfers'])} transfers, {moved:,} ml moved, {distance:.0f} km average, "
+          f"{sum(result['shortfall'].values()):,} ml still short")
+
+if __name__ == "__main__":
+    main()
@@ -1,157 +1,212 @@
-import json
 import streamlit as st
-import os
 from datetime import datetime
+from ids import new_id
+from storage import (
+    read_collection, write_collection, transaction, group_commit,
+    partition_of, iter_partitions, seal_partitions, StorageError
+)
+from inventory import (
+    UNASSIGNED_BANK, InsufficientStock, get_stock, credit, debit, ensure_shard,
+    ledger_name, maybe_snapshot
+)
+from request_queue import QUEUE_LOG, enqueue, maybe_compact
+from outreach import OUTREACH_LOG, start_outreach
+from eligibility import DONOR_INDEX, check_donation
+from alerts import check_stock_alerts
+from columnar import group_totals, build_table
+from records import Donation, Request, BloodGroup, Urgency, RequestStatus, intern_value, from_storage, to_storage
 
 def load_blood_inventory():
-    """Load blood inventory from JSON file"""
-    try:
-        with open("data/blood_inventory.json", 'r') as f:
-            return json.load(f)
-    except:
-        return {"A+": 0, "A-": 0, "B+": 0, "B-": 0, "AB+": 0, "AB-": 0, "O+": 0, "O-": 0}
-
-def save_blood_inventory(inventory):
-    """Save blood inventory to JSON file"""
-    try:
-        os.makedirs("data", exist_ok=True)
-        with open("data/blood_inventory.json", 'w') as f:
-            json.dump(inventory, f, indent=2)
-        return True
-    except:
-        return False
+    """Load current blood inventory totals from the inventory ledger"""
+    return get_stock()
 
 def load_donations():
     """Load donations from JSON file"""
-    try:
-        with open("data/donations.json", 'r') as f:
-            return json.load(f)
-    except:
-        return []
+    return from_storage(Donation, read_collection("donations"))
 
 def save_donations(donations):
     """Save donations to JSON file"""
     try:
-        os.makedirs("data", exist_ok=True)
-        with open("data/donations.json", 'w') as f:
-            json.dump(donations, f, indent=2)
+        write_collection("donations", to_storage(donations))
         return True
-    except:
+    except (OSError, StorageError):
         return False
 
 def load_requests():
     """Load blood requests from JSON file"""
-    try:
-        with open("data/requests.json", 'r') as f:
-            return json.load(f)
-    except:
-        return []
+    return from_storage(Request, read_collection("requests"))
 
 def save_requests(requests):
     """Save blood requests to JSON file"""
     try:
-        os.makedirs("data", exist_ok=True)
-        with open("data/requests.json", 'w') as f:
-            json.dump(requests, f, indent=2)
+        write_collection("requests", to_storage(requests))
         return True
-    except:
+    except (OSError, StorageError):
         return False
 
 def donate_blood(donor, blood_group, quantity, donation_date, blood_bank, notes=""):
-    """Record a blood donation"""
-    # Load current data
-    donations = load_donations()
-    inventory = load_blood_inventory()
-    
+    """Record a blood donation; refused if the donor is not yet eligible"""
     # Create donation record
-    donation = {
-        'donor': donor,
-        'blood_group': blood_group,
-        'quantity': quantity,
-        'date': donation_date.isoformat(),
-        'blood_bank': blood_bank,
-        'notes': notes,
-        'timestamp': datetime.now().isoformat()
-    }
+    donation = Donation(
+        id=new_id('donation'),
+        donor=donor,
+        blood_group=intern_value(BloodGroup, blood_group),
+        quantity=quantity,
+        date=donation_date.isoformat(),
+        blood_bank=blood_bank,
+        notes=notes,
+        timestamp=datetime.now().isoformat()
+    )
     
-    # Add to donations
-    donations.append(donation)
+    def record(uow):
+        if check_donation(uow, donor, donation_date):
+            return False
+        uow.get(partition_of("donations", donation.id)).append(donation.to_storage())
+        credit(uow, blood_group, blood_bank, quantity, ref=donation.id, collected=donation.date)
+        return True
     
-    # Update inventory
-    inventory[blood_group] = inventory.get(blood_group, 0) + quantity
+    # Eligibility check, donation and inventory credit commit together or not
+    # at all; only this bank's inventory shard is locked, and concurrent
+    # donations share one commit
+    try:
+        ensure_shard(blood_bank)
+        if not group_commit(("donations", DONOR_INDEX, ledger_name(blood_bank)), record):
+            return False
+    except OSError:
+        return False
     
-    # Save both files
-    return save_donations(donations) and save_blood_inventory(inventory)
+    maybe_snapshot(blood_bank)
+    check_stock_alerts(blood_bank)
+    return True
 
-def request_blood(requester, blood_group, quantity, urgency, required_date, reason, contact_info):
-    """Submit a blood request"""
-    requests = load_requests()
-    
+def request_blood(requester, blood_group, quantity, urgency, required_date, reason, contact_info, lat=None, lng=None):
+    """Submit a blood request, optionally with the coordinates it is needed at"""
     # Create request record with unique ID
-    request = {
-        'id': generate_request_id(),
-        'requester': requester,
-        'blood_group': blood_group,
-        'quantity': quantity,
-        'urgency': urgency,
-        'required_date': required_date.isoformat(),
-        'reason': reason,
-        'contact_info': contact_info,
-        'date': datetime.now().isoformat(),
-        'status': 'pending'
-    }
+    request = Request(
+        id=generate_request_id(),
+        requester=requester,
+        blood_group=intern_value(BloodGroup, blood_group),
+        quantity=quantity,
+        urgency=intern_value(Urgency, urgency),
+        required_date=required_date.isoformat(),
+        reason=reason,
+        contact_info=contact_info,
+        lat=lat,
+        lng=lng,
+        date=datetime.now().isoformat(),
+        status=RequestStatus.PENDING,
+        version=1
+    )
+    stored = request.to_storage()
     
-    requests.append(request)
+    def record(uow):
+        uow.get(partition_of("requests", request.id)).append(stored)
+        enqueue(uow, stored)
+        start_outreach(uow, stored)
     
-    if save_requests(requests):
+    try:
+        # The request, its queue entry and its donor outreach commit together,
+        # in one commit with any concurrent requests
+        group_commit(("requests", QUEUE_LOG, OUTREACH_LOG), record)
+        maybe_compact()
         return {
             'success': True,
-            'request_id': request['id'],
+            'request_id': request.id,
             'message': 'Blood request submitted successfully'
         }
+    except OSError:
+        return {'success': False, 'error': 'Failed to save request'}
+
+def adjust_blood_inventory(blood_group, delta, blood_bank=UNASSIGNED_BANK, reason="adjustment"):
+    """Add (or with a negative delta, remove) stock for one blood group"""
+    try:
+        ensure_shard(blood_bank)
+        with transaction(ledger_name(blood_bank)) as uow:
+            if delta >= 0:
+                credit(uow, blood_group, blood_bank, delta, reason=reason)
+            else:
+                debit(uow, blood_group, blood_bank, -delta, reason=reason)
+    except (OSError, InsufficientStock):
+        return False
     
-    return {'success': False, 'error': 'Failed to save request'}
+    maybe_snapshot(blood_bank)
+    check_stock_alerts(blood_bank)
+    return True
 
 def generate_request_id():
     """Generate a unique request ID"""
-    import time
-    return f"REQ_{int(time.time() * 1000)}"
+    return new_id('request')
 
 def get_blood_inventory():
     """Get current blood inventory"""
     return load_blood_inventory()
 
-def get_total_donations():
-    """Get total blood donations"""
-    donations = load_donations()
-    return sum(donation['quantity'] for donation in donations)
+def get_total_donations(since=None, until=None):
+    """Get total blood donations, optionally for the months from ``since`` to ``until``"""
+    return sum(get_donations_by_blood_group(since, until).values())
 
-def get_total_requests():
-    """Get total blood requests"""
-    requests = load_requests()
-    return sum(request['quantity'] for request in requests)
+def get_total_requests(since=None, until=None):
+    """Get total blood requests, optionally for the months from ``since`` to ``until``"""
+    return sum(get_requests_by_blood_group(since, until).values())
 
-def get_donations_by_blood_group():
+def get_donations_by_blood_group(since=None, until=None):
     """Get donations grouped by blood group"""
-    donations = load_donations()
-    blood_groups = {}
-    
-    for donation in donations:
-        bg = donation['blood_group']
-        blood_groups[bg] = blood_groups.get(bg, 0) + donation['quantity']
-    
-    return blood_groups
+    return group_totals("donations", 'blood_group', since=since, until=until)
 
-def get_requests_by_blood_group():
+def get_requests_by_blood_group(since=None, until=None):
     """Get requests grouped by blood group"""
-    requests = load_requests()
-    blood_groups = {}
-    
-    for request in requests:
-        bg = request['blood_group']
-        blood_groups[bg] = blood_groups.get(bg, 0) + request['quantity']
-    
-    return blood_groups
+    return group_totals("requests", 'blood_group', since=since, until=until)
+
+def _recent(name, record_type, sort_field, limit):
+    """Get the newest records of a partitioned collection, opening months newest first"""
+    recent = []
+    for _, records in iter_partitions(name, newest_first=True):
+        recent.extend(records)
+        if len(recent) >= limit:
+            break
+    # Only the records returned are converted
+    recent = sorted(recent, key=lambda r: r.get(sort_field) or '', reverse=True)[:limit]
+    return from_storage(record_type, recent)
+
+def get_recent_donations(limit=5):
+    """Get the latest donations recorded"""
+    return _recent("donations", Donation, 'timestamp', limit)
+
+def get_recent_requests(limit=5):
+    """Get the latest blood requests submitted"""
+    return _recent("requests", Request, 'date', limit)
+
+def get_donor_donations(donor, since=None):
+    """Get a donor's donations, optionally only those dated on or after ``since``"""
+    cutoff = since.isoformat()[:10] if since is not None else ''
+    return [
+        Donation.from_storage(d)
+        for _, records in iter_partitions("donations", since=since) for d in records
+        if d['donor'] == donor and d['date'][:10] >= cutoff
+    ]
+
+def get_requester_requests(requester, since=None):
+    """Get a requester's blood requests, optionally only those submitted on or after ``since``"""
+    cutoff = since.isoformat()[:10] if since is not None else ''
+    return [
+        Request.from_storage(r)
+        for _, records in iter_partitions("requests", since=since) for r in records
+        if r['requester'] == requester and r['date'][:10] >= cutoff
+    ]
+
+def seal_history(before=None):
+    """Seal donation and request months older than SEAL_AFTER_MONTHS; months with pending requests stay open"""
+    sealed = {
+        'donations': seal_partitions("donations", before),
+        'requests': seal_partitions("requests", before,
+                                    can_seal=lambda records: all(r['status'] != 'pending' for r in records))
+    }
+    # Columns of a sealed month never change, so analytics can map them from
+    # now on; a month sealed before may have been opened again since
+    for name, months in sealed.items():
+        for month in months:
+            build_table(name, month, rebuild=True)
+    return sealed
 
 def check_blood_compatibility(donor_group, recipient_group):
     """Check if donor blood is compatible with recipient"""
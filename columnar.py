@@ -0,0 +1,210 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from storage import DATA_DIR, list_partitions, read_collection, read_snapshot, partition_name
+
+# Analytics read donations and requests as columns instead of dicts: one
+# array per field, with text fields dictionary-encoded as int32 codes into a
+# per-partition vocabulary. Sealed partitions never change, so their
+# columns are saved once as .npy files and memory-mapped; open partitions
+# are encoded in memory, once per committed version.
+COLUMNS_DIR = os.path.join(DATA_DIR, "_columns")
+
+CATEGORY = 'category'
+DAY = 'day'  # int32 days since 1970-01-01
+
+MISSING_CODE = -1
+MISSING_DAY = np.iinfo(np.int32).min
+
+SCHEMAS = {
+    'donations': {
+        'blood_group': CATEGORY, 'blood_bank': CATEGORY, 'donor': CATEGORY,
+        'quantity': np.int32, 'date': DAY
+    },
+    'requests': {
+        'blood_group': CATEGORY, 'urgency': CATEGORY, 'status': CATEGORY,
+        'fulfilled_from': CATEGORY, 'requester': CATEGORY,
+        'quantity': np.int32, 'date': DAY, 'required_date': DAY
+    },
+}
+
+def _encode(values, kind):
+    """Encode one field's values; returns (array, vocabulary or None)"""
+    series = pd.Series(values, dtype=object)
+    if kind == CATEGORY:
+        codes, uniques = pd.factorize(series, sort=True)
+        return codes.astype(np.int32), [str(value) for value in uniques]
+    if kind == DAY:
+        days = pd.to_datetime(series.astype(str).str[:10], format="%Y-%m-%d", errors='coerce')
+        numbers = days.to_numpy(dtype='datetime64[D]').astype(np.int64)
+        return np.where(days.isna().to_numpy(), MISSING_DAY, numbers).astype(np.int32), None
+    return pd.to_numeric(series, errors='coerce').fillna(0).to_numpy(dtype=kind), None
+
+class ColumnTable:
+    """Records of one collection as columns: numbers and days as arrays, text as codes"""
+
+    def __init__(self, columns, categories, length):
+        self.columns = columns
+        self.categories = categories
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    @classmethod
+    def from_records(cls, records, schema):
+        columns, categories = {}, {}
+        for field, kind in schema.items():
+            columns[field], vocabulary = _encode([record.get(field) for record in records], kind)
+            if vocabulary is not None:
+                categories[field] = vocabulary
+        return cls(columns, categories, len(records))
+
+    @classmethod
+    def concat(cls, tables):
+        """Join tables, re-coding each text column onto their combined vocabulary"""
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return None
+        columns, categories = {}, {}
+        for field in tables[0].columns:
+            if field not in tables[0].categories:
+                columns[field] = np.concatenate([table.columns[field] for table in tables])
+                continue
+            vocabulary = sorted({value for table in tables for value in table.categories[field]})
+            position = {value: i for i, value in enumerate(vocabulary)}
+            parts = []
+            for table in tables:
+                # One extra slot maps the missing code (-1) to itself
+                recode = np.array([position[v] for v in table.categories[field]] + [MISSING_CODE], dtype=np.int32)
+                parts.append(recode[table.columns[field]])
+            columns[field] = np.concatenate(parts)
+            categories[field] = vocabulary
+        return cls(columns, categories, sum(len(table) for table in tables))
+
+    def mask(self, **filters):
+        """Get a boolean row mask for text columns equal to a value (or any of a list of values)"""
+        keep = np.ones(self.length, dtype=bool)
+        for field, wanted in filters.items():
+            wanted = {wanted} if isinstance(wanted, str) else set(wanted)
+            codes = [i for i, value in enumerate(self.categories[field]) if value in wanted]
+            keep &= np.isin(self.columns[field], codes)
+        return keep
+
+    def sum_by(self, by, value='quantity', mask=None):
+        """Sum a numeric column per value of a text column; rows missing ``by`` are left out"""
+        codes = self.columns[by]
+        weights = self.columns[value] if value is not None else None
+        keep = codes >= 0 if mask is None else mask & (codes >= 0)
+        totals = np.bincount(codes[keep], weights=None if weights is None else weights[keep],
+                             minlength=len(self.categories[by]))
+        return {label: total for label, total in zip(self.categories[by], totals.tolist()) if total}
+
+    def labels(self, field):
+        """Decode a text column to an object array (None where missing)"""
+        vocabulary = np.array(self.categories[field] + [None], dtype=object)
+        return vocabulary[self.columns[field]]
+
+    def days(self, field):
+        """Get a day column as datetime64[D] (NaT where missing)"""
+        days = self.columns[field].astype('datetime64[D]')
+        days[self.columns[field] == MISSING_DAY] = np.datetime64('NaT')
+        return days
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def save(self, path):
+        """Write the table to a new directory, atomically"""
+        parent = os.path.dirname(path) or "."
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=parent, prefix=f".{os.path.basename(path)}.")
+        try:
+            for field, column in self.columns.items():
+                np.save(os.path.join(tmp_path, f"{field}.npy"), np.ascontiguousarray(column))
+            with open(os.path.join(tmp_path, "categories.json"), 'w') as f:
+                json.dump({'length': self.length, 'categories': self.categories}, f)
+            # mkdtemp makes the directory private; match the one it sits in
+            os.chmod(tmp_path, os.stat(parent).st_mode & 0o777)
+            os.replace(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise  # otherwise another process saved it first
+
+    @classmethod
+    def load(cls, path, schema):
+        """Memory-map a saved table"""
+        with open(os.path.join(path, "categories.json"), 'r') as f:
+            meta = json.load(f)
+        columns = {field: np.load(os.path.join(path, f"{field}.npy"), mmap_mode='r') for field in schema}
+        return cls(columns, meta['categories'], meta['length'])
+
+def table_path(name, month):
+    """Get the directory holding a sealed partition's columns"""
+    return os.path.join(COLUMNS_DIR, name, month)
+
+# Sealed tables are memory-mapped; open ones are keyed on the partition
+# snapshot they were encoded from, so a commit simply makes them stale
+_tables = {}
+_tables_guard = threading.Lock()
+
+def build_table(name, month, rebuild=False):
+    """Encode a sealed partition and save its columns; returns the memory-mapped table.
+
+    ``rebuild`` encodes it again even if saved before, for months sealed
+    anew after being opened again.
+    """
+    path = table_path(name, month)
+    if rebuild and os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    if not os.path.isdir(path):
+        # A private read: a sealed month's dicts are not kept in the snapshot cache
+        ColumnTable.from_records(read_collection(partition_name(name, month)), SCHEMAS[name]).save(path)
+    return ColumnTable.load(path, SCHEMAS[name])
+
+def partition_table(name, month, sealed=False):
+    """Get one partition of a collection as a ColumnTable"""
+    key = (name, month)
+    with _tables_guard:
+        cached = _tables.get(key)
+    if sealed:
+        if cached is None or cached[0] is not None:
+            cached = (None, build_table(name, month))
+    else:
+        records = read_snapshot(partition_name(name, month))
+        if cached is None or cached[0] is not records:
+            cached = (records, ColumnTable.from_records(records, SCHEMAS[name]))
+    with _tables_guard:
+        _tables[key] = cached
+    return cached[1]
+
+def iter_tables(name, since=None, until=None):
+    """Yield ``(month, table)`` for every partition from ``since`` to ``until``"""
+    sealed = set(list_partitions(name, since, until, sealed=True))
+    for month in list_partitions(name, since, until):
+        yield month, partition_table(name, month, month in sealed)
+
+def read_table(name, since=None, until=None):
+    """Get the partitions from ``since`` to ``until`` as one ColumnTable (None if empty)"""
+    return ColumnTable.concat([table for _, table in iter_tables(name, since, until)])
+
+def group_totals(name, by, value='quantity', since=None, until=None, **filters):
+    """Sum ``value`` (or count rows, if None) per value of ``by`` across partitions.
+
+    ``filters`` keep rows whose text columns match, e.g. status='pending'.
+    Each partition is reduced on its own, so no combined table is built.
+    """
+    totals = {}
+    for _, table in iter_tables(name, since, until):
+        if not len(table):
+            continue
+        mask = table.mask(**filters) if filters else None
+        for label, total in table.sum_by(by, value, mask).items():
+            totals[label] = totals.get(label, 0) + total
+    return {label: int(total) for label, total in totals.items()}
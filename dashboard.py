@@ -6,9 +6,12 @@ from datetime import datetime, timedelta
 from blood_management import (
     get_blood_inventory, get_total_donations, get_total_requests,
     get_donations_by_blood_group, get_requests_by_blood_group,
-    load_donations, load_requests
+    get_recent_donations, get_recent_requests
 )
 from auth import get_total_users, get_users_by_type, change_password
+from alerts import get_rules, get_rule, stock_level, get_active_alerts
+
+LEVEL_ICONS = {'ok': "🟢", 'low': "🟡", 'critical': "🔴"}
 
 def show_dashboard():
     """Display the main dashboard with analytics"""
@@ -62,9 +65,16 @@ def show_dashboard():
     with col2:
         # Inventory details
         st.markdown("**Inventory Details:**")
+        rules = get_rules()
         for blood_group, quantity in inventory.items():
-            status = "🟢" if quantity > 1000 else "🟡" if quantity > 500 else "🔴"
+            status = LEVEL_ICONS[stock_level(quantity, get_rule(rules, None, blood_group))]
             st.write(f"{status} **{blood_group}**: {quantity:,} ml")
+        
+        alerts = get_active_alerts()
+        if alerts:
+            st.markdown("**Low Stock Alerts:**")
+            for alert in alerts:
+                st.write(f"{LEVEL_ICONS[alert['level']]} {alert['blood_group']} at {alert['blood_bank']}")
     
     st.markdown("---")
     
@@ -108,34 +118,29 @@ def show_dashboard():
     
     with col1:
         st.markdown("**Recent Donations**")
-        donations = load_donations()
-        if donations:
-            # Sort by date and get last 5
-            recent_donations = sorted(donations, key=lambda x: x['timestamp'], reverse=True)[:5]
-            
+        # Only the latest month partitions are opened
+        recent_donations = get_recent_donations(5)
+        if recent_donations:
             for donation in recent_donations:
-                date = datetime.fromisoformat(donation['timestamp']).strftime("%Y-%m-%d %H:%M")
-                st.write(f"• {donation['donor']} donated {donation['quantity']}ml of {donation['blood_group']} on {date}")
+                date = datetime.fromisoformat(donation.timestamp).strftime("%Y-%m-%d %H:%M")
+                st.write(f"• {donation.donor} donated {donation.quantity}ml of {donation.blood_group} on {date}")
         else:
             st.info("No recent donations.")
     
     with col2:
         st.markdown("**Recent Requests**")
-        requests = load_requests()
-        if requests:
-            # Sort by date and get last 5
-            recent_requests = sorted(requests, key=lambda x: x['date'], reverse=True)[:5]
-            
+        recent_requests = get_recent_requests(5)
+        if recent_requests:
             for request in recent_requests:
-                date = datetime.fromisoformat(request['date']).strftime("%Y-%m-%d %H:%M")
+                date = datetime.fromisoformat(request.date).strftime("%Y-%m-%d %H:%M")
                 urgency_color = {
                     'Low': '🟢',
                     'Medium': '🟡', 
                     'High': '🟠',
                     'Critical': '🔴'
                 }
-                urgency_icon = urgency_color.get(request['urgency'], '⚪')
-                st.write(f"{urgency_icon} {request['requester']} requested {request['quantity']}ml of {request['blood_group']} on {date}")
+                urgency_icon = urgency_color.get(request.urgency, '⚪')
+                st.write(f"{urgency_icon} {request.requester} requested {request.quantity}ml of {request.blood_group} on {date}")
         else:
             st.info("No recent requests.")
     
@@ -0,0 +1,145 @@
+import heapq
+import math
+import threading
+from storage import read_snapshot, get_change_seq, read_changes, FeedTruncated
+from blood_management import get_compatible_donors
+from eligibility import filter_eligible
+from maps import get_distance_between_points
+
+# Donors with coordinates are bucketed per blood group into a grid of
+# CELL_DEGREES x CELL_DEGREES cells (about 55 km north-south). A query scans
+# rings of cells outward from the request and stops once no unscanned cell
+# can hold a closer donor than the k found so far.
+CELL_DEGREES = 0.5
+KM_PER_DEGREE = 111.19
+
+def _cell(lat, lng):
+    return (math.floor(lat / CELL_DEGREES), math.floor(lng / CELL_DEGREES))
+
+class DonorGrid:
+    """Grid of located donors per blood group"""
+
+    def __init__(self, users):
+        self.cells = {}
+        self.bounds = {}
+        self.located = {}  # username -> (group, cell)
+        for user in users:
+            self.add(user)
+
+    def add(self, user):
+        """Place a user in the grid if they are a donor with a location"""
+        if user.get('user_type') != 'donor' or user.get('lat') is None or user.get('lng') is None:
+            return
+        group = user.get('blood_group')
+        cell = _cell(user['lat'], user['lng'])
+        self.cells.setdefault(group, {}).setdefault(cell, []).append(
+            (user['username'], user['lat'], user['lng'])
+        )
+        self.located[user['username']] = (group, cell)
+        # Bounds only ever grow; a stale bound just means an extra empty ring
+        low, high = self.bounds.get(group, (cell, cell))
+        self.bounds[group] = (
+            (min(low[0], cell[0]), min(low[1], cell[1])),
+            (max(high[0], cell[0]), max(high[1], cell[1]))
+        )
+
+    def remove(self, username):
+        """Take a user out of the grid, if present"""
+        if username not in self.located:
+            return
+        group, cell = self.located.pop(username)
+        donors = self.cells[group][cell]
+        donors[:] = [donor for donor in donors if donor[0] != username]
+
+    def _ring(self, group, center, radius):
+        """Yield the donors in cells exactly ``radius`` cells from center"""
+        cells = self.cells.get(group, {})
+        row, col = center
+        for dr in range(-radius, radius + 1):
+            edge = abs(dr) == radius
+            for dc in (range(-radius, radius + 1) if edge else (-radius, radius)):
+                yield from cells.get((row + dr, col + dc), ())
+
+    def _max_radius(self, groups, center):
+        radius = 0
+        for group in groups:
+            if group in self.bounds:
+                (low_r, low_c), (high_r, high_c) = self.bounds[group]
+                radius = max(radius, abs(center[0] - low_r), abs(center[0] - high_r),
+                             abs(center[1] - low_c), abs(center[1] - high_c))
+        return radius
+
+    def nearest(self, groups, lat, lng, k, max_km=None, accept=None):
+        """Get up to k (distance_km, username) of donors in groups, nearest first.
+
+        ``accept`` filters a batch of candidate usernames (e.g. to eligible
+        donors) and returns those to keep.
+        """
+        center = _cell(lat, lng)
+        last_radius = self._max_radius(groups, center)
+        best = []  # max-heap of the k nearest as (-distance, username)
+        radius = 0
+        while radius <= last_radius:
+            candidates = [donor for group in groups for donor in self._ring(group, center, radius)]
+            if accept is not None and candidates:
+                kept = set(accept([username for username, _, _ in candidates]))
+                candidates = [donor for donor in candidates if donor[0] in kept]
+            for username, donor_lat, donor_lng in candidates:
+                distance = get_distance_between_points(lat, lng, donor_lat, donor_lng)
+                if max_km is not None and distance > max_km:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, username))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, username))
+
+            # Anything beyond this ring is at least ``radius`` whole cells away
+            # in latitude or longitude; longitude cells shrink toward the poles
+            widest_lat = min(89.0, abs(lat) + (radius + 1) * CELL_DEGREES)
+            reach_km = radius * CELL_DEGREES * KM_PER_DEGREE * math.cos(math.radians(widest_lat))
+            if len(best) == k and -best[0][0] <= reach_km:
+                break
+            if max_km is not None and reach_km > max_km:
+                break
+            radius += 1
+        return sorted((-negative, username) for negative, username in best)
+
+_grid_cache = {'seq': None, 'grid': None}
+_grid_lock = threading.Lock()
+
+def get_donor_grid():
+    """Get the donor grid, moving only the users changed since it was last read"""
+    seq = get_change_seq("users")
+    with _grid_lock:
+        grid = _grid_cache['grid']
+        if grid is None or _grid_cache['seq'] > seq:
+            _grid_cache.update(seq=seq, grid=DonorGrid(read_snapshot("users")))
+        elif _grid_cache['seq'] < seq:
+            changed = set()
+            try:
+                for change in read_changes("users", _grid_cache['seq']):
+                    changed.update(change['changed'])
+                    changed.update(change['removed'])
+            except FeedTruncated:
+                # Too far behind the compacted feed; start over
+                _grid_cache.update(seq=seq, grid=DonorGrid(read_snapshot("users")))
+                return _grid_cache['grid']
+            for username in changed:
+                grid.remove(username)
+            for user in read_snapshot("users"):
+                if user.get('username') in changed:
+                    grid.add(user)
+            _grid_cache['seq'] = seq
+        return _grid_cache['grid']
+
+def find_nearest_donors(blood_group, lat, lng, k=10, max_km=None, eligible_only=True):
+    """Find the k nearest donors whose blood a blood_group patient can receive.
+
+    Returns [{'username', 'distance_km'}], nearest first. Donors without a
+    location are never returned; with ``eligible_only`` neither are donors
+    still inside their donation interval or deferral.
+    """
+    grid = get_donor_grid()
+    accept = filter_eligible if eligible_only else None
+    nearest = grid.nearest(get_compatible_donors(blood_group), lat, lng, k, max_km, accept)
+    return [{'username': username, 'distance_km': round(distance, 2)} for distance, username in nearest]
@@ -0,0 +1,124 @@
+from datetime import date, timedelta
+from storage import read_collection, read_snapshot, transaction
+
+# Whole blood donors must wait this long between donations
+DONATION_INTERVAL_DAYS = 56
+
+# Per-donor index of last donation date, any explicit deferral and the
+# resulting first eligible date, updated in the same transaction as each
+# donation so eligibility never needs a scan of donations.json
+DONOR_INDEX = "donor_eligibility"
+
+def _empty_index():
+    return {'donors': {}, 'built': False}
+
+def _entry_eligible_from(entry):
+    dates = []
+    if entry.get('last_donation'):
+        last = date.fromisoformat(entry['last_donation'][:10])
+        dates.append((last + timedelta(days=DONATION_INTERVAL_DAYS)).isoformat())
+    if entry.get('deferred_until'):
+        dates.append(entry['deferred_until'])
+    return max(dates) if dates else None
+
+def _record(index, donor, donation_date):
+    entry = index['donors'].setdefault(donor, {})
+    if not entry.get('last_donation') or donation_date > entry['last_donation']:
+        entry['last_donation'] = donation_date
+    entry['eligible_from'] = _entry_eligible_from(entry)
+
+def _build(index, donations):
+    for donation in donations:
+        _record(index, donation['donor'], donation['date'][:10])
+    index['built'] = True
+
+_built = False
+
+def _ensure_index():
+    """Build the index from donations.json the first time it is used"""
+    global _built
+    if _built or (read_snapshot(DONOR_INDEX) or _empty_index()).get('built'):
+        _built = True
+        return
+    with transaction("donations", DONOR_INDEX) as uow:
+        index = uow.get(DONOR_INDEX) or _empty_index()
+        if index.get('built'):
+            uow.discard()  # another process built it first
+        else:
+            _build(index, read_collection("donations"))
+            uow.set(DONOR_INDEX, index)
+    _built = True
+
+def _conflict(entry, donation_date):
+    """Get the date a donation on donation_date would have to wait for, or None"""
+    if entry.get('deferred_until') and donation_date < entry['deferred_until']:
+        return entry['deferred_until']
+    if entry.get('last_donation'):
+        last = date.fromisoformat(entry['last_donation'][:10])
+        gap = abs((date.fromisoformat(donation_date) - last).days)
+        if gap < DONATION_INTERVAL_DAYS:
+            return (last + timedelta(days=DONATION_INTERVAL_DAYS)).isoformat()
+    return None
+
+def check_donation(uow, donor, donation_date):
+    """Check and record a donation inside the caller's unit of work.
+
+    The transaction must include "donations" and DONOR_INDEX, and the call
+    must come before the new donation is appended. Returns None if the donor
+    may donate on ``donation_date`` (and records it), otherwise the ISO date
+    the donor becomes eligible.
+    """
+    index = uow.get(DONOR_INDEX) or _empty_index()
+    if not index.get('built'):
+        _build(index, read_collection("donations"))
+    day = donation_date.isoformat()[:10]
+    blocked_until = _conflict(index['donors'].get(donor, {}), day)
+    if blocked_until:
+        return blocked_until
+    _record(index, donor, day)
+    uow.set(DONOR_INDEX, index)
+    return None
+
+def get_eligibility(donor, on=None):
+    """Get whether a donor may donate on a date (default today) and when they next can"""
+    _ensure_index()
+    entry = (read_snapshot(DONOR_INDEX) or _empty_index())['donors'].get(donor, {})
+    day = (on or date.today()).isoformat()
+    blocked_until = _conflict(entry, day)
+    return {
+        'eligible': blocked_until is None,
+        'next_eligible_date': blocked_until or day,
+        'last_donation': entry.get('last_donation')
+    }
+
+def is_eligible(donor, on=None):
+    """Check whether a donor may donate on a date (default today)"""
+    return get_eligibility(donor, on)['eligible']
+
+def filter_eligible(donors, on=None):
+    """Keep the donors (usernames or user records) who may donate on a date (default today)"""
+    _ensure_index()
+    entries = (read_snapshot(DONOR_INDEX) or _empty_index())['donors']
+    day = (on or date.today()).isoformat()
+    eligible = []
+    for donor in donors:
+        username = donor['username'] if isinstance(donor, dict) else donor
+        eligible_from = entries.get(username, {}).get('eligible_from')
+        if eligible_from is None or eligible_from <= day:
+            eligible.append(donor)
+    return eligible
+
+def defer_donor(donor, until, reason=""):
+    """Defer a donor until a date, e.g. after a failed screening"""
+    _ensure_index()
+    try:
+        with transaction(DONOR_INDEX) as uow:
+            index = uow.get(DONOR_INDEX) or _empty_index()
+            entry = index['donors'].setdefault(donor, {})
+            entry['deferred_until'] = until.isoformat()
+            entry['deferral_reason'] = reason
+            entry['eligible_from'] = _entry_eligible_from(entry)
+            uow.set(DONOR_INDEX, index)
+        return True
+    except OSError:
+        return False
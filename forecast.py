@@ -0,0 +1,144 @@
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from storage import read_collection, read_partitioned, transaction
+from inventory import get_stock_by_bank
+
+# Daily demand and supply of every (bank, blood group) series are forecast
+# together: history is summed into one series x day matrix, and every model
+# step below is a whole-matrix NumPy operation. The level is a moving
+# average over whole weeks, scaled by each series' day-of-week profile.
+FORECASTS = "forecasts"
+HISTORY_DAYS = 84
+AVERAGE_DAYS = 28
+HORIZON_DAYS = 28
+
+# Series summing every bank; requests not fulfilled from a bank count only here
+ALL_BANKS = "All banks"
+
+def _frame(records, bank_field, day_field):
+    """Get (blood_bank, blood_group, day, quantity) rows from request or donation records"""
+    frame = pd.DataFrame.from_records(records, columns=[bank_field, 'blood_group', day_field, 'quantity'])
+    frame.columns = ['blood_bank', 'blood_group', 'day', 'quantity']
+    frame['day'] = pd.to_datetime(frame['day'].astype(str).str[:10], format="%Y-%m-%d", errors='coerce')
+    frame['quantity'] = pd.to_numeric(frame['quantity'], errors='coerce')
+    frame = frame.dropna(subset=['blood_group', 'day', 'quantity'])
+    # Every row also counts toward its group's all-banks series
+    national = frame.assign(blood_bank=ALL_BANKS)
+    return pd.concat([frame.dropna(subset=['blood_bank']), national], ignore_index=True)
+
+def daily_matrix(frame, series, start, days):
+    """Sum a frame's quantities into a len(series) x days matrix of daily totals.
+
+    ``series`` is a MultiIndex of (blood_bank, blood_group); rows of other
+    series or outside the window are ignored.
+    """
+    row = series.get_indexer(pd.MultiIndex.from_frame(frame[['blood_bank', 'blood_group']]))
+    col = (frame['day'] - pd.Timestamp(start)).dt.days.to_numpy()
+    keep = (row >= 0) & (col >= 0) & (col < days)
+    flat = row[keep] * days + col[keep]
+    totals = np.bincount(flat, weights=frame['quantity'].to_numpy(dtype=float)[keep], minlength=len(series) * days)
+    return totals.reshape(len(series), days)
+
+def seasonal_forecast(history, horizon=HORIZON_DAYS, average_days=AVERAGE_DAYS):
+    """Forecast every row of a series x day history for the next ``horizon`` days.
+
+    History must span whole weeks and end the day before the forecast starts.
+    A row's level is its mean over the last ``average_days``; each weekday is
+    scaled by that weekday's share of the row's whole history. Rows with no
+    history forecast zero.
+    """
+    num_series, days = history.shape
+    weekly = history.reshape(num_series, days // 7, 7).mean(axis=1)
+    overall = weekly.mean(axis=1, keepdims=True)
+    factors = np.divide(weekly, overall, out=np.ones_like(weekly), where=overall > 0)
+    level = history[:, -average_days:].mean(axis=1, keepdims=True)
+    # History ends on a week boundary, so day t ahead falls on weekday slot t % 7
+    return level * factors[:, np.arange(horizon) % 7]
+
+def days_of_cover(stock, demand, supply):
+    """Get the whole days each series' stock lasts under forecast demand and supply.
+
+    Returns a float array; series that never run out within the horizon get
+    ``inf``.
+    """
+    projected = np.asarray(stock, dtype=float)[:, None] + np.cumsum(supply - demand, axis=1)
+    short = projected < 0
+    return np.where(short.any(axis=1), short.argmax(axis=1), np.inf)
+
+def forecast_frame(requests, donations, stock_by_bank, today=None, horizon=HORIZON_DAYS):
+    """Forecast demand, supply and days of cover for every bank x group series.
+
+    Returns a DataFrame with one row per series: mean forecast demand and
+    supply per day, current stock and days of cover, plus the daily
+    forecasts as arrays.
+    """
+    today = today or date.today()
+    start = today - timedelta(days=HISTORY_DAYS)
+    demand = _frame(requests, 'fulfilled_from', 'date')
+    supply = _frame(donations, 'blood_bank', 'date')
+
+    stock = pd.DataFrame(
+        [(bank, bg, quantity) for bank, groups in stock_by_bank.items() for bg, quantity in groups.items()],
+        columns=['blood_bank', 'blood_group', 'stock']
+    )
+    stock = pd.concat([stock, stock.groupby('blood_group', as_index=False)['stock'].sum().assign(blood_bank=ALL_BANKS)])
+    stock = stock.groupby(['blood_bank', 'blood_group'])['stock'].sum()
+    keys = pd.concat([stock.index.to_frame(index=False), demand[['blood_bank', 'blood_group']],
+                      supply[['blood_bank', 'blood_group']]])
+    series = pd.MultiIndex.from_frame(keys.drop_duplicates().sort_values(['blood_bank', 'blood_group']))
+
+    demand_forecast = seasonal_forecast(daily_matrix(demand, series, start, HISTORY_DAYS), horizon)
+    supply_forecast = seasonal_forecast(daily_matrix(supply, series, start, HISTORY_DAYS), horizon)
+    stock = stock.reindex(series, fill_value=0).to_numpy(dtype=float)
+
+    frame = series.to_frame(index=False)
+    frame['demand_per_day'] = demand_forecast.mean(axis=1)
+    frame['supply_per_day'] = supply_forecast.mean(axis=1)
+    frame['stock'] = stock
+    frame['days_of_cover'] = days_of_cover(stock, demand_forecast, supply_forecast)
+    frame['demand'] = list(demand_forecast)
+    frame['supply'] = list(supply_forecast)
+    return frame
+
+def run_forecast(today=None, horizon=HORIZON_DAYS):
+    """Forecast every series from stored history and save the result; returns the series count"""
+    today = today or date.today()
+    # Only the months the history window reaches are read
+    start = today - timedelta(days=HISTORY_DAYS)
+    frame = forecast_frame(read_partitioned("requests", since=start), read_partitioned("donations", since=start),
+                           get_stock_by_bank(), today, horizon)
+    series = [
+        {
+            'blood_bank': row.blood_bank,
+            'blood_group': row.blood_group,
+            'stock': int(row.stock),
+            'demand_per_day': round(float(row.demand_per_day), 1),
+            'supply_per_day': round(float(row.supply_per_day), 1),
+            'days_of_cover': None if np.isinf(row.days_of_cover) else int(row.days_of_cover),
+            'demand': np.round(row.demand, 1).tolist(),
+            'supply': np.round(row.supply, 1).tolist()
+        }
+        for row in frame.itertuples(index=False)
+    ]
+    with transaction(FORECASTS) as uow:
+        uow.set(FORECASTS, {
+            'generated_at': datetime.now().isoformat(),
+            'start': today.isoformat(),
+            'horizon_days': horizon,
+            'series': series
+        })
+    return {'series': len(series)}
+
+def get_forecast(blood_bank=None):
+    """Get the latest saved forecast, optionally for one bank; days_of_cover None means beyond the horizon"""
+    forecast = read_collection(FORECASTS) or {'generated_at': None, 'start': None, 'horizon_days': 0, 'series': []}
+    if blood_bank is not None:
+        forecast = dict(forecast, series=[s for s in forecast['series'] if s['blood_bank'] == blood_bank])
+    return forecast
+
+def get_shortage_risks(within_days=7):
+    """Get the series forecast to run out within ``within_days``, soonest first"""
+    at_risk = [s for s in get_forecast()['series']
+               if s['days_of_cover'] is not None and s['days_of_cover'] < within_days]
+    return sorted(at_risk, key=lambda s: (s['days_of_cover'], s['blood_bank'], s['blood_group']))
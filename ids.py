@@ -0,0 +1,214 @@
+import itertools
+import os
+import socket
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+
+# Snowflake-style layout: milliseconds since EPOCH_MS, then node, then a
+# per-thread worker slot, then that worker's sequence within the millisecond.
+# IDs are zero-padded so their string form sorts by creation time.
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SLOT_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SLOT = (1 << SLOT_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+TIME_SHIFT = NODE_BITS + SLOT_BITS + SEQUENCE_BITS
+ID_DIGITS = 22
+
+ID_PREFIXES = {
+    'request': 'REQ',
+    'response': 'RSP',
+    'donation': 'DON',
+    'notification': 'NTF',
+    'lot': 'LOT',
+}
+
+# Without BLOODBOND_NODE_ID, each process leases a node number through
+# storage, so processes sharing a data directory never mint with the same
+# one. Leasing opens a transaction, so it never happens while the thread
+# has one open: storage leases before a thread's outermost transaction
+# takes its locks, and a background thread renews the lease well before it
+# runs out. A process that slept past its lease moves to a free node if its
+# old one was taken.
+NODE_LEASES = "node_leases"
+NODE_LEASE_SECONDS = 3600
+NODE_RENEW_SECONDS = 600
+NODE_RETRY_SECONDS = 5
+
+def _configured_node_id():
+    """Get the node number set in BLOODBOND_NODE_ID, or None"""
+    configured = os.environ.get("BLOODBOND_NODE_ID")
+    if configured is None:
+        return None
+    node = int(configured)
+    if not 0 <= node <= MAX_NODE:
+        raise ValueError(f"BLOODBOND_NODE_ID must be between 0 and {MAX_NODE}")
+    return node
+
+def _node_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def lease_node_id(current=None, now=None):
+    """Claim a free node number, keeping ``current`` if it is still ours; returns the node"""
+    from storage import transaction  # storage imports this module
+    now = now or datetime.now()
+    owner = _node_owner()
+    with transaction(NODE_LEASES) as uow:
+        leases = uow.get(NODE_LEASES) or {}
+        
+        def free(node):
+            lease = leases.get(str(node))
+            return lease is None or lease['owner'] == owner or lease['lease_until'] <= now.isoformat()
+        
+        if current is None or not free(current):
+            current = next((node for node in range(MAX_NODE + 1) if free(node)), None)
+            if current is None:
+                raise RuntimeError(f"All {MAX_NODE + 1} node numbers are leased")
+        leases[str(current)] = {'owner': owner,
+                                'lease_until': (now + timedelta(seconds=NODE_LEASE_SECONDS)).isoformat()}
+        uow.set(NODE_LEASES, leases)
+    return current
+
+_configured = _configured_node_id()
+_node = {'id': _configured, 'renew_at_ms': float('inf') if _configured is not None else 0,
+         'expires_ms': float('inf') if _configured is not None else 0}
+_node_guard = threading.Lock()
+_leasing = threading.local()
+_renewer = {'thread': None}
+
+def ensure_node_lease():
+    """Lease or renew this process's node number if it is due.
+
+    Call while holding no collection locks; returns the node number.
+    """
+    if _now_ms() < _node['renew_at_ms'] or getattr(_leasing, 'active', False):
+        return _node['id']
+    with _node_guard:
+        now_ms = _now_ms()
+        if now_ms >= _node['renew_at_ms']:
+            _leasing.active = True
+            try:
+                node = lease_node_id(_node['id'])
+            finally:
+                _leasing.active = False
+            _node.update(id=node, renew_at_ms=now_ms + (NODE_LEASE_SECONDS - NODE_RENEW_SECONDS) * 1000,
+                         expires_ms=now_ms + NODE_LEASE_SECONDS * 1000)
+        if _renewer['thread'] is None:
+            _renewer['thread'] = threading.Thread(target=_renew_forever, name="node-lease", daemon=True)
+            _renewer['thread'].start()
+    return _node['id']
+
+def _renew_forever():
+    while True:
+        time.sleep(max(0, _node['renew_at_ms'] - _now_ms()) / 1000)
+        try:
+            ensure_node_lease()
+        except Exception:
+            # Storage is unavailable for now; the lease still has time left
+            time.sleep(NODE_RETRY_SECONDS)
+
+def _forget_node():
+    # A forked child must not keep minting with its parent's node, and has
+    # neither the parent's renewal thread nor its locks
+    global _node_guard
+    _node_guard = threading.Lock()
+    _renewer['thread'] = None
+    if _configured is None:
+        _node.update(id=None, renew_at_ms=0, expires_ms=0)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_node)
+
+def _claim_node():
+    from storage import in_transaction  # storage imports this module
+    if in_transaction():
+        raise RuntimeError("No node lease; one is taken before a thread's first transaction opens")
+    return ensure_node_lease()
+
+# Wall-clock anchor plus the monotonic clock: time never runs backwards inside
+# a process even if the system clock is adjusted
+_START_WALL_MS = int(time.time() * 1000)
+_START_MONO_NS = time.monotonic_ns()
+
+def _now_ms():
+    return _START_WALL_MS + (time.monotonic_ns() - _START_MONO_NS) // 1_000_000
+
+class _SlotState:
+    """Sequence state of one worker slot; only its owning thread touches it"""
+    __slots__ = ('slot', 'last_ms', 'sequence')
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.last_ms = 0
+        self.sequence = 0
+
+class _SlotLease:
+    """Ties a worker slot to the lifetime of the thread holding it"""
+    __slots__ = ('state', '__weakref__')
+
+    def __init__(self, state):
+        self.state = state
+
+# Every thread mints from its own slot, so the hot path shares no state and
+# takes no lock. Slots are handed out and recycled with list.pop/append and
+# itertools.count, which are atomic under the GIL. A recycled slot keeps its
+# last millisecond and sequence, so a new owner can never repeat an ID.
+_free_slots = []
+_slot_counter = itertools.count()
+_local = threading.local()
+
+def _thread_state():
+    lease = getattr(_local, 'lease', None)
+    if lease is None:
+        try:
+            state = _free_slots.pop()
+        except IndexError:
+            slot = next(_slot_counter)
+            if slot > MAX_SLOT:
+                raise RuntimeError(f"More than {MAX_SLOT + 1} threads are minting IDs at once")
+            state = _SlotState(slot)
+        lease = _SlotLease(state)
+        weakref.finalize(lease, _free_slots.append, state)
+        _local.lease = lease
+    return lease.state
+
+def next_id():
+    """Mint a new numeric ID, unique across threads, processes and nodes"""
+    state = _thread_state()
+    now = _now_ms()
+    node = _node['id'] if now < _node['expires_ms'] else _claim_node()
+    if now > state.last_ms:
+        state.last_ms = now
+        state.sequence = 0
+    else:
+        state.sequence += 1
+        if state.sequence > MAX_SEQUENCE:
+            # This thread used up its millisecond; wait for the next one
+            while now <= state.last_ms:
+                now = _now_ms()
+            state.last_ms = now
+            state.sequence = 0
+    return (
+        ((state.last_ms - EPOCH_MS) << TIME_SHIFT)
+        | (node << (SLOT_BITS + SEQUENCE_BITS))
+        | (state.slot << SEQUENCE_BITS)
+        | state.sequence
+    )
+
+def new_id(kind):
+    """Mint a prefixed, time-sortable string ID, e.g. ``REQ_0000...``"""
+    return f"{ID_PREFIXES[kind]}_{next_id():0{ID_DIGITS}d}"
+
+def id_timestamp(record_id, tz=None):
+    """Get the creation time encoded in an ID, in local time or ``tz``.
+
+    Also understands the legacy ``REQ_<millisecond timestamp>`` format.
+    """
+    digits = record_id.rsplit('_', 1)[-1]
+    if len(digits) < ID_DIGITS:
+        return datetime.fromtimestamp(int(digits) / 1000, tz)
+    return datetime.fromtimestamp((EPOCH_MS + (int(digits) >> TIME_SHIFT)) / 1000, tz)
@@ -0,0 +1,452 @@
+import hashlib
+import heapq
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from ids import new_id
+from storage import (
+    read_collection, read_snapshot, transaction, read_log, last_log_seq, collection_path
+)
+
+BLOOD_GROUPS = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
+
+# Inventory is sharded by blood bank. Each shard has its own append-only
+# ledger of stock movements, latest snapshot and snapshot history (for
+# point-in-time reads), each under its own lock, so writes for different
+# banks never contend. The manifest maps bank names to shard folders.
+SHARD_DIR = "inventory"
+SHARD_MANIFEST = f"{SHARD_DIR}/shards"
+SNAPSHOT_EVERY = 500
+
+# Every credit is a lot of units collected together. Red cells keep for
+# SHELF_LIFE_DAYS; debits take the lots that expire first.
+SHELF_LIFE_DAYS = 42
+
+# Unsharded ledger used before per-bank shards existed
+LEGACY_LEDGER = "inventory_ledger"
+
+# Stock recorded before the ledger existed has no bank
+UNASSIGNED_BANK = "Unassigned"
+
+class InsufficientStock(Exception):
+    """Raised when a debit would take a bank's stock below zero"""
+
+def empty_totals():
+    """Get a zeroed quantity for every blood group"""
+    return {bg: 0 for bg in BLOOD_GROUPS}
+
+def shard_slug(blood_bank):
+    """Get the folder name of a bank's shard"""
+    readable = re.sub(r'[^a-z0-9]+', '-', blood_bank.lower()).strip('-')[:40]
+    digest = hashlib.sha1(blood_bank.encode()).hexdigest()[:8]
+    return f"{readable}-{digest}" if readable else digest
+
+def ledger_name(blood_bank):
+    """Get the storage name of a bank's ledger, for use in transactions"""
+    return f"{SHARD_DIR}/{shard_slug(blood_bank)}/ledger"
+
+def _snapshot_name(blood_bank):
+    return f"{SHARD_DIR}/{shard_slug(blood_bank)}/snapshot"
+
+def _history_name(blood_bank):
+    return f"{SHARD_DIR}/{shard_slug(blood_bank)}/snapshots"
+
+def _empty_snapshot():
+    return {'ledger_seq': 0, 'offset': 0, 'ts': None, 'totals': empty_totals(), 'lots': []}
+
+def _apply(totals, event):
+    sign = 1 if event['type'] == 'credit' else -1
+    totals[event['blood_group']] = totals.get(event['blood_group'], 0) + sign * event['quantity']
+
+def expiry_date(collected):
+    """Get the expiry timestamp of units collected at an ISO date or datetime"""
+    return (datetime.fromisoformat(collected) + timedelta(days=SHELF_LIFE_DAYS)).isoformat()
+
+def _read_manifest():
+    return read_snapshot(SHARD_MANIFEST) or {'banks': {}, 'migrated': False}
+
+def list_banks():
+    """Get the names of all banks that have an inventory shard"""
+    migrate_legacy_inventory()
+    return sorted(_read_manifest()['banks'])
+
+_known_banks = set()
+
+def ensure_shard(blood_bank):
+    """Register a bank's shard; only the first write for a new bank touches the manifest"""
+    if blood_bank in _known_banks:
+        return
+    migrate_legacy_inventory()
+    if blood_bank not in _read_manifest()['banks']:
+        with transaction(SHARD_MANIFEST) as uow:
+            manifest = uow.get(SHARD_MANIFEST) or {'banks': {}, 'migrated': False}
+            manifest['banks'][blood_bank] = shard_slug(blood_bank)
+            uow.set(SHARD_MANIFEST, manifest)
+    _known_banks.add(blood_bank)
+
+# Materialized state of each shard in this process, as of byte ``offset`` in
+# its ledger, each behind its own lock. Besides totals, a shard keeps its
+# live lots by id and one min-heap of (expires, lot id) per blood group, so
+# the oldest lots of a group are always at the front. Heap entries of lots
+# used up out of order are dropped lazily once they reach the front.
+_shard_states = {}
+_shard_states_guard = threading.Lock()
+
+def _fresh_state():
+    return {'offset': 0, 'ledger_seq': 0, 'totals': empty_totals(), 'lots': {}, 'expiry': {}}
+
+def _shard_state(blood_bank):
+    with _shard_states_guard:
+        if blood_bank not in _shard_states:
+            _shard_states[blood_bank] = dict(_fresh_state(), lock=threading.Lock())
+        return _shard_states[blood_bank]
+
+def _trim(state, blood_group):
+    heap = state['expiry'].get(blood_group, [])
+    while heap and heap[0][1] not in state['lots']:
+        heapq.heappop(heap)
+
+def _add_lot(state, lot):
+    state['lots'][lot['id']] = lot
+    heapq.heappush(state['expiry'].setdefault(lot['blood_group'], []), (lot['expires'], lot['id']))
+
+def _use_lot(state, lot_id, quantity):
+    lot = state['lots'].get(lot_id)
+    if lot is None:
+        return
+    lot['quantity'] -= quantity
+    if lot['quantity'] <= 0:
+        del state['lots'][lot_id]
+        _trim(state, lot['blood_group'])
+
+def _iter_lots(state, blood_group):
+    """Yield a group's live lots in expiry order; the first k cost O(k log k)"""
+    heap = state['expiry'].get(blood_group, [])
+    frontier = [(heap[0], 0)] if heap else []
+    while frontier:
+        (_, lot_id), i = heapq.heappop(frontier)
+        if lot_id in state['lots']:
+            yield state['lots'][lot_id]
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+
+def _lot_from_credit(event):
+    # Credits written before lots existed become a lot collected when posted
+    lot = event.get('lot') or {}
+    collected = lot.get('collected') or event['ts']
+    result = {
+        'id': lot.get('id') or f"seq-{event['seq']}",
+        'blood_group': event['blood_group'],
+        'quantity': event['quantity'],
+        'collected': collected,
+        'expires': lot.get('expires') or expiry_date(collected)
+    }
+    if lot.get('age_known') is False:
+        result['age_known'] = False  # collected is only a bound
+    return result
+
+def _apply_event(state, event):
+    _apply(state['totals'], event)
+    if event['type'] == 'credit':
+        _add_lot(state, _lot_from_credit(event))
+    elif event.get('lots') is not None:
+        for lot_id, quantity in event['lots']:
+            _use_lot(state, lot_id, quantity)
+    else:
+        # Debits written before lots existed take the oldest lots first
+        remaining = event['quantity']
+        for lot in list(_iter_lots(state, event['blood_group'])):
+            if remaining <= 0:
+                break
+            take = min(remaining, lot['quantity'])
+            _use_lot(state, lot['id'], take)
+            remaining -= take
+
+def _load_snapshot(state, snapshot):
+    state.update(_fresh_state(), offset=snapshot['offset'], ledger_seq=snapshot['ledger_seq'],
+                 totals=dict(snapshot['totals']))
+    lots = snapshot.get('lots')
+    if lots is None:
+        # Snapshots taken before lots existed hold one lot per group
+        collected = snapshot['ts'] or datetime.now().isoformat()
+        lots = [
+            {'id': f"snapshot-{snapshot['ledger_seq']}-{bg}", 'blood_group': bg, 'quantity': quantity,
+             'collected': collected, 'expires': expiry_date(collected)}
+            for bg, quantity in snapshot['totals'].items() if quantity > 0
+        ]
+    for lot in lots:
+        _add_lot(state, dict(lot))
+
+def _sync(blood_bank, state):
+    """Catch a shard's state up with its snapshot and ledger; caller holds state['lock']"""
+    snapshot = read_snapshot(_snapshot_name(blood_bank)) or _empty_snapshot()
+    if state['offset'] < snapshot['offset']:
+        _load_snapshot(state, snapshot)
+    for offset, event in read_log(ledger_name(blood_bank), state['offset']):
+        _apply_event(state, event)
+        state['offset'] = offset
+        state['ledger_seq'] = event['seq']
+
+def _usable_totals(state, now):
+    """Get a shard's totals less the lots that expired but are not yet swept"""
+    totals = dict(state['totals'])
+    for bg in state['expiry']:
+        for lot in _iter_lots(state, bg):
+            if lot['expires'] > now:
+                break
+            totals[bg] = max(totals.get(bg, 0) - lot['quantity'], 0)
+    return totals
+
+def _current_state(blood_bank):
+    """Get a shard's usable totals from its snapshot plus its ledger tail.
+
+    Each call only replays events appended since the previous call, so reads
+    cost O(new events) rather than O(ledger). Lots past their expiry date are
+    left out even before the sweep writes them off, at O(expired lots).
+    """
+    state = _shard_state(blood_bank)
+    with state['lock']:
+        _sync(blood_bank, state)
+        totals = _usable_totals(state, datetime.now().isoformat())
+        return {'offset': state['offset'], 'ledger_seq': state['ledger_seq'], 'totals': totals}
+
+def get_lots(blood_bank, blood_group=None):
+    """Get a bank's live lots, soonest to expire first"""
+    state = _shard_state(blood_bank)
+    with state['lock']:
+        _sync(blood_bank, state)
+        groups = [blood_group] if blood_group else BLOOD_GROUPS
+        return [dict(lot) for bg in groups for lot in _iter_lots(state, bg)]
+
+def get_stock_by_bank():
+    """Get current stock per blood bank and blood group"""
+    return {bank: _current_state(bank)['totals'] for bank in list_banks()}
+
+def get_stock(blood_bank=None):
+    """Get current stock per blood group for one bank, or the national total.
+
+    A single bank's stock reads only that bank's shard. The national view
+    sums the cached per-shard totals.
+    """
+    if blood_bank is not None:
+        return _current_state(blood_bank)['totals']
+
+    national = empty_totals()
+    for groups in get_stock_by_bank().values():
+        for bg, quantity in groups.items():
+            national[bg] = national.get(bg, 0) + quantity
+    return national
+
+def _shard_stock_at(blood_bank, cutoff):
+    # Start from the latest snapshot taken at or before the cutoff
+    start = _empty_snapshot()
+    for _, snapshot in read_log(_history_name(blood_bank)):
+        if snapshot['ts'] > cutoff:
+            break
+        start = snapshot
+
+    totals = dict(start['totals'])
+    for _, event in read_log(ledger_name(blood_bank), start['offset']):
+        if event['ts'] > cutoff:
+            break
+        _apply(totals, event)
+    return totals
+
+def get_stock_at(when, blood_bank=None):
+    """Get stock as it stood at a point in time, for one bank or nationally"""
+    cutoff = when.isoformat()
+    if blood_bank is not None:
+        return _shard_stock_at(blood_bank, cutoff)
+
+    national = empty_totals()
+    for bank in list_banks():
+        for bg, quantity in _shard_stock_at(bank, cutoff).items():
+            national[bg] += quantity
+    return national
+
+def _post(uow, kind, blood_group, blood_bank, quantity, ref=None, reason="", **fields):
+    event = {
+        'type': kind,
+        'blood_group': blood_group,
+        'blood_bank': blood_bank,
+        'quantity': quantity,
+        'ref': ref,
+        'reason': reason,
+        'ts': datetime.now().isoformat()
+    }
+    event.update(fields)
+    return uow.append(ledger_name(blood_bank), event)
+
+def credit(uow, blood_group, blood_bank, quantity, ref=None, reason="donation", collected=None):
+    """Record a lot of stock coming into a bank inside the caller's unit of work.
+
+    ``collected`` is the ISO collection date the lot's expiry counts from
+    (default: now). The transaction must include ``ledger_name(blood_bank)``,
+    and the bank must have been registered with ``ensure_shard`` beforehand.
+    """
+    collected = collected or datetime.now().isoformat()
+    lot = {'id': new_id('lot'), 'collected': collected, 'expires': expiry_date(collected)}
+    return _post(uow, 'credit', blood_group, blood_bank, quantity, ref, reason, lot=lot)
+
+def _plan_lots(uow, blood_group, blood_bank, quantity, now):
+    """Pick unexpired lots to cover quantity, oldest first, counting staged events"""
+    staged_use = {}
+    staged_lots = []
+    for event in uow.staged(ledger_name(blood_bank)):
+        if event['blood_group'] != blood_group:
+            continue
+        if event['type'] == 'credit':
+            staged_lots.append(_lot_from_credit(event))
+        else:
+            for lot_id, used in event.get('lots', []):
+                staged_use[lot_id] = staged_use.get(lot_id, 0) + used
+    staged_lots.sort(key=lambda lot: lot['expires'])
+
+    state = _shard_state(blood_bank)
+    plan = []
+    available = 0
+    with state['lock']:
+        _sync(blood_bank, state)
+        lots = heapq.merge(_iter_lots(state, blood_group), staged_lots, key=lambda lot: lot['expires'])
+        for lot in lots:
+            if available >= quantity:
+                break
+            if lot['expires'] <= now:
+                continue  # left for the expiry sweep
+            usable = lot['quantity'] - staged_use.get(lot['id'], 0)
+            if usable <= 0:
+                continue
+            take = min(usable, quantity - available)
+            plan.append([lot['id'], take])
+            available += take
+    return plan, available
+
+def debit(uow, blood_group, blood_bank, quantity, ref=None, reason="fulfillment"):
+    """Record stock leaving a bank inside the caller's unit of work.
+
+    Units are taken from the unexpired lots that expire first. The caller's
+    transaction holds the bank's ledger, so the lots checked here cannot
+    change before the debit commits.
+    """
+    plan, available = _plan_lots(uow, blood_group, blood_bank, quantity, datetime.now().isoformat())
+    if available < quantity:
+        raise InsufficientStock(
+            f"{blood_bank} has {available} ml of usable {blood_group}, {quantity} ml requested"
+        )
+    return _post(uow, 'debit', blood_group, blood_bank, quantity, ref, reason, lots=plan)
+
+def sweep_expired_lots(now=None):
+    """Write off every lot that has reached its expiry date.
+
+    Only lots at the front of each group's expiry heap are visited, so a
+    sweep costs O(expired lots) per bank rather than O(all lots). Returns the
+    ml written off per bank and blood group.
+    """
+    from alerts import check_stock_alerts
+
+    cutoff = (now or datetime.now()).isoformat()
+    expired = {}
+    for bank in list_banks():
+        state = _shard_state(bank)
+        with state['lock']:
+            _sync(bank, state)
+            due = any(heap and heap[0][0] <= cutoff for heap in state['expiry'].values())
+        if not due:
+            continue
+
+        with transaction(ledger_name(bank)) as uow:
+            with state['lock']:
+                _sync(bank, state)
+                by_group = {}
+                for bg in list(state['expiry']):
+                    for lot in _iter_lots(state, bg):
+                        if lot['expires'] > cutoff:
+                            break
+                        by_group.setdefault(bg, []).append([lot['id'], lot['quantity']])
+            for bg, lots in by_group.items():
+                quantity = sum(q for _, q in lots)
+                _post(uow, 'expire', bg, bank, quantity, reason="expired", lots=lots)
+                expired.setdefault(bank, {})[bg] = quantity
+        maybe_snapshot(bank)
+        check_stock_alerts(bank)
+    return expired
+
+def take_snapshot(blood_bank):
+    """Record a shard's totals so later reads replay only newer events"""
+    with transaction(ledger_name(blood_bank), _snapshot_name(blood_bank), _history_name(blood_bank)) as uow:
+        state = _shard_state(blood_bank)
+        with state['lock']:
+            _sync(blood_bank, state)
+            snapshot = {
+                'ledger_seq': state['ledger_seq'],
+                'offset': state['offset'],
+                'ts': datetime.now().isoformat(),
+                'totals': dict(state['totals'])
+            }
+            lots = [dict(lot) for lot in state['lots'].values()]
+        uow.set(_snapshot_name(blood_bank), dict(snapshot, lots=lots))
+        # Point-in-time reads only need totals, so history skips the lots
+        uow.append(_history_name(blood_bank), snapshot)
+    return snapshot
+
+def maybe_snapshot(blood_bank):
+    """Take a shard snapshot once enough events have accumulated since the last one"""
+    snapshot = read_snapshot(_snapshot_name(blood_bank)) or _empty_snapshot()
+    if last_log_seq(ledger_name(blood_bank)) - snapshot['ledger_seq'] >= SNAPSHOT_EVERY:
+        return take_snapshot(blood_bank)
+    return None
+
+_migrated = False
+
+def _legacy_collected(default):
+    # Opening balances carry no collection date. The units were on hand when
+    # blood_inventory.json was last written, so they are at least that old.
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(collection_path("blood_inventory"))).isoformat()
+    except OSError:
+        return default
+
+def migrate_legacy_inventory():
+    """Move pre-shard inventory into per-bank shards, once.
+
+    Events from the unsharded ledger are copied to their bank's shard. A
+    store that never had a ledger gets blood_inventory.json's totals as
+    opening balances under the 'Unassigned' bank. Those lots are of unknown
+    age, so they are dated from the file's last write, not the migration.
+    """
+    global _migrated
+    if _migrated or _read_manifest().get('migrated'):
+        _migrated = True
+        return
+
+    events_by_bank = {}
+    for _, event in read_log(LEGACY_LEDGER):
+        event = {k: v for k, v in event.items() if k != 'seq'}
+        events_by_bank.setdefault(event['blood_bank'], []).append(event)
+    if not events_by_bank:
+        now = datetime.now().isoformat()
+        legacy = read_collection("blood_inventory")
+        collected = _legacy_collected(now)
+        events_by_bank[UNASSIGNED_BANK] = [
+            {'type': 'credit', 'blood_group': bg, 'blood_bank': UNASSIGNED_BANK, 'quantity': quantity,
+             'ref': None, 'reason': 'opening_balance', 'ts': now,
+             'lot': {'id': new_id('lot'), 'collected': collected, 'expires': expiry_date(collected),
+                     'age_known': False}}
+            for bg, quantity in legacy.items() if not bg.startswith('_') and quantity
+        ]
+
+    with transaction(SHARD_MANIFEST, *(ledger_name(bank) for bank in events_by_bank)) as uow:
+        manifest = uow.get(SHARD_MANIFEST) or {'banks': {}, 'migrated': False}
+        if manifest.get('migrated'):
+            uow.discard()  # another process migrated first
+        else:
+            for bank, events in events_by_bank.items():
+                if events:
+                    manifest['banks'][bank] = shard_slug(bank)
+                for event in events:
+                    uow.append(ledger_name(bank), event)
+            manifest['migrated'] = True
+            uow.set(SHARD_MANIFEST, manifest)
+    _migrated = True
@@ -1,16 +1,11 @@
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
-import json
-import os
+from storage import read_collection, update_collection
 
 def load_blood_banks():
     """Load blood bank locations from JSON file"""
-    try:
-        with open("data/blood_banks.json", 'r') as f:
-            return json.load(f)
-    except:
-        return []
+    return read_collection("blood_banks")
 
 def show_blood_bank_map():
     """Display interactive map with blood bank locations"""
@@ -136,15 +131,16 @@ def show_blood_bank_map():
                             'lng': lng
                         }
                         
-                        blood_banks.append(new_bank)
-                        
                         try:
-                            os.makedirs("data", exist_ok=True)
-                            with open("data/blood_banks.json", 'w') as f:
-                                json.dump(blood_banks, f, indent=2)
+                            update_collection("blood_banks", lambda banks: banks.append(new_bank))
+                            saved = True
+                        except OSError:
+                            saved = False
+                        
+                        if saved:
                             st.success("Blood bank suggestion submitted successfully!")
                             st.rerun()
-                        except:
+                        else:
                             st.error("Failed to save blood bank information.")
                     else:
                         st.error("Please fill in all fields with valid information.")
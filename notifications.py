@@ -1,8 +1,9 @@
-import json
-import os
 from datetime import datetime, timedelta
 import random
 import string
+from ids import new_id
+from storage import read_collection, write_collection, update_collection, StorageError
+from records import Notification
 
 def generate_otp(length=6):
     """Generate a random OTP"""
@@ -14,133 +15,134 @@ def generate_reset_token(length=32):
 
 def load_otps():
     """Load OTPs from JSON file"""
-    try:
-        with open("data/otps.json", 'r') as f:
-            return json.load(f)
-    except:
-        return {}
+    return read_collection("otps")
 
 def save_otps(otps):
     """Save OTPs to JSON file"""
     try:
-        os.makedirs("data", exist_ok=True)
-        with open("data/otps.json", 'w') as f:
-            json.dump(otps, f, indent=2)
+        write_collection("otps", otps)
         return True
-    except:
+    except (OSError, StorageError):
         return False
 
 def load_notifications():
     """Load notifications from JSON file"""
-    try:
-        with open("data/notifications.json", 'r') as f:
-            return json.load(f)
-    except:
-        return []
+    return read_collection("notifications")
 
 def save_notifications(notifications):
     """Save notifications to JSON file"""
     try:
-        os.makedirs("data", exist_ok=True)
-        with open("data/notifications.json", 'w') as f:
-            json.dump(notifications, f, indent=2)
+        write_collection("notifications", notifications)
         return True
-    except:
+    except (OSError, StorageError):
         return False
 
 def store_otp(identifier, otp, purpose, expires_in_minutes=10):
     """Store OTP with expiration"""
-    otps = load_otps()
-    
     expiry_time = datetime.now() + timedelta(minutes=expires_in_minutes)
     
-    otps[identifier] = {
-        'otp': otp,
-        'purpose': purpose,
-        'expires_at': expiry_time.isoformat(),
-        'created_at': datetime.now().isoformat()
-    }
+    def add_otp(otps):
+        otps[identifier] = {
+            'otp': otp,
+            'purpose': purpose,
+            'expires_at': expiry_time.isoformat(),
+            'created_at': datetime.now().isoformat()
+        }
     
-    return save_otps(otps)
+    try:
+        update_collection("otps", add_otp)
+        return True
+    except OSError:
+        return False
 
-def verify_otp(identifier, otp):
-    """Verify OTP"""
-    otps = load_otps()
-    
-    if identifier not in otps:
+def _consume_secret(identifier, field, value):
+    """Check a stored OTP or token and remove it once used or expired"""
+    def check(otps):
+        if identifier not in otps:
+            return False
+        
+        stored = otps[identifier]
+        
+        # Check if it has expired
+        expiry_time = datetime.fromisoformat(stored['expires_at'])
+        if datetime.now() > expiry_time:
+            del otps[identifier]
+            return False
+        
+        # Check if it matches, and remove it once used
+        if stored[field] == value:
+            del otps[identifier]
+            return True
+        
         return False
     
-    stored_otp = otps[identifier]
-    
-    # Check if OTP has expired
-    expiry_time = datetime.fromisoformat(stored_otp['expires_at'])
-    if datetime.now() > expiry_time:
-        # Remove expired OTP
-        del otps[identifier]
-        save_otps(otps)
+    try:
+        return update_collection("otps", check)
+    except OSError:
         return False
-    
-    # Check if OTP matches
-    if stored_otp['otp'] == otp:
-        # Remove used OTP
-        del otps[identifier]
-        save_otps(otps)
-        return True
-    
-    return False
+
+def verify_otp(identifier, otp):
+    """Verify OTP"""
+    return _consume_secret(identifier, 'otp', otp)
 
 def is_otp_verified(identifier):
     """Check if OTP was verified"""
     otps = load_otps()
     return identifier not in otps
 
+def purge_expired_otps():
+    """Remove expired OTPs and reset tokens; returns how many were removed"""
+    now = datetime.now()
+    
+    def purge(otps):
+        expired = [key for key, stored in otps.items() if datetime.fromisoformat(stored['expires_at']) < now]
+        for key in expired:
+            del otps[key]
+        return len(expired)
+    
+    try:
+        return update_collection("otps", purge)
+    except OSError:
+        return 0
+
 def store_reset_token(email, token, expires_in_minutes=15):
     """Store password reset token"""
-    otps = load_otps()
-    
     expiry_time = datetime.now() + timedelta(minutes=expires_in_minutes)
     
-    otps[f"reset_{email}"] = {
-        'token': token,
-        'purpose': 'password_reset',
-        'expires_at': expiry_time.isoformat(),
-        'created_at': datetime.now().isoformat()
-    }
+    def add_token(otps):
+        otps[f"reset_{email}"] = {
+            'token': token,
+            'purpose': 'password_reset',
+            'expires_at': expiry_time.isoformat(),
+            'created_at': datetime.now().isoformat()
+        }
     
-    return save_otps(otps)
+    try:
+        update_collection("otps", add_token)
+        return True
+    except OSError:
+        return False
 
 def verify_reset_token(email, token):
     """Verify password reset token"""
-    otps = load_otps()
-    identifier = f"reset_{email}"
-    
-    if identifier not in otps:
-        return False
-    
-    stored_token = otps[identifier]
-    
-    # Check if token has expired
-    expiry_time = datetime.fromisoformat(stored_token['expires_at'])
-    if datetime.now() > expiry_time:
-        # Remove expired token
-        del otps[identifier]
-        save_otps(otps)
-        return False
-    
-    # Check if token matches
-    if stored_token['token'] == token:
-        # Remove used token
-        del otps[identifier]
-        save_otps(otps)
+    return _consume_secret(f"reset_{email}", 'token', token)
+
+def _record_notification(notification, uow=None):
+    """Append a notification, inside the caller's unit of work if one is given"""
+    if uow is not None:
+        uow.get("notifications").append(notification)
         return True
     
-    return False
+    try:
+        update_collection("notifications", lambda notifications: notifications.append(notification))
+        return True
+    except OSError:
+        return False
 
-def send_email_notification(email, subject, message):
+def send_email_notification(email, subject, message, uow=None):
     """Store email notification (simulated)"""
-    notifications = load_notifications()
-    
     notification = {
+        'id': new_id('notification'),
         'type': 'email',
         'recipient': email,
         'subject': subject,
@@ -149,15 +151,12 @@ def send_email_notification(email, subject, message):
         'status': 'sent'
     }
     
-    notifications.append(notification)
-    save_notifications(notifications)
-    return True
+    return _record_notification(notification, uow)
 
-def send_sms_notification(phone, message):
+def send_sms_notification(phone, message, uow=None):
     """Store SMS notification (simulated)"""
-    notifications = load_notifications()
-    
     notification = {
+        'id': new_id('notification'),
         'type': 'sms',
         'recipient': phone,
         'message': message,
@@ -165,11 +164,9 @@ def send_sms_notification(phone, message):
         'status': 'sent'
     }
     
-    notifications.append(notification)
-    save_notifications(notifications)
-    return True
+    return _record_notification(notification, uow)
 
-def send_registration_email(email, username):
+def send_registration_email(email, username, uow=None):
     """Send registration confirmation email"""
     subject = "Welcome to Blood Bank Management System"
     message = f"""
@@ -189,7 +186,7 @@ Best regards,
 Blood Bank Management Team
 """
     
-    return send_email_notification(email, subject, message)
+    return send_email_notification(email, subject, message, uow)
 
 def send_password_reset_email(email, username, token):
     """Send password reset email"""
@@ -216,8 +213,8 @@ def get_user_notifications(user_email):
     
     for notification in notifications:
         if notification['recipient'] == user_email:
-            user_notifications.append(notification)
+            user_notifications.append(Notification.from_storage(notification))
     
     # Sort by timestamp (most recent first)
-    user_notifications.sort(key=lambda x: x['timestamp'], reverse=True)
+    user_notifications.sort(key=lambda x: x.timestamp, reverse=True)
     return user_notifications
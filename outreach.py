@@ -0,0 +1,301 @@
+import threading
+from datetime import datetime, timedelta
+from storage import read_snapshot, read_record, read_records, transaction, read_log, last_log_seq
+from request_queue import IndexedHeap
+from notifications import send_email_notification, send_sms_notification
+
+# Donors are contacted in waves rather than all at once. Each wave goes to
+# the nearest eligible compatible donors not yet contacted; if the offers
+# received by the wave's deadline do not cover the request, the next wave is
+# larger and reaches further. Outreach state is kept as an event log folded
+# into per-request state plus a heap of wave deadlines, so advancing only
+# touches requests whose deadline has passed. A wave's size follows the
+# number of waves sent; when a ring holds nobody, the reach widens without
+# the wave growing.
+OUTREACH_LOG = "outreach"
+OUTREACH_SNAPSHOT = "outreach_snapshot"
+SNAPSHOT_EVERY = 1000
+
+FIRST_WAVE_SIZE = 5
+MAX_WAVE_SIZE = 80
+FIRST_RADIUS_KM = 10
+MAX_RADIUS_KM = 640
+
+# How long donors get to respond before the next wave goes out
+WAVE_WAIT = {
+    'Critical': timedelta(minutes=30),
+    'High': timedelta(hours=2),
+    'Medium': timedelta(hours=6),
+    'Low': timedelta(hours=24),
+}
+
+def wave_plan(wave):
+    """Get (size, radius_km) of the given 1-based wave"""
+    return (min(MAX_WAVE_SIZE, FIRST_WAVE_SIZE * 2 ** (wave - 1)),
+            min(MAX_RADIUS_KM, FIRST_RADIUS_KM * 2 ** (wave - 1)))
+
+# In-process outreach state as of byte ``offset`` in the log
+_state = {'offset': 0, 'seq': 0, 'requests': {}, 'deadlines': IndexedHeap()}
+_state_lock = threading.Lock()
+
+def _apply(state, event):
+    request_id = event['id']
+    if event['op'] == 'start':
+        state['requests'][request_id] = {
+            'blood_group': event['blood_group'],
+            'quantity': event['quantity'],
+            'urgency': event['urgency'],
+            'lat': event.get('lat'),
+            'lng': event.get('lng'),
+            'wave': 0,
+            'radius_km': 0,
+            'contacted': [],
+            'offered': {},
+            'due': event['due']
+        }
+        state['deadlines'].push(request_id, (event['due'], request_id))
+        return
+
+    outreach = state['requests'].get(request_id)
+    if outreach is None:
+        return
+    if event['op'] == 'wave':
+        outreach['wave'] = event['wave']
+        outreach['radius_km'] = event['radius_km']
+        outreach['contacted'].extend(event['donors'])
+        outreach['due'] = event['due']
+        state['deadlines'].push(request_id, (event['due'], request_id))
+        if event.get('unlocated'):
+            outreach['unlocated_waves'] = outreach.get('unlocated_waves', 0) + 1
+    elif event['op'] == 'response':
+        if event['quantity'] > 0:
+            outreach['offered'][event['donor']] = event['quantity']
+        else:
+            outreach['offered'].pop(event['donor'], None)
+    elif event['op'] == 'close':
+        del state['requests'][request_id]
+        state['deadlines'].remove(request_id)
+
+def _copy(outreach):
+    return dict(outreach, contacted=list(outreach['contacted']), offered=dict(outreach['offered']))
+
+def _empty_snapshot():
+    return {'seq': 0, 'offset': 0, 'requests': {}}
+
+def _refresh():
+    """Bring the in-process state up to date with the log; caller holds _state_lock"""
+    snapshot = read_snapshot(OUTREACH_SNAPSHOT) or _empty_snapshot()
+    if _state['offset'] < snapshot['offset']:
+        requests = {request_id: _copy(outreach) for request_id, outreach in snapshot['requests'].items()}
+        _state.update(offset=snapshot['offset'], seq=snapshot['seq'], requests=requests,
+                      deadlines=IndexedHeap(((o['due'], request_id), request_id) for request_id, o in requests.items()))
+    for offset, event in read_log(OUTREACH_LOG, _state['offset']):
+        _apply(_state, event)
+        _state['offset'] = offset
+        _state['seq'] = event['seq']
+
+def start_outreach(uow, request):
+    """Schedule a request's first wave inside the caller's unit of work"""
+    uow.append(OUTREACH_LOG, {
+        'op': 'start',
+        'id': request['id'],
+        'blood_group': request['blood_group'],
+        'quantity': request['quantity'],
+        'urgency': request['urgency'],
+        'lat': request.get('lat'),
+        'lng': request.get('lng'),
+        'due': datetime.now().isoformat()
+    })
+
+def record_response(uow, request_id, donor_username, accepted, quantity_offered):
+    """Count a donor's response inside the caller's unit of work.
+
+    The transaction must include OUTREACH_LOG. Outreach stops as soon as the
+    offers cover the requested quantity. Returns True if it did.
+    """
+    with _state_lock:
+        _refresh()
+        outreach = _state['requests'].get(request_id)
+        if outreach is None:
+            return False
+        offered = dict(outreach['offered'])
+        quantity = outreach['quantity']
+
+    offer = quantity_offered if accepted else 0
+    uow.append(OUTREACH_LOG, {'op': 'response', 'id': request_id, 'donor': donor_username, 'quantity': offer})
+    if offer > 0:
+        offered[donor_username] = offer
+    else:
+        offered.pop(donor_username, None)
+    if sum(offered.values()) >= quantity:
+        uow.append(OUTREACH_LOG, {'op': 'close', 'id': request_id, 'reason': 'covered'})
+        return True
+    return False
+
+def get_outreach_status(request_id):
+    """Get a request's active outreach (wave, reach, donors contacted, ml offered), or None"""
+    with _state_lock:
+        _refresh()
+        outreach = _state['requests'].get(request_id)
+        if outreach is None:
+            return None
+        return {
+            'wave': outreach['wave'],
+            'radius_km': outreach['radius_km'],
+            'contacted': len(outreach['contacted']),
+            'offered': sum(outreach['offered'].values()),
+            'quantity': outreach['quantity'],
+            'next_wave_at': outreach['due']
+        }
+
+def _compatible_donors(outreach, users_by_name, contacted, unlocated_only=False):
+    """Get eligible compatible donors not contacted yet, optionally only those without a location"""
+    from blood_management import get_compatible_donors
+    from eligibility import filter_eligible
+
+    compatible = set(get_compatible_donors(outreach['blood_group']))
+    return filter_eligible([
+        name for name, user in users_by_name.items()
+        if user.get('user_type') == 'donor' and user.get('blood_group') in compatible
+        and name not in contacted
+        and not (unlocated_only and user.get('lat') is not None and user.get('lng') is not None)
+    ])
+
+def _next_wave(outreach, users_by_name):
+    """Pick the next wave's donors; returns (wave, radius, donors, whether some lack a location).
+
+    Located requests go to the nearest donors first, widening the reach
+    ring by ring until some are found or it runs out. Once the widest reach
+    has none left, donors without a location fill the wave, in waves of
+    their own that start again from FIRST_WAVE_SIZE.
+    """
+    from donor_locator import find_nearest_donors
+
+    contacted = set(outreach['contacted'])
+    wave = outreach['wave'] + 1
+    size, radius = wave_plan(wave)
+    if outreach['lat'] is None or outreach['lng'] is None:
+        # Without a location, waves only grow in size
+        return wave, None, _compatible_donors(outreach, users_by_name, contacted)[:size], False
+    radius = max(radius, outreach['radius_km'])
+    while True:
+        nearest = find_nearest_donors(outreach['blood_group'], outreach['lat'], outreach['lng'],
+                                      k=len(contacted) + size, max_km=radius)
+        donors = [d['username'] for d in nearest if d['username'] not in contacted and d['username'] in users_by_name][:size]
+        if donors or radius >= MAX_RADIUS_KM:
+            break
+        radius = min(MAX_RADIUS_KM, radius * 2)
+    if radius >= MAX_RADIUS_KM and len(donors) < size:
+        room = min(size - len(donors), wave_plan(outreach.get('unlocated_waves', 0) + 1)[0])
+        unlocated = _compatible_donors(outreach, users_by_name, contacted, unlocated_only=True)[:room]
+        if unlocated:
+            return wave, radius, donors + unlocated, True
+    return wave, radius, donors, False
+
+def _send_wave(uow, request_id, request, donors, users_by_name):
+    for username in donors:
+        donor = users_by_name[username]
+        subject = f"Urgent: {request['blood_group']} Blood Needed"
+        message = f"""
+Dear {username},
+
+A patient needs {request['quantity']} ml of {request['blood_group']} blood ({request['urgency']} urgency),
+required by {request['required_date']}. Your blood group is compatible.
+
+Log in to the Blood Bank Management System to respond to request {request_id}.
+
+Best regards,
+Blood Bank Management Team
+"""
+        if donor.get('email'):
+            send_email_notification(donor['email'], subject, message, uow)
+        if donor.get('phone'):
+            send_sms_notification(
+                donor['phone'],
+                f"{request['urgency']}: {request['blood_group']} blood needed by {request['required_date']}. "
+                f"Please log in to respond to request {request_id}.",
+                uow
+            )
+
+def advance_outreach(now=None, limit=500):
+    """Send the next wave for every request whose wave deadline has passed.
+
+    Requests that are no longer pending, or have no donors left to reach,
+    are closed. Each request's notifications and wave commit together.
+    """
+    now = now or datetime.now()
+    cutoff = now.isoformat()
+    with _state_lock:
+        _refresh()
+        due = []
+        for (deadline, _), request_id in _state['deadlines'].iter_entries():
+            if deadline > cutoff or len(due) >= limit:
+                break
+            due.append(request_id)
+    if not due:
+        return {'waves': 0, 'donors': 0, 'closed': 0}
+
+    requests_by_id = read_records("requests", due)
+    users_by_name = {u['username']: u for u in read_snapshot("users")}
+    summary = {'waves': 0, 'donors': 0, 'closed': 0}
+    for request_id in due:
+        with _state_lock:
+            outreach = _state['requests'].get(request_id)
+            outreach = _copy(outreach) if outreach else None
+        if outreach is None:
+            continue
+        request = requests_by_id.get(request_id)
+        if request is None or request['status'] != 'pending':
+            wave, radius, donors, unlocated = outreach['wave'], outreach['radius_km'], [], False
+        else:
+            wave, radius, donors, unlocated = _next_wave(outreach, users_by_name)
+
+        with transaction("notifications", OUTREACH_LOG) as uow:
+            # Responses need OUTREACH_LOG, so none can land from here on; but
+            # the request may have been fulfilled, cancelled or covered, or
+            # its wave sent elsewhere, since it was picked
+            with _state_lock:
+                _refresh()
+                current = _state['requests'].get(request_id)
+            if current is None or current['wave'] != outreach['wave']:
+                continue
+            request, _ = read_record("requests", request_id)
+            if request is None or request['status'] != 'pending':
+                donors, reason = [], 'request_closed'
+            elif sum(current['offered'].values()) >= current['quantity']:
+                donors, reason = [], 'covered'
+            else:
+                reason = 'exhausted'
+            if donors:
+                _send_wave(uow, request_id, request, donors, users_by_name)
+                event = {
+                    'op': 'wave', 'id': request_id, 'wave': wave, 'radius_km': radius, 'donors': donors,
+                    'due': (now + WAVE_WAIT.get(outreach['urgency'], WAVE_WAIT['Low'])).isoformat()
+                }
+                if unlocated:
+                    event['unlocated'] = True
+                uow.append(OUTREACH_LOG, event)
+                summary['waves'] += 1
+                summary['donors'] += len(donors)
+            else:
+                uow.append(OUTREACH_LOG, {'op': 'close', 'id': request_id, 'reason': reason})
+                summary['closed'] += 1
+    maybe_compact()
+    return summary
+
+def compact():
+    """Write the current state as a snapshot so readers skip the log so far"""
+    with transaction(OUTREACH_LOG, OUTREACH_SNAPSHOT) as uow:
+        with _state_lock:
+            _refresh()
+            uow.set(OUTREACH_SNAPSHOT, {
+                'seq': _state['seq'],
+                'offset': _state['offset'],
+                'requests': {request_id: _copy(o) for request_id, o in _state['requests'].items()}
+            })
+
+def maybe_compact():
+    """Compact once enough events have accumulated since the last snapshot"""
+    snapshot = read_snapshot(OUTREACH_SNAPSHOT) or _empty_snapshot()
+    if last_log_seq(OUTREACH_LOG) - snapshot['seq'] >= SNAPSHOT_EVERY:
+        compact()
@@ -0,0 +1,232 @@
+import sys
+from dataclasses import dataclass, field, fields
+from enum import Enum
+
+# Stored records as slotted objects instead of dicts: no per-record key dict,
+# and repeated values like 'A+' or 'pending' become one shared enum member.
+# Enum members are str subclasses, so they compare equal to, hash like and
+# serialize as the plain strings stored on disk.
+
+class _StrEnum(str, Enum):
+    def __str__(self):
+        return self.value
+
+    def __format__(self, spec):
+        return format(self.value, spec)
+
+class BloodGroup(_StrEnum):
+    A_POS = "A+"
+    A_NEG = "A-"
+    B_POS = "B+"
+    B_NEG = "B-"
+    AB_POS = "AB+"
+    AB_NEG = "AB-"
+    O_POS = "O+"
+    O_NEG = "O-"
+
+class RequestStatus(_StrEnum):
+    PENDING = "pending"
+    FULFILLED = "fulfilled"
+    EXPIRED = "expired"
+    CANCELLED = "cancelled"
+
+class Urgency(_StrEnum):
+    CRITICAL = "Critical"
+    HIGH = "High"
+    MEDIUM = "Medium"
+    LOW = "Low"
+
+class UserType(_StrEnum):
+    DONOR = "donor"
+    RECEIVER = "receiver"
+
+class ResponseType(_StrEnum):
+    ACCEPT = "accept"
+    DECLINE = "decline"
+
+class NotificationType(_StrEnum):
+    EMAIL = "email"
+    SMS = "sms"
+
+def intern_value(enum, value):
+    """Get the enum member for a stored value; unknown strings are interned as they are"""
+    member = enum._value2member_map_.get(value)
+    if member is not None:
+        return member
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _plain(value):
+    return value.value if isinstance(value, Enum) else value
+
+class _Record:
+    """Base of the slotted record types; ``from_storage``/``to_storage`` are generated per type"""
+    __slots__ = ()
+
+def _converters(cls, names, defaults, enums, interned, optional):
+    """Generate straight-line from/to-storage functions for a record type.
+
+    As dataclasses do for ``__init__``, the code names every field
+    directly, so converting a record is one call with no per-field loop.
+    Records with the same fields missing share one ``missing`` set.
+    """
+    namespace = {'cls': cls, 'known': frozenset(names), 'intern': sys.intern,
+                 'intern_value': intern_value, 'plain': _plain, 'shapes': {},
+                 'defaults': dict(zip(names, defaults))}
+    args = []
+    for i, (name, default) in enumerate(zip(names, defaults)):
+        namespace[f'd{i}'] = default
+        value = f"get({name!r}, d{i})"
+        if name in enums:
+            namespace[f'm{i}'] = enums[name]._value2member_map_
+            namespace[f'e{i}'] = enums[name]
+            value = f"(m{i}.get(v{i} := {value}) or intern_value(e{i}, v{i}))"
+        elif name in interned:
+            value = f"(intern(v{i}) if type(v{i} := {value}) is str else v{i})"
+        args.append(value)
+    from_lines = [
+        "def from_storage(data):",
+        "    get = data.get",
+        f"    record = cls({', '.join(args)})",
+        "    missing = known.difference(data)",
+        "    missing = record.missing = shapes.setdefault(missing, missing)",
+        "    if len(data) + len(missing) != len(known):",
+        "        record.extra = {key: value for key, value in data.items() if key not in known}",
+        "    return record",
+    ]
+    to_lines = [
+        "def to_storage(self):",
+        "    data = {%s}" % ', '.join(
+            f"{name!r}: plain(self.{name})" if name in enums else f"{name!r}: self.{name}" for name in names
+        ),
+        "    missing = self.missing",
+    ]
+    # Records built in code leave out optional fields while None, records
+    # read from storage the fields their dict lacked while at their default
+    drop_optional = [f"        if self.{name} is None: del data[{name!r}]" for name in names if name in optional]
+    if drop_optional:
+        to_lines += ["    if missing is None:", *drop_optional, "    elif missing:"]
+    else:
+        to_lines.append("    if missing:")
+    to_lines += [
+        "        for name in missing:",
+        "            if data[name] == defaults[name]:",
+        "                del data[name]",
+        "    if self.extra:",
+        "        data.update(self.extra)",
+        "    return data",
+    ]
+    exec("\n".join(from_lines + to_lines), namespace)
+    return namespace['from_storage'], namespace['to_storage']
+
+def _record_type(enums=None, interned=(), optional=()):
+    """Make a slotted dataclass record type with storage converters.
+
+    ``enums`` maps fields to their enum, ``interned`` lists other string
+    fields worth sharing, and ``optional`` fields are left out of the stored
+    dict while None. Every field needs a default. Records read from storage
+    keep the stored keys the type does not know in ``extra``, and the fields
+    their dict lacked in ``missing``, which stay left out until set to
+    something other than their default; so stored dicts round-trip unchanged.
+    """
+    def wrap(cls):
+        cls = dataclass(slots=True)(cls)
+        record_fields = [f for f in fields(cls) if f.name not in ('extra', 'missing')]
+        from_storage, to_storage = _converters(
+            cls, [f.name for f in record_fields], [f.default for f in record_fields],
+            enums or {}, set(interned), set(optional)
+        )
+        from_storage.__doc__ = "Build a record from a stored dict"
+        to_storage.__doc__ = "Get the dict stored for this record"
+        cls.from_storage = staticmethod(from_storage)
+        cls.to_storage = to_storage
+        return cls
+    return wrap
+
+@_record_type(enums={'user_type': UserType, 'blood_group': BloodGroup})
+class User(_Record):
+    username: str = None
+    email: str = None
+    phone: str = None
+    password: str = None
+    user_type: UserType = None
+    registration_date: str = None
+    blood_group: BloodGroup = None
+    age: int = None
+    lat: float = None
+    lng: float = None
+    email_verified: bool = False
+    phone_verified: bool = False
+    version: int = 0
+    extra: dict = field(default=None, repr=False, compare=False)
+    missing: frozenset = field(default=None, repr=False, compare=False)
+
+@_record_type(enums={'blood_group': BloodGroup}, interned=('blood_bank',), optional=('id', 'version'))
+class Donation(_Record):
+    id: str = None
+    donor: str = None
+    blood_group: BloodGroup = None
+    quantity: int = 0
+    date: str = None
+    blood_bank: str = None
+    notes: str = ""
+    timestamp: str = None
+    version: int = None
+    extra: dict = field(default=None, repr=False, compare=False)
+    missing: frozenset = field(default=None, repr=False, compare=False)
+
+@_record_type(enums={'blood_group': BloodGroup, 'urgency': Urgency, 'status': RequestStatus},
+              interned=('fulfilled_from',), optional=('fulfilled_from', 'updated_at', 'expired_at'))
+class Request(_Record):
+    id: str = None
+    requester: str = None
+    blood_group: BloodGroup = None
+    quantity: int = 0
+    urgency: Urgency = None
+    required_date: str = None
+    reason: str = ""
+    contact_info: str = ""
+    lat: float = None
+    lng: float = None
+    date: str = None
+    status: RequestStatus = RequestStatus.PENDING
+    version: int = 0
+    fulfilled_from: str = None
+    updated_at: str = None
+    expired_at: str = None
+    extra: dict = field(default=None, repr=False, compare=False)
+    missing: frozenset = field(default=None, repr=False, compare=False)
+
+@_record_type(enums={'response_type': ResponseType}, optional=('version',))
+class Response(_Record):
+    id: str = None
+    request_id: str = None
+    donor_username: str = None
+    response_type: ResponseType = None
+    message: str = ""
+    quantity_offered: int = 0
+    response_date: str = None
+    status: str = None
+    version: int = None
+    extra: dict = field(default=None, repr=False, compare=False)
+    missing: frozenset = field(default=None, repr=False, compare=False)
+
+@_record_type(enums={'type': NotificationType}, interned=('status',), optional=('subject',))
+class Notification(_Record):
+    id: str = None
+    type: NotificationType = None
+    recipient: str = None
+    subject: str = None
+    message: str = ""
+    timestamp: str = None
+    status: str = None
+    extra: dict = field(default=None, repr=False, compare=False)
+    missing: frozenset = field(default=None, repr=False, compare=False)
+
+def from_storage(record_type, records):
+    """Convert a list of stored dicts to records"""
+    convert = record_type.from_storage
+    return [convert(record) for record in records]
+
+def to_storage(records):
+    """Convert records back to the dicts stored for them"""
+    return [record.to_storage() for record in records]
@@ -1,98 +1,172 @@
-import json
+import heapq
 import streamlit as st
-import os
-from datetime import datetime
+from datetime import datetime, date
 from auth import get_users_by_type, get_user_info
-from blood_management import get_compatible_donors, load_requests, save_requests
+from blood_management import get_compatible_donors, get_requester_requests
 from notifications import send_email_notification, send_sms_notification
+from ids import new_id
+from eligibility import is_eligible
+from outreach import OUTREACH_LOG, record_response
+from storage import (
+    read_collection, write_collection, transaction, update_record, bump_version,
+    read_record, read_records, read_partitioned, partition_of, SealedPartition, StorageError
+)
+from inventory import InsufficientStock, debit, ledger_name, maybe_snapshot
+from alerts import check_stock_alerts
+from records import User, Request, Response, BloodGroup, RequestStatus, ResponseType, intern_value, from_storage, to_storage
+from request_queue import (
+    QUEUE_LOG, URGENCY_ORDER, dequeue, sync_request, iter_pending_ids, iter_pending_entries, iter_overdue_ids,
+    count_pending, maybe_compact
+)
+
+# Overdue requests are expired this many at a time, one transaction each
+EXPIRY_BATCH_SIZE = 100
+
+# A request never leaves these: reopening a fulfilled one would also need its
+# stock credited back and outreach restarted
+TERMINAL_STATUSES = {RequestStatus.FULFILLED, RequestStatus.EXPIRED, RequestStatus.CANCELLED}
 
 def load_request_responses():
     """Load request responses from JSON file"""
-    try:
-        with open("data/request_responses.json", 'r') as f:
-            return json.load(f)
-    except:
-        return []
+    return from_storage(Response, read_collection("request_responses"))
 
 def save_request_responses(responses):
     """Save request responses to JSON file"""
     try:
-        os.makedirs("data", exist_ok=True)
-        with open("data/request_responses.json", 'w') as f:
-            json.dump(responses, f, indent=2)
+        write_collection("request_responses", to_storage(responses))
         return True
-    except:
+    except (OSError, StorageError):
         return False
 
-def get_pending_requests_for_donor(donor_username):
-    """Get blood requests that a donor can fulfill"""
+def _servable_groups(donor_info):
+    """Get the recipient blood groups a donor's blood can be given to"""
+    donor_blood_group = User.from_storage(donor_info).blood_group
+    return [group for group in BloodGroup if donor_blood_group in get_compatible_donors(group)]
+
+def _load_requests(request_ids):
+    """Get pending Request records for queued ids, reading only the partitions holding them"""
+    stored = read_records("requests", request_ids)
+    requests = (Request.from_storage(stored[i]) for i in request_ids if i in stored)
+    return [request for request in requests if request.status is RequestStatus.PENDING]
+
+def get_pending_requests_for_donor(donor_username, eligible_only=False):
+    """Get blood requests that a donor can fulfill, optionally only if they may donate today"""
     donor_info = get_user_info(donor_username)
     if not donor_info or not donor_info.get('blood_group'):
         return []
+    if eligible_only and not is_eligible(donor_username):
+        return []
     
-    donor_blood_group = donor_info['blood_group']
-    requests = load_requests()
+    # Walk the donor's groups in the pending queue, most urgent first;
+    # overdue requests the sweeper has not expired yet are skipped
+    today = date.today().isoformat()
+    entries = iter_pending_entries(_servable_groups(donor_info), keep=lambda key: key[1] >= today)
+    return _load_requests([request_id for _, request_id in entries])
+
+# Orderings over queue priority keys: [urgency rank, required_date, date, id]
+REQUEST_SORT_KEYS = {
+    'urgency': lambda key: key,
+    'required_date': lambda key: (key[1], key[0]),
+    'newest': lambda key: key[2],
+}
+
+def get_pending_requests_page(donor_username, page=1, page_size=10, sort_by='urgency',
+                              urgencies=None, blood_groups=None, required_before=None):
+    """Get one sorted, filtered page of the blood requests a donor can fulfill.
+
+    Filters apply to the queue's priority keys, and only the requests on
+    the page are read from storage, so a page costs the same however long
+    the backlog is.
+    """
+    donor_info = get_user_info(donor_username)
+    groups = _servable_groups(donor_info) if donor_info and donor_info.get('blood_group') else []
+    if blood_groups:
+        groups = [group for group in groups if group in blood_groups]
     
-    # Filter requests that this donor can fulfill
-    compatible_requests = []
-    for request in requests:
-        if request['status'] == 'pending':
-            # Check if donor's blood is compatible with request
-            recipient_blood_group = request['blood_group']
-            compatible_groups = get_compatible_donors(recipient_blood_group)
-            
-            if donor_blood_group in compatible_groups:
-                compatible_requests.append(request)
+    today = date.today().isoformat()
+    cutoff = required_before.isoformat() if required_before else None
+    ranks = {URGENCY_ORDER.get(u, len(URGENCY_ORDER)) for u in urgencies} if urgencies else None
     
-    return compatible_requests
+    def keep(key):
+        return (key[1] >= today and (ranks is None or key[0] in ranks)
+                and (cutoff is None or key[1] <= cutoff))
+    
+    if sort_by == 'urgency' and cutoff is None:
+        # Queue order: the total comes from per-group counts
+        entries = None
+        total = count_pending(groups, urgencies, not_before=today)
+    else:
+        # Other orders and date cutoffs need every matching key, but still no records
+        entries = iter_pending_entries(groups, keep=keep)
+        total = len(entries)
+    
+    pages = max(1, -(-total // page_size))
+    page = min(max(1, page), pages)
+    start = (page - 1) * page_size
+    
+    if entries is None:
+        entries = iter_pending_entries(groups, keep=keep, limit=start + page_size)
+    elif sort_by in REQUEST_SORT_KEYS and sort_by != 'urgency':
+        select = heapq.nlargest if sort_by == 'newest' else heapq.nsmallest
+        entries = select(start + page_size, entries, key=lambda entry: REQUEST_SORT_KEYS[sort_by](entry[0]))
+    
+    return {
+        'requests': _load_requests([request_id for _, request_id in entries[start:start + page_size]]),
+        'total': total,
+        'page': page,
+        'pages': pages,
+        'page_size': page_size
+    }
 
 def respond_to_request(request_id, donor_username, response_type, message="", quantity_offered=0):
     """Record donor's response to a blood request"""
-    responses = load_request_responses()
+    response = Response(
+        id=new_id('response'),
+        request_id=request_id,
+        donor_username=donor_username,
+        response_type=intern_value(ResponseType, response_type),
+        message=message,
+        quantity_offered=quantity_offered,
+        response_date=datetime.now().isoformat(),
+        status='pending_approval'
+    )
     
-    response = {
-        'request_id': request_id,
-        'donor_username': donor_username,
-        'response_type': response_type,  # 'accept', 'decline'
-        'message': message,
-        'quantity_offered': quantity_offered,
-        'response_date': datetime.now().isoformat(),
-        'status': 'pending_approval'
-    }
+    # Look up everything the notifications need before taking write locks
+    stored, _ = read_record("requests", request_id)
+    request_data = Request.from_storage(stored) if stored else None
     
-    responses.append(response)
+    requester_info = donor_info = None
+    if request_data:
+        requester = get_user_info(request_data.requester)
+        donor = get_user_info(donor_username)
+        if requester and donor:
+            requester_info, donor_info = User.from_storage(requester), User.from_storage(donor)
     
-    if save_request_responses(responses):
-        # Notify the requester about the response
-        requests = load_requests()
-        request_data = None
-        for req in requests:
-            if req.get('id') == request_id:
-                request_data = req
-                break
-        
-        if request_data:
-            requester_info = get_user_info(request_data['requester'])
-            donor_info = get_user_info(donor_username)
+    # The response, the requester's notifications and outreach coverage commit together
+    try:
+        with transaction("request_responses", "notifications", OUTREACH_LOG) as uow:
+            uow.get("request_responses").append(response.to_storage())
+            record_response(uow, request_id, donor_username, response.response_type is ResponseType.ACCEPT, quantity_offered)
             
+            # Notify the requester about the response
             if requester_info and donor_info:
-                if response_type == 'accept':
+                if response.response_type is ResponseType.ACCEPT:
                     subject = "Good News! Donor Found for Your Blood Request"
                     email_message = f"""
-Dear {requester_info['username']},
+Dear {requester_info.username},
 
 Great news! A donor has responded to your blood request:
 
 DONOR DETAILS:
-- Donor: {donor_info['username']}
-- Blood Group: {donor_info['blood_group']}
+- Donor: {donor_info.username}
+- Blood Group: {donor_info.blood_group}
 - Quantity Offered: {quantity_offered} ml
-- Contact: {donor_info['phone']}
+- Contact: {donor_info.phone}
 
 ORIGINAL REQUEST:
-- Blood Group: {request_data['blood_group']}
-- Quantity Needed: {request_data['quantity']} ml
-- Urgency: {request_data['urgency']}
+- Blood Group: {request_data.blood_group}
+- Quantity Needed: {request_data.quantity} ml
+- Urgency: {request_data.urgency}
 
 DONOR MESSAGE:
 {message if message else 'No additional message'}
@@ -103,11 +177,11 @@ Best regards,
 Blood Bank Management Team
 """
                     
-                    sms_message = f"Great news! Donor found for your {request_data['blood_group']} blood request. {quantity_offered}ml offered. Contact: {donor_info['phone']}"
+                    sms_message = f"Great news! Donor found for your {request_data.blood_group} blood request. {quantity_offered}ml offered. Contact: {donor_info.phone}"
                 else:
                     subject = "Update on Your Blood Request"
                     email_message = f"""
-Dear {requester_info['username']},
+Dear {requester_info.username},
 
 A donor has responded to your blood request but is unable to donate at this time.
 
@@ -119,49 +193,172 @@ Don't worry - we are still searching for other compatible donors for your reques
 Best regards,
 Blood Bank Management Team
 """
-                    sms_message = f"Update on your {request_data['blood_group']} blood request. Still searching for donors. Stay hopeful!"
+                    sms_message = f"Update on your {request_data.blood_group} blood request. Still searching for donors. Stay hopeful!"
                 
-                send_email_notification(requester_info['email'], subject, email_message)
-                send_sms_notification(requester_info['phone'], sms_message)
-        
+                send_email_notification(requester_info.email, subject, email_message, uow)
+                send_sms_notification(requester_info.phone, sms_message, uow)
         return True
-    
-    return False
+    except OSError:
+        return False
 
 def get_responses_for_request(request_id):
     """Get all donor responses for a specific request"""
     responses = load_request_responses()
-    return [r for r in responses if r['request_id'] == request_id]
+    return [r for r in responses if r.request_id == request_id]
 
 def update_request_status(request_id, new_status):
-    """Update the status of a blood request"""
-    requests = load_requests()
+    """Update the status of a blood request; fulfilled, expired and cancelled requests stay as they are.
+
+    Requests are only fulfilled through ``fulfill_request``, which takes the
+    units out of a bank's stock in the same commit, so 'fulfilled' is refused.
+    """
+    status = intern_value(RequestStatus, new_status)
+    if status is RequestStatus.FULFILLED:
+        return False
+    
+    def set_status(stored):
+        request = Request.from_storage(stored)
+        # Checked on every retry, against the version being swapped
+        if request.status in TERMINAL_STATUSES:
+            return None
+        request.status = status
+        request.updated_at = datetime.now().isoformat()
+        return request.to_storage()
+    
+    # Compare-and-swap on this request only, so concurrent submissions and
+    # status changes to other requests are never overwritten; the pending
+    # queue changes in the same commit
+    try:
+        updated = update_record("requests", request_id, set_status, extra=(QUEUE_LOG,), on_swap=sync_request)
+    except (OSError, SealedPartition):
+        return False
     
-    for request in requests:
-        if request.get('id') == request_id:
-            request['status'] = new_status
-            request['updated_at'] = datetime.now().isoformat()
-            break
+    maybe_compact()
+    return updated is not None
+
+def fulfill_request(request_id, blood_bank, blood_group=None):
+    """Mark a request fulfilled and take its quantity out of a bank's stock"""
+    try:
+        with transaction("requests", ledger_name(blood_bank), QUEUE_LOG) as uow:
+            requests = uow.get(partition_of("requests", request_id))
+            slot = next((i for i, r in enumerate(requests) if r.get('id') == request_id), None)
+            if slot is None:
+                uow.discard()
+                return {'success': False, 'error': 'Request not found'}
+            request = Request.from_storage(requests[slot])
+            if request.status is not RequestStatus.PENDING:
+                uow.discard()
+                return {'success': False, 'error': f"Request is already {request.status}"}
+            
+            # A compatible group may be issued instead of the exact one requested
+            issued_group = blood_group or request.blood_group
+            if issued_group not in get_compatible_donors(request.blood_group):
+                uow.discard()
+                return {'success': False, 'error': f"{issued_group} is not compatible with {request.blood_group}"}
+            
+            debit(uow, issued_group, blood_bank, request.quantity, ref=request_id)
+            request.status = RequestStatus.FULFILLED
+            request.fulfilled_from = blood_bank
+            request.updated_at = datetime.now().isoformat()
+            requests[slot] = request.to_storage()
+            bump_version(requests, requests[slot])
+            dequeue(uow, request_id)
+    except InsufficientStock as e:
+        return {'success': False, 'error': str(e)}
+    except OSError:
+        return {'success': False, 'error': 'Failed to save request'}
     
-    return save_requests(requests)
+    maybe_snapshot(blood_bank)
+    check_stock_alerts(blood_bank)
+    return {'success': True, 'message': 'Request fulfilled'}
+
+def expire_overdue_requests(today=None, batch_size=EXPIRY_BATCH_SIZE):
+    """Move pending requests whose required date has passed to 'expired'.
+
+    Overdue requests come from the queue's required_date index, so only they
+    are visited. Each batch commits separately. Returns the number expired.
+    """
+    cutoff = (today or date.today()).isoformat()
+    expired = 0
+    while True:
+        batch = iter_overdue_ids(cutoff, limit=batch_size)
+        if not batch:
+            return expired
+        
+        # Only the month partitions holding this batch are opened
+        by_partition = {}
+        for request_id in batch:
+            by_partition.setdefault(partition_of("requests", request_id), set()).add(request_id)
+        with transaction("requests", QUEUE_LOG) as uow:
+            for partition, wanted in by_partition.items():
+                requests = uow.get(partition)
+                for slot, stored in enumerate(requests):
+                    if stored.get('id') not in wanted:
+                        continue
+                    request = Request.from_storage(stored)
+                    if request.status is RequestStatus.PENDING and request.required_date < cutoff:
+                        request.status = RequestStatus.EXPIRED
+                        request.expired_at = datetime.now().isoformat()
+                        requests[slot] = request.to_storage()
+                        bump_version(requests, requests[slot])
+                        expired += 1
+                    wanted.discard(request.id)
+                    dequeue(uow, request.id)
+                # Queued ids whose request no longer exists are dropped as well
+                for request_id in wanted:
+                    dequeue(uow, request_id)
+        maybe_compact()
+
+def send_donor_digests():
+    """Email every donor a summary of the open requests their blood group can serve"""
+    today = date.today().isoformat()
+    requests_by_id = {r.get('id'): r for r in read_partitioned("requests", sealed=False)}
+    
+    # Count open requests per recipient group once, then per donor group
+    open_by_group = {}
+    for request_id in iter_pending_ids():
+        stored = requests_by_id.get(request_id)
+        if stored is None:
+            continue
+        request = Request.from_storage(stored)
+        if request.status is RequestStatus.PENDING and request.required_date >= today:
+            open_by_group[request.blood_group] = open_by_group.get(request.blood_group, 0) + 1
+    open_by_donor_group = {}
+    for recipient_group, count in open_by_group.items():
+        for donor_group in get_compatible_donors(recipient_group):
+            open_by_donor_group[donor_group] = open_by_donor_group.get(donor_group, 0) + count
+    
+    sent = 0
+    with transaction("notifications") as uow:
+        for donor in from_storage(User, get_users_by_type('donor')):
+            count = open_by_donor_group.get(donor.blood_group, 0)
+            if count == 0 or not donor.email:
+                continue
+            message = f"""
+Dear {donor.username},
+
+There are {count} open blood requests that your blood group ({donor.blood_group}) can help with.
+Log in to the Blood Bank Management System to view and respond to them.
+
+Best regards,
+Blood Bank Management Team
+"""
+            send_email_notification(donor.email, "Daily Digest: Open Blood Requests", message, uow)
+            sent += 1
+    return sent
 
 def get_donor_response_history(donor_username):
     """Get response history for a donor"""
     responses = load_request_responses()
-    return [r for r in responses if r['donor_username'] == donor_username]
+    return [r for r in responses if r.donor_username == donor_username]
 
 def get_requester_notifications(requester_username):
-    """Get all responses received for a requester's blood requests"""
-    requests = load_requests()
-    requester_requests = [r for r in requests if r['requester'] == requester_username]
-    
-    all_responses = []
-    for request in requester_requests:
-        request_id = request.get('id')
-        if request_id:
-            responses = get_responses_for_request(request_id)
-            for response in responses:
-                response['request_details'] = request
-                all_responses.append(response)
-    
-    return all_responses
+    """Get (response, request) pairs for every response to a requester's blood requests"""
+    requests_by_id = {r.id: r for r in get_requester_requests(requester_username) if r.id}
+    
+    # One pass over the responses instead of one per request
+    return [
+        (response, requests_by_id[response.request_id])
+        for response in load_request_responses()
+        if response.request_id in requests_by_id
+    ]
@@ -0,0 +1,309 @@
+import heapq
+import threading
+from storage import read_collection, read_snapshot, transaction, read_log, last_log_seq
+
+URGENCY_ORDER = {'Critical': 0, 'High': 1, 'Medium': 2, 'Low': 3}
+
+# Pending requests ordered by urgency, then required_date. Changes are
+# appended to a log inside the same transaction as the request change, and
+# the log is compacted into a snapshot of the heap every SNAPSHOT_EVERY ops.
+# A second heap over the same ops orders requests by required_date alone, so
+# overdue requests can be found without scanning the pending set. Each
+# blood group also has its own heap and per-urgency counts, so a donor's
+# page is read from the groups they can serve without visiting the rest.
+QUEUE_LOG = "request_queue"
+QUEUE_SNAPSHOT = "request_queue_snapshot"
+SNAPSHOT_EVERY = 1000
+# Stored as the snapshot's 'initialized' value; queues built before blood
+# groups were logged (True) are rebuilt once
+QUEUE_FORMAT = 2
+
+def priority_key(request):
+    """Get the queue ordering key of a request"""
+    return [
+        URGENCY_ORDER.get(request['urgency'], len(URGENCY_ORDER)),
+        request['required_date'],
+        request['date'],
+        request['id']
+    ]
+
+class IndexedHeap:
+    """Binary min-heap of (key, id) with a position index.
+
+    Insert, re-prioritize and remove by id are all O(log n).
+    """
+
+    def __init__(self, entries=()):
+        self.heap = [tuple(entry) for entry in entries]
+        self.positions = {item_id: i for i, (_, item_id) in enumerate(self.heap)}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, item_id):
+        return item_id in self.positions
+
+    def _swap(self, i, j):
+        self.heap[i], self.heap[j] = self.heap[j], self.heap[i]
+        self.positions[self.heap[i][1]] = i
+        self.positions[self.heap[j][1]] = j
+
+    def _sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self.heap[i][0] >= self.heap[parent][0]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        size = len(self.heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and self.heap[child][0] < self.heap[smallest][0]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+    def push(self, item_id, key):
+        """Insert an item, or move it if it is already queued"""
+        if item_id in self.positions:
+            self.remove(item_id)
+        self.heap.append((key, item_id))
+        self.positions[item_id] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def remove(self, item_id):
+        """Remove an item if present"""
+        i = self.positions.pop(item_id, None)
+        if i is None:
+            return
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.positions[last[1]] = i
+            self._sift_up(i)
+            self._sift_down(self.positions[last[1]])
+
+    def peek(self):
+        """Get the (key, id) of the top item, or None"""
+        return self.heap[0] if self.heap else None
+
+    def iter_entries(self):
+        """Yield (key, id) in priority order without sorting or changing the heap.
+
+        Walks the heap with a frontier of candidate nodes, so the first k
+        entries cost O(k log k).
+        """
+        if not self.heap:
+            return
+        frontier = [(self.heap[0][0], 0)]
+        while frontier:
+            _, i = heapq.heappop(frontier)
+            yield self.heap[i]
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(self.heap):
+                    heapq.heappush(frontier, (self.heap[child][0], child))
+
+def _fresh_state():
+    return {'offset': 0, 'seq': 0, 'heap': IndexedHeap(), 'deadlines': IndexedHeap(),
+            'groups': {}, 'members': {}, 'counts': {}}
+
+# In-process copy of the queue as of byte ``offset`` in the log
+_state = _fresh_state()
+_state_lock = threading.Lock()
+
+def _deadline_key(key):
+    return (key[1], key[3])
+
+def _drop(state, item_id):
+    member = state['members'].pop(item_id, None)
+    if member is None:
+        return
+    group, rank = member
+    state['heap'].remove(item_id)
+    state['deadlines'].remove(item_id)
+    state['groups'][group].remove(item_id)
+    state['counts'][member] -= 1
+
+def _apply(state, op):
+    _drop(state, op['id'])
+    if op['op'] == 'push':
+        key = tuple(op['key'])
+        member = (op.get('group'), key[0])
+        state['heap'].push(op['id'], key)
+        state['deadlines'].push(op['id'], _deadline_key(key))
+        state['groups'].setdefault(member[0], IndexedHeap()).push(op['id'], key)
+        state['members'][op['id']] = member
+        state['counts'][member] = state['counts'].get(member, 0) + 1
+
+def _load(snapshot):
+    """Build the in-process state from a snapshot's [key, id, group] entries"""
+    state = _fresh_state()
+    entries = sorted((tuple(entry[0]), entry[1], entry[2] if len(entry) > 2 else None)
+                     for entry in snapshot['entries'])
+    # A sorted list is already a valid heap, for every subset too
+    state['heap'] = IndexedHeap((key, item_id) for key, item_id, _ in entries)
+    state['deadlines'] = IndexedHeap(sorted((_deadline_key(key), item_id) for key, item_id, _ in entries))
+    by_group = {}
+    for key, item_id, group in entries:
+        member = (group, key[0])
+        by_group.setdefault(group, []).append((key, item_id))
+        state['members'][item_id] = member
+        state['counts'][member] = state['counts'].get(member, 0) + 1
+    state['groups'] = {group: IndexedHeap(group_entries) for group, group_entries in by_group.items()}
+    state.update(offset=snapshot['offset'], seq=snapshot['seq'])
+    return state
+
+def _empty_snapshot():
+    return {'seq': 0, 'offset': 0, 'entries': [], 'initialized': False}
+
+def _refresh():
+    """Bring the in-process heap up to date with the log; caller holds _state_lock"""
+    snapshot = read_snapshot(QUEUE_SNAPSHOT) or _empty_snapshot()
+    if _state['offset'] < snapshot['offset']:
+        _state.update(_load(snapshot))
+    for offset, op in read_log(QUEUE_LOG, _state['offset']):
+        _apply(_state, op)
+        _state['offset'] = offset
+        _state['seq'] = op['seq']
+    return snapshot
+
+def enqueue(uow, request):
+    """Queue (or re-prioritize) a pending request inside the caller's unit of work"""
+    uow.append(QUEUE_LOG, {'op': 'push', 'id': request['id'], 'key': priority_key(request),
+                           'group': request['blood_group']})
+
+def dequeue(uow, request_id):
+    """Drop a request from the queue inside the caller's unit of work"""
+    uow.append(QUEUE_LOG, {'op': 'remove', 'id': request_id})
+
+def sync_request(uow, request):
+    """Queue or drop a request to match its status"""
+    if request['status'] == 'pending':
+        enqueue(uow, request)
+    else:
+        dequeue(uow, request['id'])
+
+def iter_pending_entries(groups=None, keep=None, limit=None):
+    """Get ``(priority key, id)`` of pending requests, most urgent first, without re-sorting.
+
+    ``groups`` limits them to requests for those blood groups and
+    ``keep(key)`` filters on the priority key. The walk stops after
+    ``limit`` matches, so a first page never visits the rest of the queue.
+    """
+    _ensure_initialized()
+    with _state_lock:
+        _refresh()
+        if groups is None:
+            entries = _state['heap'].iter_entries()
+        else:
+            heaps = [_state['groups'][group] for group in set(groups) if group in _state['groups']]
+            entries = heapq.merge(*(heap.iter_entries() for heap in heaps))
+        found = []
+        for entry in entries:
+            if limit is not None and len(found) >= limit:
+                break
+            if keep is None or keep(entry[0]):
+                found.append(entry)
+    return found
+
+def iter_pending_ids(limit=None):
+    """Yield pending request ids, most urgent first, without re-sorting"""
+    return [item_id for _, item_id in iter_pending_entries(limit=limit)]
+
+def count_pending(groups=None, urgencies=None, not_before=None):
+    """Count pending requests for ``groups`` and ``urgencies``, leaving out those required before ``not_before``.
+
+    Answers from per-group counts; only the overdue front of the deadline
+    heap is visited.
+    """
+    ranks = None if urgencies is None else {URGENCY_ORDER.get(u, len(URGENCY_ORDER)) for u in urgencies}
+    groups = None if groups is None else set(groups)
+    
+    def wanted(member):
+        return (groups is None or member[0] in groups) and (ranks is None or member[1] in ranks)
+    
+    _ensure_initialized()
+    with _state_lock:
+        _refresh()
+        total = sum(count for member, count in _state['counts'].items() if wanted(member))
+        if not_before is not None:
+            for (required_date, _), item_id in _state['deadlines'].iter_entries():
+                if required_date >= not_before:
+                    break
+                if wanted(_state['members'][item_id]):
+                    total -= 1
+    return total
+
+def iter_overdue_ids(cutoff, limit=None):
+    """Get pending request ids whose required_date is before ``cutoff``, earliest first.
+
+    Only the overdue front of the deadline heap is visited.
+    """
+    _ensure_initialized()
+    with _state_lock:
+        _refresh()
+        ids = []
+        for (required_date, _), item_id in _state['deadlines'].iter_entries():
+            if required_date >= cutoff or (limit is not None and len(ids) >= limit):
+                break
+            ids.append(item_id)
+    return ids
+
+def peek_most_urgent():
+    """Get the id of the most urgent pending request, or None"""
+    _ensure_initialized()
+    with _state_lock:
+        _refresh()
+        top = _state['heap'].peek()
+    return top[1] if top else None
+
+def pending_count():
+    """Get the number of queued pending requests"""
+    _ensure_initialized()
+    with _state_lock:
+        _refresh()
+        return len(_state['heap'])
+
+def compact():
+    """Write the current heap as a snapshot so readers skip the log so far"""
+    with transaction(QUEUE_LOG, QUEUE_SNAPSHOT) as uow:
+        with _state_lock:
+            snapshot = _refresh()
+            uow.set(QUEUE_SNAPSHOT, {
+                'seq': _state['seq'],
+                'offset': _state['offset'],
+                'entries': [[list(key), item_id, _state['members'][item_id][0]] for key, item_id in _state['heap'].heap],
+                'initialized': snapshot.get('initialized', False)
+            })
+
+def maybe_compact():
+    """Compact once enough ops have accumulated since the last snapshot"""
+    snapshot = read_snapshot(QUEUE_SNAPSHOT) or _empty_snapshot()
+    if last_log_seq(QUEUE_LOG) - snapshot['seq'] >= SNAPSHOT_EVERY:
+        compact()
+
+_initialized = False
+
+def _ensure_initialized():
+    """Queue every pending request from requests.json the first time the queue is used"""
+    global _initialized
+    if _initialized:
+        return
+    snapshot = read_snapshot(QUEUE_SNAPSHOT) or _empty_snapshot()
+    if snapshot.get('initialized') != QUEUE_FORMAT:
+        with transaction("requests", QUEUE_LOG, QUEUE_SNAPSHOT) as uow:
+            snapshot = uow.get(QUEUE_SNAPSHOT) or _empty_snapshot()
+            if snapshot.get('initialized') == QUEUE_FORMAT:
+                uow.discard()  # another process built it first
+            else:
+                # Pushes are upserts, so requests queued meanwhile are harmless
+                for request in read_collection("requests"):
+                    if request['status'] == 'pending' and request.get('id'):
+                        enqueue(uow, request)
+                uow.set(QUEUE_SNAPSHOT, dict(snapshot, initialized=QUEUE_FORMAT))
+    _initialized = True
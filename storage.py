@@ -0,0 +1,1569 @@
+import atexit
+import bisect
+import copy
+import gzip
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timezone
+from ids import ensure_node_lease, id_timestamp
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+DATA_DIR = "data"
+LOCK_DIR = os.path.join(DATA_DIR, ".locks")
+
+COLLECTION_DEFAULTS = {
+    'users': list,
+    'blood_inventory': lambda: {"A+": 0, "A-": 0, "B+": 0, "B-": 0, "AB+": 0, "AB-": 0, "O+": 0, "O-": 0},
+    'donations': list,
+    'requests': list,
+    'blood_banks': list,
+    'otps': dict,
+    'notifications': list,
+    'request_responses': list,
+}
+
+# Key field of each list collection that supports per-record versioning
+RECORD_KEYS = {
+    'requests': 'id',
+    'users': 'username',
+    'donations': 'id',
+    'request_responses': 'id',
+    'notifications': 'id',
+}
+
+VERSION_FIELD = 'version'
+# Mapping collections with scalar values (e.g. inventory) keep versions here
+VERSIONS_KEY = '_versions'
+
+class StorageError(Exception):
+    """Raised when a collection file exists but cannot be read or written"""
+
+class VersionConflict(StorageError):
+    """Raised when a record keeps changing underneath a compare-and-swap"""
+
+class SealedPartition(StorageError):
+    """Raised when a commit would change a sealed (read-only) partition"""
+
+class FeedTruncated(StorageError):
+    """Raised when changes are asked for from before a feed's oldest kept event"""
+
+class CollectionLock:
+    """Reader/writer lock for one collection, shared by threads and processes.
+
+    Threads in this process coordinate through a writer-preferring condition;
+    processes coordinate through flock() on a per-collection lock file. The
+    process holds a shared flock while it has readers and an exclusive flock
+    while it has a writer.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._cond = threading.Condition()
+        self._readers = {}  # thread ident -> re-entrant read depth
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._fd = None
+        self.metrics = {
+            'read_acquisitions': 0, 'read_wait_total': 0.0,
+            'write_acquisitions': 0, 'write_wait_total': 0.0,
+            'max_wait': 0.0
+        }
+
+    def _flock(self, mode):
+        if fcntl is None:
+            return
+        if self._fd is None:
+            os.makedirs(LOCK_DIR, exist_ok=True)
+            lock_file = self.name.replace('/', '__') + ".lock"
+            self._fd = os.open(os.path.join(LOCK_DIR, lock_file), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, getattr(fcntl, mode))
+
+    def _record_wait(self, kind, started):
+        waited = time.perf_counter() - started
+        self.metrics[f'{kind}_acquisitions'] += 1
+        self.metrics[f'{kind}_wait_total'] += waited
+        self.metrics['max_wait'] = max(self.metrics['max_wait'], waited)
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        started = time.perf_counter()
+        with self._cond:
+            # Nested reads (including reads inside our own write) never wait
+            if self._writer == me or me in self._readers:
+                self._readers[me] = self._readers.get(me, 0) + 1
+                return
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            if not self._readers:
+                self._flock('LOCK_SH')
+            self._readers[me] = 1
+            self._record_wait('read', started)
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            self._readers[me] -= 1
+            if self._readers[me] == 0:
+                del self._readers[me]
+            if not self._readers and self._writer is None:
+                self._flock('LOCK_UN')
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        started = time.perf_counter()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            if me in self._readers:
+                raise StorageError(f"Cannot upgrade read lock on '{self.name}' to a write lock")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+            try:
+                self._flock('LOCK_EX')
+            except BaseException:
+                self._writer = None
+                self._cond.notify_all()
+                raise
+            self._record_wait('write', started)
+
+    def release_write(self):
+        with self._cond:
+            self._write_depth -= 1
+            if self._write_depth == 0:
+                self._writer = None
+                # Readers that nested inside the write keep the flock shared
+                self._flock('LOCK_SH' if self._readers else 'LOCK_UN')
+                self._cond.notify_all()
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+def get_lock(name):
+    """Get the lock object for a collection (a partitioned collection's parts share its lock)"""
+    name = parent_collection(name)
+    with _locks_guard:
+        if name not in _locks:
+            _locks[name] = CollectionLock(name)
+        return _locks[name]
+
+@contextmanager
+def read_lock(name):
+    """Hold a shared lock on a collection"""
+    lock = get_lock(name)
+    lock.acquire_read()
+    try:
+        yield
+    finally:
+        lock.release_read()
+
+@contextmanager
+def write_lock(name):
+    """Hold an exclusive lock on a collection"""
+    lock = get_lock(name)
+    lock.acquire_write()
+    try:
+        yield
+    finally:
+        lock.release_write()
+
+def collection_path(name):
+    """Get the JSON file path for a collection (``a/b`` names nest in folders)"""
+    return os.path.join(DATA_DIR, f"{name}.json")
+
+def default_for(name):
+    """Get a fresh empty value for a collection"""
+    return COLLECTION_DEFAULTS.get(name, list)()
+
+def _read_file(name):
+    path = collection_path(name)
+    try:
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Sealed partitions may have been compressed
+            with gzip.open(path + ".gz", 'rt') as f:
+                return json.load(f)
+    except FileNotFoundError:
+        return default_for(name)
+    except (OSError, ValueError, EOFError) as e:
+        # Never turn a damaged file into an empty collection: the next save would wipe it
+        raise StorageError(f"Collection '{name}' at {path} is unreadable: {e}") from e
+
+# Donations and requests are split into one file per month, named
+# ``<collection>/<YYYY-MM>``, plus a manifest listing every partition with
+# its record count and whether it is sealed. A record's month is the one
+# its ID was created in, so the partition holding a key is known without
+# reading anything. Sealed partitions are read-only and may be gzipped.
+PARTITIONED = {'donations', 'requests'}
+MANIFEST = "manifest"
+# Records without a usable ID or date (none are written any more)
+LEGACY_PARTITION = "0000-00"
+SEAL_AFTER_MONTHS = 3
+COMPRESS_SEALED = True
+
+def parent_collection(name):
+    """Get the partitioned collection a partition or manifest belongs to, else the name itself"""
+    head = name.split('/', 1)[0]
+    return head if head in PARTITIONED else name
+
+def partition_name(name, month):
+    """Get the storage name of one month's partition of a collection"""
+    return f"{name}/{month}"
+
+def manifest_name(name):
+    """Get the storage name of a partitioned collection's manifest"""
+    return f"{name}/{MANIFEST}"
+
+def _is_partition(name):
+    return parent_collection(name) != name and not name.endswith("/" + MANIFEST)
+
+def _month(value):
+    """Normalize a date, datetime or ISO string to 'YYYY-MM'"""
+    return value[:7] if isinstance(value, str) else value.strftime("%Y-%m")
+
+def _shift_month(month, months):
+    year, index = divmod(int(month[:4]) * 12 + int(month[5:7]) - 1 + months, 12)
+    return f"{year:04d}-{index + 1:02d}"
+
+def key_month(key):
+    """Get the UTC month a record ID was created in, or None if it carries no time.
+
+    UTC, so every process files a record under the same month whatever its
+    local timezone.
+    """
+    try:
+        return id_timestamp(key, timezone.utc).strftime("%Y-%m")
+    except (AttributeError, TypeError, ValueError, OverflowError, OSError):
+        return None
+
+def record_month(record):
+    """Get the partition month of a record: its ID's month, else its own timestamp's"""
+    month = key_month(record.get('id'))
+    if month is None:
+        stamp = record.get('timestamp') or record.get('date') or ""
+        month = stamp[:7] if len(stamp) >= 7 else LEGACY_PARTITION
+    return month
+
+def partition_of(name, key):
+    """Get the storage name of the partition holding a record key"""
+    return partition_name(name, key_month(key) or LEGACY_PARTITION)
+
+def _empty_manifest():
+    return {'partitions': {}, 'migrated': False, 'utc_months': True}
+
+def _new_partition_entry():
+    return {'count': 0, 'sealed': False, 'compressed': False}
+
+def _read_manifest(name):
+    return _read_file(manifest_name(name)) or _empty_manifest()
+
+def _read_partitions(name, manifest=None):
+    """Read every partition of a collection into one private list, oldest month first"""
+    records = []
+    for month in sorted((manifest or _read_manifest(name))['partitions']):
+        records.extend(_read_file(partition_name(name, month)))
+    return records
+
+# Commits that change partitions write their collection's manifest twice:
+# first marked 'writing', then again once every partition is in place.
+# Readers joining several partitions check the manifest was not mid-write
+# and is the same file after reading them (a seqlock), so they never see a
+# commit half-applied; after SEQLOCK_RETRIES tries they wait for writers
+# under the collection's read lock instead.
+SEQLOCK_RETRIES = 8
+
+def _consistent_read(name, read):
+    """Get ``read(manifest)`` over a partitioned collection as of one commit"""
+    path = collection_path(manifest_name(name))
+    for _ in range(SEQLOCK_RETRIES):
+        before = _file_identity(path)
+        manifest = read_snapshot(manifest_name(name)) or _empty_manifest()
+        if not manifest.get('writing'):
+            result = read(manifest)
+            if _file_identity(path) == before:
+                return result
+        time.sleep(0.001)
+    with read_lock(name):
+        return read(read_snapshot(manifest_name(name)) or _empty_manifest())
+
+WAL_PATH = os.path.join(DATA_DIR, ".wal.jsonl")
+WAL_CHECKPOINT_BYTES = 4 * 1024 * 1024
+WAL_LOCK = "_wal"
+
+# Read once at import, since reading the umask means briefly changing it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _file_mode(path):
+    """Get the permissions a replacement for ``path`` should have: its own, or the default for a new file"""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+def _atomic_write(name, data, durable=True):
+    path = collection_path(name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(name)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            if durable:
+                os.fsync(f.fileno())
+        # mkstemp creates the file private to its owner
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+        # A later file could reuse an old inode within the same mtime tick
+        with _snapshots_guard:
+            _snapshots.pop(name, None)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _fsync_path(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def log_path(name):
+    """Get the JSON-lines file path for an append-only log"""
+    return os.path.join(DATA_DIR, f"{name}.jsonl")
+
+def read_log(name, offset=0):
+    """Yield ``(end_offset, event)`` for each complete event after ``offset``.
+
+    Appends are never rewritten, so readers need no lock; a partially
+    written final line is simply not returned yet.
+    """
+    try:
+        f = open(log_path(name), 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            yield offset, json.loads(line)
+
+_log_tails = {}  # name -> (file size, last seq) seen by this process
+
+def last_log_seq(name):
+    """Get the sequence number of the last complete event in a log"""
+    path = log_path(name)
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+    cached = _log_tails.get(name)
+    if cached and cached[0] == size:
+        return cached[1]
+    # Walk backwards from the end until one complete line is in the buffer
+    last_seq = 0
+    with open(path, 'rb') as f:
+        pos, buf = size, b""
+        while pos > 0:
+            step = min(8192, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+            lines = buf.split(b"\n")[:-1]  # drop the (possibly torn) tail
+            complete = lines if pos == 0 else lines[1:]
+            if complete:
+                last_seq = json.loads(complete[-1])['seq']
+                break
+    _log_tails[name] = (size, last_seq)
+    return last_seq
+
+def _append_log(name, events, durable=True):
+    """Append events to a log; the caller holds the log's write lock"""
+    path = log_path(name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'ab+') as f:
+        # Cut off a line torn by a crashed writer; WAL replay re-appends it
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.seek(0)
+                keep = f.read().rfind(b"\n") + 1
+                f.truncate(keep)
+                f.seek(0, os.SEEK_END)
+        for event in events:
+            f.write(json.dumps(event, separators=(',', ':')).encode() + b"\n")
+        f.flush()
+        if durable:
+            os.fsync(f.fileno())
+        _log_tails[name] = (f.tell(), events[-1]['seq'])
+
+def _read_wal():
+    """Read committed WAL records, ignoring a torn final line"""
+    records = []
+    try:
+        with open(WAL_PATH, 'r') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+    except FileNotFoundError:
+        pass
+    return records
+
+# When a commit's WAL record reaches the disk, per durability mode: 'fsync'
+# syncs it alone before the commit returns; 'group' also waits for a sync,
+# but one sync covers every commit appended before it, so commits arriving
+# while a sync is in flight share the next one; 'async' returns at once and
+# is synced in the background within ASYNC_FLUSH_SECONDS, so a power failure
+# (not a process crash) can lose that much of its commits.
+DURABILITY_MODES = ('fsync', 'group', 'async')
+DEFAULT_DURABILITY = 'fsync'
+ASYNC_FLUSH_SECONDS = 1.0
+
+# Policy per collection or log (a shard folder's name covers all its files).
+# Anything not listed is synced on every commit; a transaction gets the
+# strictest mode of the collections it writes.
+DURABILITY = {
+    'notifications': 'async',
+    'worker_jobs': 'async',
+    'forecasts': 'async',
+    'request_queue_snapshot': 'async',
+    'outreach_snapshot': 'async',
+    'otps': 'group',
+    'outreach': 'group',
+    'request_queue': 'group',
+    'stock_alerts': 'group',
+}
+
+def durability_for(name):
+    """Get the durability mode of a collection or log"""
+    if name.startswith(CHANGE_FEED_DIR + "/"):
+        name = name[len(CHANGE_FEED_DIR) + 1:]  # a feed is as durable as its collection
+    return DURABILITY.get(name) or DURABILITY.get(name.split('/')[0]) or DEFAULT_DURABILITY
+
+def set_durability(name, mode):
+    """Set the durability mode of a collection, log or shard folder"""
+    if mode not in DURABILITY_MODES:
+        raise ValueError(f"Durability mode must be one of {DURABILITY_MODES}")
+    DURABILITY[name] = mode
+
+class WalSyncer:
+    """Syncs this process's WAL appends, one fsync covering every append before it.
+
+    Each append gets a ticket, and ``synced`` is the highest ticket known to
+    be on disk. A group commit whose ticket is not synced yet either runs
+    the next sync itself or, if one is already running, waits for it and
+    checks again. Async commits are synced by a background thread.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.written = 0
+        self.synced = 0
+        self._syncing = False
+        self._due = None
+        self._thread = None
+        self.metrics = {'fsyncs': 0, 'group_fsyncs': 0, 'background_fsyncs': 0}
+
+    def wrote(self):
+        """Count an append that has reached the OS; caller holds the WAL lock"""
+        with self._cond:
+            self.written += 1
+            return self.written
+
+    def mark_synced(self, ticket, kind=None):
+        with self._cond:
+            if ticket > self.synced:
+                self.synced = ticket
+                self._cond.notify_all()
+            self.metrics['fsyncs'] += 1
+            if kind:
+                self.metrics[kind] += 1
+
+    def _sync(self, kind):
+        """Sync everything written so far; caller holds self._cond, which is released meanwhile"""
+        self._syncing = True
+        target = self.written
+        self._cond.release()
+        try:
+            _fsync_path(WAL_PATH)
+        finally:
+            self._cond.acquire()
+            self._syncing = False
+            self._cond.notify_all()
+        if target > self.synced:
+            self.synced = target
+        self.metrics['fsyncs'] += 1
+        self.metrics[kind] += 1
+
+    def sync_group(self, ticket):
+        """Return once ``ticket`` is on disk, sharing syncs with concurrent commits"""
+        with self._cond:
+            while self.synced < ticket:
+                if self._syncing:
+                    self._cond.wait()
+                else:
+                    self._sync('group_fsyncs')
+
+    def sync_later(self):
+        """Make sure everything appended so far is synced within ASYNC_FLUSH_SECONDS"""
+        with self._cond:
+            if self._due is None:
+                self._due = time.monotonic() + ASYNC_FLUSH_SECONDS
+                self._cond.notify_all()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="wal-syncer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        with self._cond:
+            while True:
+                while self._due is None or self._due > time.monotonic():
+                    self._cond.wait(None if self._due is None else self._due - time.monotonic())
+                self._due = None
+                if self.synced < self.written and not self._syncing:
+                    self._sync('background_fsyncs')
+
+    def flush(self):
+        """Sync now if anything appended is not yet known to be on disk"""
+        with self._cond:
+            target = self.written
+        self.sync_group(target)
+
+_wal_syncer = WalSyncer()
+atexit.register(_wal_syncer.flush)
+
+def _append_wal(changes, appends, mode=DEFAULT_DURABILITY, extends=None):
+    """Append one transaction to the WAL; this is the commit point.
+
+    ``changes`` holds the new contents of rewritten collections and
+    ``extends`` the records added to the end of list collections, as
+    {name: {'base': length before, 'records': [...]}}. Returns the WAL size
+    once the record is as durable as ``mode`` requires.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    record = {'ts': time.time(), 'changes': changes, 'appends': appends}
+    if extends:
+        record['extends'] = extends
+    line = json.dumps(record, separators=(',', ':'))
+    with write_lock(WAL_LOCK):
+        with open(WAL_PATH, 'a') as f:
+            f.write(line + "\n")
+            f.flush()
+            if mode == 'fsync':
+                os.fsync(f.fileno())
+            ticket = _wal_syncer.wrote()
+            size = f.tell()
+    if mode == 'fsync':
+        _wal_syncer.mark_synced(ticket)
+    elif mode == 'group':
+        _wal_syncer.sync_group(ticket)
+    else:
+        _wal_syncer.sync_later()
+    return size
+
+def _compress(name):
+    """Replace a partition's JSON file with a gzipped copy"""
+    path = collection_path(name)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(name)}.", suffix=".tmp")
+    try:
+        with open(path, 'rb') as src, os.fdopen(fd, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(src.read())
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path + ".gz")
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    os.unlink(path)
+    with _snapshots_guard:
+        _snapshots.pop(name, None)
+
+def checkpoint(replay=False):
+    """Make applied collection files durable and truncate the WAL.
+
+    With ``replay`` the latest logged contents of every collection are
+    written again first, and logged log events missing from their files are
+    appended, which completes transactions interrupted by a crash between
+    logging and applying.
+    """
+    def touched(records):
+        return {name for record in records
+                for name in (*record['changes'], *record.get('extends', {}), *record.get('appends', {}))}
+    
+    names = sorted(touched(_read_wal()))
+    if not names:
+        return
+    locks = [get_lock(name) for name in sorted({parent_collection(name) for name in names})]
+    for lock in locks:
+        lock.acquire_write()
+    try:
+        with write_lock(WAL_LOCK):
+            records = _read_wal()
+            if not touched(records) <= set(names):
+                return  # a new collection was logged meanwhile; try again later
+            latest = {}
+            appends = {}
+            for record in records:
+                latest.update(record['changes'])
+                for name, extension in record.get('extends', {}).items():
+                    if not replay:
+                        latest.setdefault(name, None)  # only synced
+                        continue
+                    current = latest[name] if name in latest else _read_file(name)
+                    # The commit's list was the first ``base`` records of the
+                    # one before it, whether or not the file got further
+                    latest[name] = current[:extension['base']] + extension['records']
+                for name, events in record.get('appends', {}).items():
+                    appends.setdefault(name, []).extend(events)
+            for name, data in latest.items():
+                if replay:
+                    _atomic_write(name, data, durable=False)
+                _fsync_path(collection_path(name))
+            for name, events in appends.items():
+                if replay:
+                    _log_tails.pop(name, None)
+                    last_seq = last_log_seq(name)
+                    missing = [e for e in events if e['seq'] > last_seq]
+                    if missing:
+                        _append_log(name, missing, durable=False)
+                _fsync_path(log_path(name))
+            _fsync_path(DATA_DIR)
+            with open(WAL_PATH, 'w') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            # Every record appended so far is now in durable files
+            _wal_syncer.mark_synced(_wal_syncer.written)
+    finally:
+        for lock in reversed(locks):
+            lock.release_write()
+
+_recovered = False
+_recovery_guard = threading.Lock()
+
+def _ensure_recovered():
+    global _recovered
+    if _recovered:
+        return
+    with _recovery_guard:
+        if not _recovered:
+            checkpoint(replay=True)
+            _recovered = True
+
+# Every commit that changes a feed collection also appends one event to the
+# collection's change feed, in the same WAL record: the keys of the records
+# it added or changed and of those it removed. Feed seq numbers are per
+# collection and only grow, so a reader that remembers the last seq it saw
+# can fetch exactly what changed since, from any process. Feeds keep
+# FEED_RETENTION_SECONDS of history (always at least their latest event);
+# compact_change_feeds drops the rest.
+CHANGE_FEED_DIR = "_changes"
+CHANGE_FEEDS = dict(RECORD_KEYS, blood_banks='name')
+
+# Position of every FEED_INDEX_EVERY-th feed event, so reads start near ``since``
+FEED_INDEX_EVERY = 64
+FEED_RETENTION_SECONDS = 7 * 24 * 3600
+
+def change_feed_name(name):
+    """Get the storage name of a collection's change feed"""
+    return f"{CHANGE_FEED_DIR}/{name}"
+
+def _by_key(name, data):
+    key_field = CHANGE_FEEDS[parent_collection(name)]
+    keyed = {}
+    for record in data:
+        key = record.get(key_field)
+        if key is None:
+            # Records without a key are told apart by content, copies by count
+            digest = hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()[:16]
+            key, copy_number = f"#{digest}", 1
+            while key in keyed:
+                copy_number += 1
+                key = f"#{digest}-{copy_number}"
+        keyed[key] = record
+    return keyed
+
+def _describe_change(name, data):
+    """Get the feed event for replacing a collection's file with data, or None if nothing changed"""
+    before = _by_key(name, _read_file(name))
+    after = _by_key(name, data)
+    changed = [key for key, record in after.items() if before.get(key) != record]
+    removed = [key for key in before if key not in after]
+    if not changed and not removed:
+        return None
+    return {'ts': time.time(), 'changed': changed, 'removed': removed}
+
+class UnitOfWork:
+    """Changes to several collections that commit together or not at all.
+
+    Collections are loaded on first ``get`` and edited in memory, and events
+    for append-only logs are staged with ``append``; nothing touches disk
+    until ``commit``, which logs every change as a single WAL record (one
+    fsync), then swaps collection files into place and extends the logs.
+    Lists that were only appended to are logged as their new records.
+
+    Naming a partitioned collection gives access to its partitions, so
+    writers usually ``get`` just the partition they change. Getting the
+    whole collection instead loads every partition; on commit it is split
+    by month again and only partitions that changed are rewritten.
+    """
+
+    def __init__(self, names):
+        self.names = sorted(set(names))
+        self._data = {}
+        self._appends = {}
+        self.discarded = False
+
+    def _check(self, name):
+        if name not in self.names and parent_collection(name) not in self.names:
+            raise StorageError(f"Collection '{name}' is not part of this transaction")
+        # A whole partitioned collection and its parts cannot both be edited
+        parent = parent_collection(name)
+        if name == parent and name in PARTITIONED:
+            if any(_is_partition(other) and parent_collection(other) == name for other in self._data):
+                raise StorageError(f"Collection '{name}' is already being edited partition by partition")
+        elif _is_partition(name) and parent in self._data:
+            raise StorageError(f"Collection '{parent}' is already being edited as a whole")
+
+    def get(self, name):
+        """Get a collection (or one partition) for modification inside this unit of work"""
+        self._check(name)
+        if name not in self._data:
+            self._data[name] = _read_partitions(name) if name in PARTITIONED else _read_file(name)
+        return self._data[name]
+
+    def set(self, name, data):
+        """Replace a collection's contents inside this unit of work"""
+        self._check(name)
+        self._data[name] = data
+
+    def append(self, name, event):
+        """Stage an event for an append-only log, assigning its ``seq``"""
+        if name not in self.names:
+            raise StorageError(f"Log '{name}' is not part of this transaction")
+        return self._stage(name, event)
+
+    def _stage(self, name, event):
+        staged = self._appends.setdefault(name, [])
+        event['seq'] = (staged[-1]['seq'] if staged else last_log_seq(name)) + 1
+        staged.append(event)
+        return event
+
+    def staged(self, name):
+        """Get the events staged for a log in this unit of work"""
+        return list(self._appends.get(name, []))
+
+    def discard(self):
+        """Drop every staged change so the commit writes nothing"""
+        self._reset()
+        self.discarded = True
+
+    def _reset(self):
+        self._data = {}
+        self._appends = {}
+
+    def _split_partitions(self):
+        """Turn whole partitioned collections into the partitions that changed"""
+        for name in [n for n in self._data if n in PARTITIONED]:
+            by_month = {}
+            for record in self._data.pop(name):
+                by_month.setdefault(record_month(record), []).append(record)
+            known = self._data.get(manifest_name(name)) or _read_manifest(name)
+            for month in set(by_month) | set(known['partitions']):
+                records = by_month.get(month, [])
+                if records != _read_file(partition_name(name, month)):
+                    self._data[partition_name(name, month)] = records
+
+    def _update_manifests(self):
+        """Check no sealed partition changes and keep manifest counts current"""
+        for name in sorted({parent_collection(n) for n in self._data if _is_partition(n)}):
+            manifest = self._data.get(manifest_name(name)) or _read_manifest(name)
+            changed = False
+            for partition in [n for n in self._data if _is_partition(n) and parent_collection(n) == name]:
+                month = partition.rsplit('/', 1)[1]
+                entry = manifest['partitions'].get(month)
+                if entry is None:
+                    entry = manifest['partitions'][month] = _new_partition_entry()
+                    changed = True
+                if entry['sealed']:
+                    if self._data[partition] != _read_file(partition):
+                        raise SealedPartition(f"Partition '{partition}' is sealed")
+                    del self._data[partition]  # only read
+                    continue
+                if entry['count'] != len(self._data[partition]):
+                    entry['count'] = len(self._data[partition])
+                    changed = True
+            manifest.pop('writing', None)  # left by a commit that crashed while applying
+            if changed or manifest_name(name) in self._data:
+                self._data[manifest_name(name)] = manifest
+
+    def _bump_manifests(self):
+        """Give every collection with a changed partition a new manifest revision, for readers' seqlock"""
+        for name in sorted({parent_collection(n) for n in self._data if _is_partition(n)}):
+            manifest = self._data.get(manifest_name(name)) or _read_manifest(name)
+            manifest['rev'] = manifest.get('rev', 0) + 1
+            self._data[manifest_name(name)] = manifest
+
+    def _wal_changes(self):
+        """Split changed collections into those logged whole and lists only added to.
+
+        A list that only gained records at its end (e.g. notifications) is
+        logged as those records alone rather than its full contents.
+        """
+        rewritten, extends = {}, {}
+        for name, data in self._data.items():
+            before = read_snapshot(name)
+            if (isinstance(data, list) and isinstance(before, list) and len(data) > len(before)
+                    and data[:len(before)] == before):
+                extends[name] = {'base': len(before), 'records': data[len(before):]}
+            else:
+                rewritten[name] = data
+        return rewritten, extends
+
+    def commit(self):
+        """Write every staged change; returns (WAL size, feed events by collection)"""
+        self._split_partitions()
+        self._update_manifests()
+        # Collections that were only read, or edited back to what they were,
+        # are neither logged nor rewritten
+        for name in [n for n, data in self._data.items() if data == read_snapshot(n)]:
+            del self._data[name]
+        self._bump_manifests()
+        if not self._data and not self._appends:
+            return None, {}
+        # The collections are still write-locked, so their files hold the
+        # version this commit replaces. Partitions share one feed event.
+        changes = {}
+        for name, data in self._data.items():
+            collection = parent_collection(name)
+            if collection in CHANGE_FEEDS and name != manifest_name(collection):
+                change = _describe_change(name, data)
+                if change is None:
+                    continue
+                if collection in changes:
+                    changes[collection]['changed'] += change['changed']
+                    changes[collection]['removed'] += change['removed']
+                else:
+                    changes[collection] = change
+        published = {name: self._stage(change_feed_name(name), change) for name, change in changes.items()}
+        modes = {durability_for(name) for name in (*self._data, *self._appends)}
+        mode = next(m for m in DURABILITY_MODES if m in modes)
+        rewritten, extends = self._wal_changes()
+        wal_size = _append_wal(rewritten, self._appends, mode, extends)
+        # Manifests open and close the seqlock around their partitions, and
+        # logs go last, so a reader that sees a log event (e.g. a queue
+        # entry) also sees the records it refers to
+        manifests = [n for n in self._data if parent_collection(n) != n and not _is_partition(n)]
+        for name in manifests:
+            _atomic_write(name, dict(self._data[name], writing=True), durable=False)
+        for name, data in self._data.items():
+            if name not in manifests:
+                _atomic_write(name, data, durable=False)
+        for name in manifests:
+            _atomic_write(name, self._data[name], durable=False)
+        for name, events in self._appends.items():
+            _append_log(name, events, durable=False)
+        self._reset()
+        return wal_size, published
+
+# Number of transactions open on each thread
+_open_transactions = threading.local()
+
+def in_transaction():
+    """Tell whether this thread has a transaction open"""
+    return getattr(_open_transactions, 'depth', 0) > 0
+
+@contextmanager
+def transaction(*names):
+    """Run a business operation over several collections as one commit.
+
+    Locks for every named collection are taken once, in a fixed order, for
+    the whole operation. If the body raises, nothing is written. The ID
+    node lease is renewed, if due, before a thread's outermost transaction
+    takes its locks, so minting IDs inside never opens another transaction.
+    """
+    depth = getattr(_open_transactions, 'depth', 0)
+    if not depth:
+        ensure_node_lease()
+    _ensure_recovered()
+    for name in names:
+        if parent_collection(name) in PARTITIONED:
+            _ensure_partitioned(parent_collection(name))
+    locks = [get_lock(name) for name in sorted({parent_collection(name) for name in names})]
+    acquired = []
+    _open_transactions.depth = depth + 1
+    try:
+        for lock in locks:
+            lock.acquire_write()
+            acquired.append(lock)
+        uow = UnitOfWork(names)
+        yield uow
+        wal_size, published = uow.commit()
+    finally:
+        for lock in reversed(acquired):
+            lock.release_write()
+        _open_transactions.depth = depth
+    for name, change in published.items():
+        _publish(name, change)
+    if wal_size and wal_size > WAL_CHECKPOINT_BYTES:
+        checkpoint()
+
+# Concurrent operations submitted within GROUP_COMMIT_WINDOW seconds of
+# each other are run in one unit of work and share one commit: one lock
+# round, one WAL record and sync, and one rewrite of each collection file
+# instead of one per call.
+GROUP_COMMIT_WINDOW = 0.003
+GROUP_COMMIT_MAX_BATCH = 64
+
+class _BatchAborted(Exception):
+    """An operation in a batch raised or discarded; the batch is rerun call by call"""
+
+class GroupCommitter:
+    """Batches operations of concurrent callers into shared transactions.
+
+    The first caller to arrive while no batch is forming leads: it waits out
+    the window, runs every queued operation in order in one unit of work and
+    commits, then wakes the other callers with their results. An operation
+    sees the staged changes of those before it. If any operation raises or
+    calls ``discard()``, nothing from the batch is written and each
+    operation is rerun in its own transaction, so every caller gets exactly
+    the outcome it would have had alone.
+    """
+
+    def __init__(self, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._pending = []
+        self._leading = False
+        self.metrics = {'calls': 0, 'batches': 0, 'fallbacks': 0, 'max_batch': 0}
+
+    def submit(self, names, operation):
+        """Run ``operation(uow)`` over ``names``; returns its result once committed"""
+        entry = {'names': names, 'operation': operation, 'done': False, 'lead': False,
+                 'result': None, 'error': None}
+        with self._cond:
+            self._pending.append(entry)
+            self.metrics['calls'] += 1
+            if self._leading:
+                self._cond.notify_all()
+                while not entry['done'] and not entry['lead']:
+                    self._cond.wait()
+            else:
+                self._leading = True
+        if not entry['done']:
+            self._lead()
+        if entry['error'] is not None:
+            raise entry['error']
+        return entry['result']
+
+    def _lead(self):
+        deadline = time.monotonic() + self.window
+        with self._cond:
+            while len(self._pending) < self.max_batch and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+        try:
+            self._run(batch)
+        finally:
+            with self._cond:
+                for entry in batch:
+                    entry['done'] = True
+                # Callers that arrived during the commit form the next batch,
+                # led by the one waiting longest
+                if self._pending:
+                    self._pending[0]['lead'] = True
+                self._leading = bool(self._pending)
+                self._cond.notify_all()
+
+    def _run(self, batch):
+        names = {name for entry in batch for name in entry['names']}
+        try:
+            with transaction(*names) as uow:
+                results = []
+                for entry in batch:
+                    result = entry['operation'](uow)
+                    if uow.discarded:
+                        raise _BatchAborted()
+                    results.append(result)
+            for entry, result in zip(batch, results):
+                entry['result'] = result
+            self.metrics['batches'] += 1
+            self.metrics['max_batch'] = max(self.metrics['max_batch'], len(batch))
+        except Exception:
+            self.metrics['fallbacks'] += 1
+            for entry in batch:
+                try:
+                    with transaction(*entry['names']) as uow:
+                        entry['result'] = entry['operation'](uow)
+                except Exception as e:
+                    entry['error'] = e
+
+_group_committer = GroupCommitter()
+
+def group_commit(names, operation):
+    """Run ``operation(uow)`` in a transaction over ``names``, batched with concurrent callers.
+
+    Returns the operation's result once its commit is as durable as the
+    collections require. The operation may run twice (batched, then alone),
+    so it must only change storage through ``uow``.
+    """
+    return _group_committer.submit(names, operation)
+
+def get_group_commit_metrics():
+    """Get how many calls were batched, in how many commits, and how many batches fell back"""
+    return dict(_group_committer.metrics)
+
+def read_collection(name):
+    """Load a private copy of a collection's latest committed version.
+
+    Files are only ever replaced atomically, so readers take no lock and
+    never wait for a writer, however long its transaction runs. A
+    partitioned collection is read whole, oldest month first.
+    """
+    _ensure_recovered()
+    if name in PARTITIONED:
+        _ensure_partitioned(name)
+        return _consistent_read(name, lambda manifest: _read_partitions(name, manifest))
+    return _read_file(name)
+
+def _file_identity(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+# Parsed committed version of each collection, keyed by the identity of the
+# file it was read from. A published file is never modified in place, only
+# replaced, so a cached version stays exact until the identity changes.
+_snapshots = {}
+_snapshots_guard = threading.Lock()
+
+def read_snapshot(name):
+    """Get the latest committed version of a collection, shared between readers.
+
+    Takes no lock and only parses the file when a new version has been
+    committed since the last call. The value is shared by every reader of
+    that version, so it must not be modified; use read_collection for a
+    private copy.
+    """
+    _ensure_recovered()
+    if name in PARTITIONED:
+        return _partitioned_snapshot(name)
+    path = collection_path(name)
+    identity = _file_identity(path) or _file_identity(path + ".gz")
+    with _snapshots_guard:
+        cached = _snapshots.get(name)
+    if cached is not None and cached[0] == identity:
+        return cached[1]
+    # Stat before reading: if the file is replaced in between, the newer data
+    # is cached under the older identity and simply read again next time
+    data = _read_file(name)
+    with _snapshots_guard:
+        _snapshots[name] = (identity, data)
+    return data
+
+def _partitioned_snapshot(name):
+    """Get every partition's snapshot joined into one list, rebuilt only when a partition changes"""
+    _ensure_partitioned(name)
+    parts = _consistent_read(name, lambda manifest: [
+        read_snapshot(partition_name(name, month)) for month in sorted(manifest['partitions'])
+    ])
+    with _snapshots_guard:
+        cached = _snapshots.get(name)
+    # Partition snapshots are only replaced, never modified, so the same
+    # objects mean the same contents
+    if cached is not None and len(cached[0]) == len(parts) and all(a is b for a, b in zip(cached[0], parts)):
+        return cached[1]
+    data = [record for part in parts for record in part]
+    with _snapshots_guard:
+        _snapshots[name] = (parts, data)
+    return data
+
+def list_partitions(name, since=None, until=None, sealed=None):
+    """Get a partitioned collection's months in order, optionally only ``since`` to ``until``.
+
+    Bounds are dates, datetimes or 'YYYY-MM...' strings and are inclusive;
+    ``sealed`` True or False keeps only sealed or only open partitions.
+    """
+    _ensure_partitioned(name)
+    return _select_months(read_snapshot(manifest_name(name)) or _empty_manifest(), since, until, sealed)
+
+def _select_months(manifest, since, until, sealed):
+    partitions = manifest['partitions']
+    low = _month(since) if since is not None else None
+    high = _month(until) if until is not None else None
+    return [
+        month for month in sorted(partitions)
+        if (low is None or month >= low) and (high is None or month <= high)
+        and (sealed is None or partitions[month]['sealed'] == sealed)
+    ]
+
+def iter_partitions(name, since=None, until=None, sealed=None, newest_first=False):
+    """Yield ``(month, records)`` for the partitions ``list_partitions`` selects.
+
+    Records are shared snapshots and must not be modified. Only the
+    partitions actually iterated are opened, so a reader that stops early
+    (e.g. after the latest few records) never touches older months.
+    """
+    months = list_partitions(name, since, until, sealed)
+    for month in (reversed(months) if newest_first else months):
+        yield month, read_snapshot(partition_name(name, month))
+
+def read_partitioned(name, since=None, until=None, sealed=None):
+    """Get the records of the partitions created from ``since`` to ``until``, oldest first.
+
+    The list is new but its records are shared and must not be modified.
+    """
+    _ensure_partitioned(name)
+    return _consistent_read(name, lambda manifest: [
+        record for month in _select_months(manifest, since, until, sealed)
+        for record in read_snapshot(partition_name(name, month))
+    ])
+
+def seal_partitions(name, before=None, can_seal=None, compress=COMPRESS_SEALED):
+    """Make a collection's partitions from before month ``before`` read-only.
+
+    ``before`` defaults to SEAL_AFTER_MONTHS before the current month.
+    ``can_seal(records)`` may hold a partition open for now. Sealed
+    partitions are gzipped if ``compress`` is set. Returns the months sealed.
+    """
+    before = _month(before) if before is not None else _shift_month(_month(date.today()), -SEAL_AFTER_MONTHS)
+    # Logged versions of a partition could otherwise be replayed next to its .gz
+    checkpoint()
+    sealed = []
+    with transaction(name) as uow:
+        manifest = uow.get(manifest_name(name)) or _empty_manifest()
+        for month, entry in sorted(manifest['partitions'].items()):
+            if month >= before or entry['sealed']:
+                continue
+            records = _read_file(partition_name(name, month))
+            if can_seal is not None and not can_seal(records):
+                continue
+            entry['sealed'] = True
+            if compress and os.path.exists(collection_path(partition_name(name, month))):
+                # Readers fall back to the .gz file, so they never miss a version
+                _compress(partition_name(name, month))
+                entry['compressed'] = True
+            sealed.append(month)
+        if sealed:
+            uow.set(manifest_name(name), manifest)
+        else:
+            uow.discard()
+    return sealed
+
+def _stale_summaries(manifest):
+    """Get manifest entries still holding the per-month summaries that columnar tables replaced"""
+    return [entry for entry in manifest['partitions'].values() if 'summaries' in entry]
+
+_partitioned = set()
+_partition_guard = threading.Lock()
+_migrating = threading.local()
+
+def _rehome(uow, name, manifest):
+    """Move records filed under a month other than their own, as local-time months could leave them.
+
+    Sealed partitions that change are opened again; sealing closes them later.
+    """
+    by_month = {}
+    for month in manifest['partitions']:
+        for record in _read_file(partition_name(name, month)):
+            by_month.setdefault(record_month(record), []).append(record)
+    for month, entry in manifest['partitions'].items():
+        records = by_month.pop(month, [])
+        if records != _read_file(partition_name(name, month)):
+            entry.update(sealed=False, compressed=False)
+            uow.set(partition_name(name, month), records)
+    for month, records in by_month.items():
+        uow.set(partition_name(name, month), records)
+
+def _needs_migration(manifest):
+    return not manifest.get('migrated') or not manifest.get('utc_months') or _stale_summaries(manifest)
+
+def _ensure_partitioned(name):
+    """Split a collection's single pre-partitioning file into months the first time it is used"""
+    # The migration's own transaction comes back here and must not wait
+    if name in _partitioned or name == getattr(_migrating, 'name', None):
+        return
+    with _partition_guard:
+        if name in _partitioned:
+            return
+        _migrating.name = name
+        try:
+            if _needs_migration(_read_manifest(name)):
+                with transaction(name) as uow:
+                    manifest = uow.get(manifest_name(name)) or _empty_manifest()
+                    if not _needs_migration(manifest):
+                        uow.discard()  # another process got here first
+                    else:
+                        if not manifest.get('migrated'):
+                            # The old file is left in place, unread, as a backup
+                            uow.set(name, _read_file(name))
+                        elif not manifest.get('utc_months'):
+                            _rehome(uow, name, manifest)
+                        for entry in _stale_summaries(manifest):
+                            del entry['summaries']
+                        uow.set(manifest_name(name), dict(manifest, migrated=True, utc_months=True))
+            _partitioned.add(name)
+        finally:
+            _migrating.name = None
+
+def write_collection(name, data):
+    """Replace a collection atomically under an exclusive lock"""
+    with transaction(name) as uow:
+        uow.set(name, data)
+
+def update_collection(name, mutate):
+    """Read, modify and atomically rewrite a collection as one locked step.
+
+    ``mutate`` receives the current data, changes it in place and may return
+    a value, which is passed back to the caller. Concurrent updaters queue on
+    the collection lock instead of overwriting each other.
+    """
+    with transaction(name) as uow:
+        return mutate(uow.get(name))
+
+def _locate(name, data, key):
+    """Find a record and its version; returns (slot, value, version)"""
+    if isinstance(data, list):
+        key_field = RECORD_KEYS[name]
+        for i, record in enumerate(data):
+            if record.get(key_field) == key:
+                return i, record, record.get(VERSION_FIELD, 0)
+        return None, None, 0
+    if key not in data:
+        return None, None, 0
+    return key, data[key], data.get(VERSIONS_KEY, {}).get(key, 0)
+
+def bump_version(data, key_or_record):
+    """Stamp a changed record with the next version number.
+
+    Pass the record itself for list collections, or the key for mapping
+    collections. Every write path that edits a versioned record in a
+    transaction must call this so compare-and-swap writers notice.
+    """
+    if isinstance(key_or_record, dict):
+        key_or_record[VERSION_FIELD] = key_or_record.get(VERSION_FIELD, 0) + 1
+        return key_or_record[VERSION_FIELD]
+    versions = data.setdefault(VERSIONS_KEY, {})
+    versions[key_or_record] = versions.get(key_or_record, 0) + 1
+    return versions[key_or_record]
+
+# Key -> slot of each list snapshot, built once per committed version and
+# keyed on the snapshot object like the snapshot cache itself
+_key_indexes = {}
+_key_indexes_guard = threading.Lock()
+
+def _snapshot_index(name, source, data):
+    """Get the key -> slot index of a list collection's shared snapshot"""
+    with _key_indexes_guard:
+        cached = _key_indexes.get(source)
+    if cached is not None and cached[0] is data:
+        return cached[1]
+    key_field = RECORD_KEYS[name]
+    index = {record.get(key_field): i for i, record in enumerate(data)}
+    with _key_indexes_guard:
+        _key_indexes[source] = (data, index)
+    return index
+
+def read_record(name, key):
+    """Read one record and its version without taking any lock.
+
+    The record comes from the shared snapshot and must not be modified.
+    Records of a partitioned collection are read from their own partition.
+    """
+    if name in PARTITIONED:
+        _ensure_partitioned(name)
+    source = partition_of(name, key) if name in PARTITIONED else name
+    data = read_snapshot(source)
+    if not isinstance(data, list):
+        _, value, version = _locate(name, data, key)
+        return value, version
+    slot = _snapshot_index(name, source, data).get(key)
+    if slot is None:
+        return None, 0
+    return data[slot], data[slot].get(VERSION_FIELD, 0)
+
+def read_records(name, keys):
+    """Read several records of a list collection by key; returns ``{key: record}`` for those found.
+
+    Only the partitions holding ``keys`` are opened. Records are shared
+    snapshots and must not be modified.
+    """
+    found = {}
+    for key in keys:
+        record, _ = read_record(name, key)
+        if record is not None:
+            found[key] = record
+    return found
+
+def compare_and_swap(name, key, expected_version, value, extra=(), on_swap=None):
+    """Replace a record only if it is still at ``expected_version``.
+
+    ``on_swap(uow, value)`` may record dependent changes to the ``extra``
+    collections or logs in the same commit.
+    """
+    with transaction(name, *extra) as uow:
+        data = uow.get(partition_of(name, key) if name in PARTITIONED else name)
+        slot, _, version = _locate(name, data, key)
+        if slot is None or version != expected_version:
+            uow.discard()
+            return False
+        if isinstance(data, list):
+            value[VERSION_FIELD] = version
+            data[slot] = value
+            bump_version(data, value)
+        else:
+            data[slot] = value
+            bump_version(data, slot)
+        if on_swap is not None:
+            on_swap(uow, value)
+        return True
+
+def update_record(name, key, mutate, retries=8, extra=(), on_swap=None):
+    """Optimistically update a single record, retrying on conflict.
+
+    ``mutate`` gets a private copy of the record, built from an unlocked
+    read, and returns the new value (or None to leave it unchanged). Only
+    the final compare-and-swap takes the collection lock, so writers working
+    on different records never wait on each other's read/compute phase and
+    never conflict. Returns the committed value, or None if the record does
+    not exist or ``mutate`` declined to change it. ``extra`` and ``on_swap``
+    are passed through to ``compare_and_swap``.
+    """
+    for attempt in range(retries):
+        value, version = read_record(name, key)
+        if value is None:
+            return None
+        new_value = mutate(copy.deepcopy(value))
+        if new_value is None:
+            return None
+        if compare_and_swap(name, key, version, new_value, extra, on_swap):
+            return new_value
+        time.sleep(random.uniform(0, 0.002 * (2 ** attempt)))
+    raise VersionConflict(f"Record '{key}' in '{name}' kept changing after {retries} attempts")
+
+def get_durability_metrics():
+    """Get this process's WAL sync counts and how many appends are not yet synced"""
+    return dict(_wal_syncer.metrics, unsynced=_wal_syncer.written - _wal_syncer.synced)
+
+def get_lock_metrics():
+    """Get lock acquisition counts and wait times for every collection"""
+    with _locks_guard:
+        locks = list(_locks.values())
+    metrics = {}
+    for lock in locks:
+        m = dict(lock.metrics)
+        m['avg_read_wait'] = m['read_wait_total'] / m['read_acquisitions'] if m['read_acquisitions'] else 0.0
+        m['avg_write_wait'] = m['write_wait_total'] / m['write_acquisitions'] if m['write_acquisitions'] else 0.0
+        metrics[lock.name] = m
+    return metrics
+
+_feed_index = {}  # feed name -> [(seq, offset before it)] every FEED_INDEX_EVERY events
+_feed_index_guard = threading.Lock()
+
+def get_change_seq(name):
+    """Get the seq of the latest change to a collection (0 if it never changed)"""
+    return last_log_seq(change_feed_name(name))
+
+def _scan_feed(feed, index, since, limit):
+    """Read a feed's events after ``since``, starting from the nearest index entry.
+
+    Raises ValueError if the entry no longer points at its event because
+    another process compacted the feed.
+    """
+    start = bisect.bisect_right(index, (since + 1, -1)) - 1
+    first_seq, offset = index[start] if start >= 0 else (None, 0)
+    changes = []
+    previous = offset
+    for end, event in read_log(feed, offset):
+        if previous == offset:
+            if first_seq is not None and (not isinstance(event, dict) or event.get('seq') != first_seq):
+                raise ValueError(f"Stale index entry for {feed}")
+            if first_seq is None and event['seq'] > since + 1:
+                raise FeedTruncated(f"Feed {feed} starts at seq {event['seq']}, changes since {since} are gone")
+        if event['seq'] % FEED_INDEX_EVERY == 0 and (not index or event['seq'] > index[-1][0]):
+            index.append((event['seq'], previous))
+        previous = end
+        if event['seq'] > since:
+            changes.append(event)
+            if limit is not None and len(changes) >= limit:
+                break
+    if first_seq is not None and previous == offset:
+        raise ValueError(f"Stale index entry for {feed}")
+    return changes
+
+def read_changes(name, since=0, limit=None):
+    """Get a collection's change events with seq greater than ``since``, oldest first.
+
+    Each event has ``seq``, ``ts`` and the ``changed`` and ``removed``
+    record keys (usernames, ids or bank names; records without one are
+    keyed by a ``#`` hash of their content). Raises FeedTruncated if
+    compaction already dropped events after ``since``.
+    """
+    _ensure_recovered()
+    feed = change_feed_name(name)
+    with _feed_index_guard:
+        index = list(_feed_index.get(feed, []))
+    try:
+        changes = _scan_feed(feed, index, since, limit)
+    except ValueError:
+        index = []
+        changes = _scan_feed(feed, index, since, limit)
+        with _feed_index_guard:
+            _feed_index.pop(feed, None)
+    with _feed_index_guard:
+        if len(index) > len(_feed_index.get(feed, [])):
+            _feed_index[feed] = index
+    return changes
+
+def compact_change_feeds(retention=FEED_RETENTION_SECONDS, now=None):
+    """Drop change events older than ``retention`` seconds from every feed.
+
+    A feed's latest event is always kept, so its seq keeps counting up. The
+    collection's lock is held while the feed is rewritten, as commits
+    append to the feed under it. Returns the events dropped per collection.
+    """
+    _ensure_recovered()
+    cutoff = (now if now is not None else time.time()) - retention
+    dropped = {}
+    for name in CHANGE_FEEDS:
+        feed = change_feed_name(name)
+        first = next(read_log(feed), None)
+        if first is None or first[1]['ts'] >= cutoff:
+            continue
+        locks = [get_lock(n) for n in sorted({name, feed})]
+        for lock in locks:
+            lock.acquire_write()
+        try:
+            events = list(read_log(feed))
+            keep = len(events) - 1
+            while keep > 0 and events[keep - 1][1]['ts'] >= cutoff:
+                keep -= 1
+            if not keep:
+                continue
+            path = log_path(feed)
+            with open(path, 'rb') as f:
+                f.seek(events[keep - 1][0])
+                tail = f.read()
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(feed)}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(tmp_path, _file_mode(path))
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            _fsync_path(os.path.dirname(path))
+            _log_tails.pop(feed, None)
+            with _feed_index_guard:
+                _feed_index.pop(feed, None)
+            dropped[name] = keep
+        finally:
+            for lock in reversed(locks):
+                lock.release_write()
+    return dropped
+
+# In-process subscribers, called with (collection name, change event) after
+# each commit in this process; other processes' commits arrive through
+# read_changes or a ChangeCursor
+_subscribers = {}
+_subscribers_guard = threading.Lock()
+
+def subscribe(name, callback):
+    """Call ``callback(name, change)`` after every commit that changes a collection.
+
+    Returns a function that cancels the subscription.
+    """
+    with _subscribers_guard:
+        _subscribers.setdefault(name, []).append(callback)
+
+    def unsubscribe():
+        with _subscribers_guard:
+            if callback in _subscribers.get(name, []):
+                _subscribers[name].remove(callback)
+    return unsubscribe
+
+def _publish(name, change):
+    with _subscribers_guard:
+        callbacks = list(_subscribers.get(name, []))
+    for callback in callbacks:
+        try:
+            callback(name, change)
+        except Exception:
+            pass  # the commit is already durable; a failing subscriber must not undo it
+
+class ChangeCursor:
+    """Remembers how far a reader has got in the change feeds of some collections"""
+
+    def __init__(self, *names, start=None):
+        # By default only changes made after the cursor was created are returned
+        self.positions = {name: get_change_seq(name) if start is None else start for name in names}
+
+    def poll(self, limit=None):
+        """Get {collection: [change events]} since the last poll, for collections that changed"""
+        changes = {}
+        for name, since in self.positions.items():
+            if get_change_seq(name) == since:
+                continue
+            events = read_changes(name, since, limit)
+            if events:
+                changes[name] = events
+                self.positions[name] = events[-1]['seq']
+        return changes
+
+    def changed_keys(self, limit=None):
+        """Get {collection: (changed keys, removed keys)} since the last poll"""
+        summary = {}
+        for name, events in self.poll(limit).items():
+            changed, removed = set(), set()
+            for event in events:
+                changed.update(event['changed'])
+                changed.difference_update(event['removed'])
+                removed.update(event['removed'])
+                removed.difference_update(event['changed'])
+            summary[name] = (changed, removed)
+        return summary
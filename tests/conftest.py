@@ -0,0 +1,41 @@
+import sys
+
+import pytest
+
+def _reset_module_state(monkeypatch):
+    """Drop the in-process caches of every imported module so each test starts empty"""
+    storage = sys.modules.get('storage')
+    if storage is not None:
+        for name in ('_snapshots', '_key_indexes', '_log_tails', '_feed_index', '_locks'):
+            monkeypatch.setattr(storage, name, {})
+        monkeypatch.setattr(storage, '_partitioned', set())
+        monkeypatch.setattr(storage, '_recovered', False)
+    request_queue = sys.modules.get('request_queue')
+    if request_queue is not None:
+        monkeypatch.setattr(request_queue, '_state', request_queue._fresh_state())
+        monkeypatch.setattr(request_queue, '_initialized', False)
+    outreach = sys.modules.get('outreach')
+    if outreach is not None:
+        monkeypatch.setattr(outreach, '_state', {'offset': 0, 'seq': 0, 'requests': {},
+                                                 'deadlines': outreach.IndexedHeap()})
+    donor_locator = sys.modules.get('donor_locator')
+    if donor_locator is not None:
+        monkeypatch.setattr(donor_locator, '_grid_cache', {'seq': None, 'grid': None})
+    eligibility = sys.modules.get('eligibility')
+    if eligibility is not None:
+        monkeypatch.setattr(eligibility, '_built', False)
+    columnar = sys.modules.get('columnar')
+    if columnar is not None:
+        monkeypatch.setattr(columnar, '_tables', {})
+    inventory = sys.modules.get('inventory')
+    if inventory is not None:
+        monkeypatch.setattr(inventory, '_known_banks', set())
+        monkeypatch.setattr(inventory, '_shard_states', {})
+        monkeypatch.setattr(inventory, '_migrated', False)
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Run each test against an empty data directory"""
+    monkeypatch.chdir(tmp_path)
+    _reset_module_state(monkeypatch)
+    return tmp_path / "data"
@@ -0,0 +1,47 @@
+import alerts
+from alerts import alert_state_name, check_stock_alerts, get_active_alerts, set_alert_rule
+from blood_management import adjust_blood_inventory
+from storage import read_collection, read_snapshot, write_collection
+
+def active(blood_bank):
+    return {(a['blood_group'], a['level']) for a in get_active_alerts(blood_bank)}
+
+def test_first_check_covers_groups_the_ledger_never_touched():
+    assert adjust_blood_inventory("A+", 2000, "Bank A")
+
+    assert active("Bank A") == {(bg, 'critical') for bg in ["A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]}
+    assert check_stock_alerts("Bank A") == []
+
+def test_rule_changes_apply_without_new_stock_movements():
+    assert adjust_blood_inventory("A+", 2000, "Bank A")
+    set_alert_rule(low=3000, blood_group="A+")
+
+    assert check_stock_alerts("Bank A") == [("A+", 'ok', 'low')]
+    assert ("A+", 'low') in active("Bank A")
+    assert check_stock_alerts("Bank A") == []
+
+    set_alert_rule(low=1500, critical=2500, blood_bank="Bank B")
+    assert check_stock_alerts("Bank A") == []
+
+def test_unchanged_levels_lock_only_the_banks_own_state(monkeypatch):
+    assert adjust_blood_inventory("A+", 2000, "Bank A")
+    opened = []
+    transaction = alerts.transaction
+    def recording(*names):
+        opened.append(names)
+        return transaction(*names)
+    monkeypatch.setattr(alerts, "transaction", recording)
+    
+    assert adjust_blood_inventory("A+", 350, "Bank A")
+    
+    assert opened == [(alert_state_name("Bank A"),)]
+    assert read_snapshot(alert_state_name("Bank A"))['ledger_seq'] == 2
+
+def test_state_from_the_shared_file_seeds_each_bank():
+    assert adjust_blood_inventory("A+", 2000, "Bank A")
+    state = read_collection(alert_state_name("Bank A"))
+    write_collection(alert_state_name("Bank A"), [])
+    write_collection("stock_alerts", {'banks': {"Bank A": state}})
+    
+    assert check_stock_alerts("Bank A") == []
+    assert active("Bank A") == {(bg, 'critical') for bg in ["A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]}
@@ -0,0 +1,87 @@
+import itertools
+import random
+
+from allocation import URGENCY_WEIGHTS, allocate_requests, substitution_penalty
+from blood_management import check_blood_compatibility
+
+def make_request(i, group, urgency, quantity, required_date="2026-06-10"):
+    return {'id': f"r{i}", 'blood_group': group, 'urgency': urgency, 'quantity': quantity,
+            'required_date': required_date, 'date': f"2026-06-01T00:00:{i:02d}"}
+
+def value(allocations, requests):
+    by_id = {r['id']: r for r in requests}
+    return sum(a['quantity'] * (URGENCY_WEIGHTS[by_id[a['request_id']]['urgency']]
+                                - substitution_penalty(a['blood_group'], by_id[a['request_id']]['blood_group']))
+               for a in allocations)
+
+def best_value(requests, supply):
+    """Best objective over every integer split of stock between requests"""
+    pairs = [(bg, r) for bg, r in itertools.product(supply, requests)
+             if check_blood_compatibility(bg, r['blood_group'])]
+    best = 0
+    def place(k, left, need, total):
+        nonlocal best
+        if k == len(pairs):
+            best = max(best, total)
+            return
+        bg, request = pairs[k]
+        gain = URGENCY_WEIGHTS[request['urgency']] - substitution_penalty(bg, request['blood_group'])
+        for amount in range(min(left[bg], need[request['id']]) + 1):
+            left[bg] -= amount
+            need[request['id']] -= amount
+            place(k + 1, left, need, total + amount * gain)
+            left[bg] += amount
+            need[request['id']] += amount
+    place(0, dict(supply), {r['id']: r['quantity'] for r in requests}, 0)
+    return best
+
+def check_feasible(result, requests, stock_by_bank):
+    drawn = {}
+    for a in result['allocations']:
+        key = (a['blood_bank'], a['blood_group'])
+        drawn[key] = drawn.get(key, 0) + a['quantity']
+    assert all(stock_by_bank[bank][bg] >= quantity for (bank, bg), quantity in drawn.items())
+    by_id = {r['id']: r for r in requests}
+    for a in result['allocations']:
+        assert check_blood_compatibility(a['blood_group'], by_id[a['request_id']]['blood_group'])
+    for request in requests:
+        given = sum(a['quantity'] for a in result['allocations'] if a['request_id'] == request['id'])
+        assert given == result['fulfilled'][request['id']] <= request['quantity']
+
+def test_allocations_match_the_brute_force_optimum():
+    rng = random.Random(17)
+    for _ in range(60):
+        supply = {bg: rng.randint(0, 3) for bg in rng.sample(["O-", "O+", "A-", "A+", "AB+"], 2)}
+        requests = [make_request(i, rng.choice(["A+", "O+", "AB+", "A-"]), rng.choice(list(URGENCY_WEIGHTS)),
+                                 rng.randint(1, 3))
+                    for i in range(rng.randint(1, 3))]
+        stock_by_bank = {"North": {bg: q - q // 2 for bg, q in supply.items()},
+                         "South": {bg: q // 2 for bg, q in supply.items()}}
+        
+        result = allocate_requests(requests, stock_by_bank)
+        
+        check_feasible(result, requests, stock_by_bank)
+        assert value(result['allocations'], requests) == best_value(requests, supply), (supply, requests)
+
+def test_scarce_stock_goes_to_the_most_urgent_then_earliest():
+    requests = [make_request(1, "A+", "Low", 300), make_request(2, "A+", "Critical", 300, "2026-06-12"),
+                make_request(3, "A+", "Critical", 300, "2026-06-11")]
+    
+    result = allocate_requests(requests, {"City": {"A+": 450}})
+    
+    assert result['fulfilled'] == {"r1": 0, "r2": 150, "r3": 300}
+    assert result['unmet'] == {'Critical': 150, 'High': 0, 'Medium': 0, 'Low': 300}
+
+def test_exact_matches_are_issued_before_o_negative():
+    requests = [make_request(1, "A+", "High", 400)]
+    
+    result = allocate_requests(requests, {"City": {"O-": 500, "A+": 300}})
+    
+    assert sorted((a['blood_group'], a['quantity']) for a in result['allocations']) == [("A+", 300), ("O-", 100)]
+
+def test_o_negative_reserve_is_kept_for_priority_requests():
+    requests = [make_request(1, "B+", "Low", 500), make_request(2, "AB-", "High", 100)]
+    
+    result = allocate_requests(requests, {"City": {"O-": 500}}, o_neg_reserve=300)
+    
+    assert result['fulfilled'] == {"r1": 200, "r2": 100}
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+import columnar
+from blood_management import seal_history
+from columnar import ColumnTable, SCHEMAS, group_totals, read_table, table_path
+from storage import read_collection, write_collection
+
+def donation(i, month, group, quantity=450, bank="City"):
+    return {'id': f"d{i}", 'donor': f"don{i % 3}", 'blood_group': group, 'blood_bank': bank,
+            'quantity': quantity, 'date': f"{month}-{1 + i % 27:02d}T10:00:00"}
+
+def test_tables_survive_a_save_and_load(tmp_path):
+    records = [
+        donation(1, "2026-01", "A+"),
+        {'id': "d2", 'donor': "don2", 'blood_group': None, 'quantity': "300", 'date': "not a date"},
+        donation(3, "2026-02", "O-", quantity=None, bank="North"),
+    ]
+    table = ColumnTable.from_records(records, SCHEMAS['donations'])
+    
+    table.save(str(tmp_path / "t"))
+    loaded = ColumnTable.load(str(tmp_path / "t"), SCHEMAS['donations'])
+    
+    assert len(loaded) == 3
+    assert isinstance(loaded.columns['quantity'], np.memmap)
+    assert list(loaded.labels('blood_group')) == ["A+", None, "O-"]
+    assert list(loaded.labels('blood_bank')) == ["City", None, "North"]
+    assert loaded.columns['quantity'].tolist() == [450, 300, 0]
+    days = loaded.days('date')
+    assert str(days[0]) == "2026-01-02" and np.isnat(days[1]) and str(days[2]) == "2026-02-04"
+    assert loaded.sum_by('blood_group') == {"A+": 450}
+
+def test_concat_recodes_onto_one_vocabulary():
+    first = ColumnTable.from_records([donation(1, "2026-01", "O-"), donation(2, "2026-01", "A+")],
+                                     SCHEMAS['donations'])
+    second = ColumnTable.from_records([donation(3, "2026-02", "B+"), donation(4, "2026-02", None)],
+                                      SCHEMAS['donations'])
+    
+    both = ColumnTable.concat([first, second])
+    
+    assert both.categories['blood_group'] == ["A+", "B+", "O-"]
+    assert list(both.labels('blood_group')) == ["O-", "A+", "B+", None]
+    assert both.sum_by('blood_group', value=None) == {"A+": 1, "B+": 1, "O-": 1}
+
+def test_sealed_months_are_mapped_and_live_months_follow_commits():
+    records = [donation(i, month, group)
+               for i, (month, group) in enumerate([("2025-01", "A+"), ("2025-01", "O-"), ("2025-02", "A+"),
+                                                   ("2026-06", "A+"), ("2026-06", "B-")])]
+    write_collection("donations", records)
+    
+    assert seal_history(before="2026-01") == {'donations': ["2025-01", "2025-02"], 'requests': []}
+    
+    assert os.path.isdir(table_path("donations", "2025-01"))
+    tables = dict(columnar.iter_tables("donations"))
+    assert isinstance(tables["2025-01"].columns['quantity'], np.memmap)
+    assert not isinstance(tables["2026-06"].columns['quantity'], np.memmap)
+    assert group_totals("donations", "blood_group") == {"A+": 1350, "O-": 450, "B-": 450}
+    assert group_totals("donations", "blood_group", since="2026-01") == {"A+": 450, "B-": 450}
+    
+    write_collection("donations", read_collection("donations") + [donation(9, "2026-06", "O-", 200)])
+    assert group_totals("donations", "blood_group", value=None, blood_bank="City") == {"A+": 3, "O-": 2, "B-": 1}
+    assert read_table("donations").sum_by('blood_group') == {"A+": 1350, "O-": 650, "B-": 450}
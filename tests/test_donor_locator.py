@@ -0,0 +1,75 @@
+import random
+
+import donor_locator
+from donor_locator import DonorGrid, get_donor_grid
+from maps import get_distance_between_points
+from storage import write_collection
+
+def donors(rng, count, lat, lng, spread):
+    return [{'username': f"d{i}", 'user_type': 'donor', 'blood_group': rng.choice(["A+", "O-"]),
+             'lat': lat + rng.uniform(-spread, spread), 'lng': lng + rng.uniform(-spread, spread)}
+            for i in range(count)]
+
+def brute_force(users, groups, lat, lng, k, max_km=None, accept=None):
+    found = sorted((get_distance_between_points(lat, lng, u['lat'], u['lng']), u['username'])
+                   for u in users if u['blood_group'] in groups
+                   and (accept is None or accept([u['username']])))
+    return [d for d in found if max_km is None or d[0] <= max_km][:k]
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(11)
+    # Around the equator and far north, where longitude cells are narrow
+    for lat, lng in ((0.3, 36.8), (68.0, 15.0), (-33.9, 151.2)):
+        users = donors(rng, 300, lat, lng, 6.0)
+        grid = DonorGrid(users)
+        odd = lambda names: [n for n in names if int(n[1:]) % 2]
+        for _ in range(20):
+            q_lat, q_lng = lat + rng.uniform(-7, 7), lng + rng.uniform(-7, 7)
+            k = rng.choice([1, 5, 25])
+            max_km = rng.choice([None, 150.0])
+            accept = rng.choice([None, odd])
+            
+            found = grid.nearest(["A+", "O-"], q_lat, q_lng, k, max_km, accept)
+            
+            assert found == brute_force(users, ["A+", "O-"], q_lat, q_lng, k, max_km, accept)
+
+def test_search_stops_once_no_ring_can_hold_a_closer_donor(monkeypatch):
+    rng = random.Random(5)
+    grid = DonorGrid(donors(rng, 500, 10.0, 10.0, 20.0) + [
+        {'username': "near", 'user_type': 'donor', 'blood_group': "A+", 'lat': 10.01, 'lng': 10.01}
+    ])
+    rings = []
+    original = DonorGrid._ring
+    
+    def ring(self, group, center, radius):
+        rings.append(radius)
+        return original(self, group, center, radius)
+    
+    monkeypatch.setattr(DonorGrid, "_ring", ring)
+    
+    assert grid.nearest(["A+"], 10.0, 10.0, 1)[0][1] == "near"
+    assert max(rings) <= 1
+
+def test_unlocated_and_recipient_users_are_left_out():
+    grid = DonorGrid([
+        {'username': "a", 'user_type': 'donor', 'blood_group': "A+", 'lat': None, 'lng': 1.0},
+        {'username': "b", 'user_type': 'recipient', 'blood_group': "A+", 'lat': 1.0, 'lng': 1.0},
+        {'username': "c", 'user_type': 'donor', 'blood_group': "A+", 'lat': 1.0, 'lng': 1.0},
+    ])
+    
+    assert [name for _, name in grid.nearest(["A+"], 1.0, 1.0, 10)] == ["c"]
+
+def test_grid_follows_user_changes():
+    users = [{'username': f"d{i}", 'user_type': 'donor', 'blood_group': "A+", 'lat': 1.0 + i, 'lng': 1.0}
+             for i in range(3)]
+    write_collection("users", users)
+    first = get_donor_grid()
+    
+    users[2] = dict(users[2], lat=1.0)
+    del users[0]
+    write_collection("users", users)
+    
+    grid = get_donor_grid()
+    assert grid is first  # moved in place, not rebuilt
+    assert [name for _, name in grid.nearest(["A+"], 1.0, 1.0, 3)] == ["d2", "d1"]
+    assert donor_locator._grid_cache['seq'] == 2
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+import storage
+
+@pytest.fixture
+def syncer(monkeypatch):
+    """A fresh WAL syncer, so sync counts start at zero"""
+    fresh = storage.WalSyncer()
+    monkeypatch.setattr(storage, "_wal_syncer", fresh)
+    return fresh
+
+def commit(name, value):
+    with storage.transaction(name) as uow:
+        uow.set(name, value)
+
+def test_modes_apply_by_name_folder_and_feed():
+    assert storage.durability_for("users") == 'fsync'
+    assert storage.durability_for("notifications") == 'async'
+    assert storage.durability_for("stock_alerts/city-bank-1a2b3c4d") == 'group'
+    assert storage.durability_for(storage.change_feed_name("notifications")) == 'async'
+    with pytest.raises(ValueError):
+        storage.set_durability("users", 'never')
+
+def test_fsync_commits_are_synced_before_returning(syncer):
+    commit("users", [])  # the first transaction also leases an id node
+    before = storage.get_durability_metrics()
+    
+    commit("users", [{'username': "alice"}])
+    
+    after = storage.get_durability_metrics()
+    assert after['fsyncs'] == before['fsyncs'] + 1
+    assert after['group_fsyncs'] == after['background_fsyncs'] == after['unsynced'] == 0
+
+def test_async_commits_are_synced_in_the_background(syncer, monkeypatch):
+    monkeypatch.setattr(storage, "ASYNC_FLUSH_SECONDS", 0.05)
+    
+    for i in range(5):
+        commit("notifications", [{'id': f"n{i}"}])
+    
+    assert storage.get_durability_metrics()['unsynced'] == 5
+    deadline = time.monotonic() + 2
+    while storage.get_durability_metrics()['unsynced'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    metrics = storage.get_durability_metrics()
+    assert metrics['unsynced'] == 0
+    assert metrics['background_fsyncs'] == 1
+
+def test_concurrent_group_commits_share_syncs(syncer, monkeypatch):
+    original = storage._fsync_path
+    
+    def slow_fsync(path):
+        time.sleep(0.02)
+        original(path)
+    
+    monkeypatch.setattr(storage, "_fsync_path", slow_fsync)
+    start = threading.Barrier(8)
+    
+    def work(i):
+        start.wait()
+        commit(f"otps/{i}", {'code': i})
+    
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    metrics = storage.get_durability_metrics()
+    assert metrics['unsynced'] == 0
+    assert 1 <= metrics['group_fsyncs'] < 8
+
+def test_a_transaction_takes_its_strictest_mode(syncer, monkeypatch):
+    monkeypatch.setattr(storage, "ASYNC_FLUSH_SECONDS", 60)
+    
+    with storage.transaction("users", "notifications") as uow:
+        uow.set("users", [{'username': "alice"}])
+        uow.set("notifications", [{'id': "n1"}])
+    
+    assert storage.get_durability_metrics()['unsynced'] == 0
+    commit("notifications", [{'id': "n2"}])
+    assert storage.get_durability_metrics()['unsynced'] == 1
@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+
+import pytest
+
+import eligibility
+from blood_management import donate_blood
+from eligibility import defer_donor, filter_eligible, get_eligibility, is_eligible
+from storage import write_collection
+
+BANK = "City Blood Bank"
+FIRST = date(2026, 3, 2)
+
+def donate(donor, on):
+    return donate_blood(donor, "A+", 450, on, BANK)
+
+def test_donors_wait_56_days_between_donations():
+    assert donate("don1", FIRST)
+    
+    assert not donate("don1", FIRST + timedelta(days=55))
+    assert get_eligibility("don1", FIRST + timedelta(days=30)) == {
+        'eligible': False, 'next_eligible_date': "2026-04-27", 'last_donation': "2026-03-02"
+    }
+    assert is_eligible("don1", FIRST + timedelta(days=56))
+    assert donate("don1", FIRST + timedelta(days=56))
+
+def test_a_backdated_donation_also_needs_the_gap():
+    assert donate("don1", FIRST)
+    
+    assert not donate("don1", FIRST - timedelta(days=20))
+    assert donate("don1", FIRST - timedelta(days=56))
+    # The later donation still sets when the donor may give again
+    assert get_eligibility("don1", FIRST)['last_donation'] == "2026-03-02"
+
+def test_a_deferral_outlasting_the_interval_wins():
+    assert donate("don1", FIRST)
+    assert defer_donor("don1", FIRST + timedelta(days=90), reason="low haemoglobin")
+    
+    assert not is_eligible("don1", FIRST + timedelta(days=60))
+    assert not donate("don1", FIRST + timedelta(days=60))
+    assert get_eligibility("don1", FIRST + timedelta(days=60))['next_eligible_date'] == "2026-05-31"
+    assert donate("don1", FIRST + timedelta(days=90))
+
+@pytest.mark.parametrize("deferred_days,eligible", [(10, True), (70, False)])
+def test_filter_uses_the_later_of_deferral_and_interval(deferred_days, eligible):
+    assert donate("don1", FIRST)
+    defer_donor("don1", FIRST + timedelta(days=deferred_days))
+    day = FIRST + timedelta(days=60)
+    
+    assert filter_eligible(["don1", {'username': "don2"}], on=day) == (
+        ["don1", {'username': "don2"}] if eligible else [{'username': "don2"}]
+    )
+    assert is_eligible("don1", day) is eligible
+
+def test_index_is_built_from_existing_donations():
+    write_collection("donations", [
+        {'id': "d1", 'donor': "don1", 'date': "2026-01-10T09:00:00"},
+        {'id': "d2", 'donor': "don1", 'date': "2026-02-01"},
+    ])
+    
+    assert get_eligibility("don1", date(2026, 3, 1)) == {
+        'eligible': False, 'next_eligible_date': "2026-03-29", 'last_donation': "2026-02-01"
+    }
+    assert eligibility._built
@@ -0,0 +1,54 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from forecast import ALL_BANKS, HISTORY_DAYS, days_of_cover, forecast_frame, seasonal_forecast
+
+TODAY = date(2026, 6, 1)
+
+def test_forecast_repeats_the_weekly_shape_at_the_recent_level():
+    week = np.array([1, 1, 1, 1, 1, 3, 6], dtype=float)
+    history = np.vstack([
+        np.tile(week, 12),  # steady weekly pattern
+        np.concatenate([np.zeros(56), np.full(28, 7.0)]),  # flat, recently started
+        np.zeros(84),  # no history
+    ])
+    
+    forecast = seasonal_forecast(history, horizon=10)
+    
+    assert forecast.shape == (3, 10)
+    np.testing.assert_allclose(forecast[0], np.tile(week, 2)[:10])
+    # Its level is the recent mean, its days shaped by the whole history
+    np.testing.assert_allclose(forecast[1], 7.0 * np.ones(10))
+    assert not forecast[2].any()
+
+def test_days_of_cover_counts_whole_days_before_stock_runs_out():
+    demand = np.array([[30.0] * 5, [10.0] * 5, [50.0, 0, 0, 0, 60]])
+    supply = np.array([[0.0] * 5, [10.0] * 5, [0.0] * 5])
+    
+    cover = days_of_cover([100, 0, 60], demand, supply)
+    
+    assert cover.tolist() == [3, np.inf, 4]
+
+def test_frame_has_one_row_per_bank_group_and_an_all_banks_total():
+    requests, donations = [], []
+    for back in range(1, HISTORY_DAYS + 1):
+        day = (TODAY - timedelta(days=back)).isoformat()
+        requests.append({'fulfilled_from': "City", 'blood_group': "A+", 'date': day, 'quantity': 100})
+        requests.append({'fulfilled_from': None, 'blood_group': "A+", 'date': day, 'quantity': 50})
+        donations.append({'blood_bank': "North", 'blood_group': "A+", 'date': day, 'quantity': 120})
+    stock = {"City": {"A+": 700, "O-": 0}, "North": {"A+": 0, "O-": 0}}
+    
+    frame = forecast_frame(requests, donations, stock, today=TODAY, horizon=14).set_index(['blood_bank', 'blood_group'])
+    
+    assert sorted(frame.index) == sorted((bank, group) for bank in ("City", "North", ALL_BANKS)
+                                          for group in ("A+", "O-"))
+    assert frame.loc[("City", "A+"), 'demand_per_day'] == 100
+    # Unfulfilled requests count toward the national demand only
+    assert frame.loc[(ALL_BANKS, "A+"), 'demand_per_day'] == 150
+    assert frame.loc[(ALL_BANKS, "A+"), 'supply_per_day'] == 120
+    assert frame.loc[("City", "A+"), 'days_of_cover'] == 7
+    # 700 ml falling by 30 ml a day outlasts the horizon
+    assert np.isinf(frame.loc[(ALL_BANKS, "A+"), 'days_of_cover'])
+    assert np.isinf(frame.loc[("North", "O-"), 'days_of_cover'])
+    assert len(frame.loc[("North", "A+"), 'supply']) == 14
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+import storage
+
+def submit_all(committer, operations):
+    """Submit every operation from its own thread at once; returns each one's result or error"""
+    outcomes = [None] * len(operations)
+    start = threading.Barrier(len(operations))
+
+    def call(i):
+        start.wait()
+        try:
+            outcomes[i] = ('ok', committer.submit(("notifications",), operations[i]))
+        except Exception as e:
+            outcomes[i] = ('error', e)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(operations))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+def notify(i, ran=None):
+    def operation(uow):
+        if ran is not None:
+            ran.append(i)
+        uow.get("notifications").append({'id': f"n{i}"})
+        return i
+    return operation
+
+def stored_ids():
+    return [n['id'] for n in storage.read_collection("notifications")]
+
+def test_concurrent_calls_share_commits_in_submission_order():
+    committer = storage.GroupCommitter(window=0.05)
+    ran = []
+
+    outcomes = submit_all(committer, [notify(i, ran) for i in range(8)])
+
+    assert outcomes == [('ok', i) for i in range(8)]
+    # Each call ran once, seeing the calls before it, and was stored in that order
+    assert sorted(ran) == list(range(8))
+    assert stored_ids() == [f"n{i}" for i in ran]
+    assert committer.metrics['calls'] == 8
+    assert committer.metrics['batches'] < 8
+    assert committer.metrics['fallbacks'] == 0
+
+def test_a_failing_call_leaves_every_other_call_committed_once():
+    committer = storage.GroupCommitter(window=0.05)
+
+    def fail(uow):
+        uow.get("notifications").append({'id': "bad"})
+        raise ValueError("invalid notification")
+
+    def discard(uow):
+        uow.get("notifications").append({'id': "discarded"})
+        uow.discard()
+        return "discarded"
+
+    operations = [notify(i) for i in range(6)]
+    operations[2] = fail
+    operations[4] = discard
+    outcomes = submit_all(committer, operations)
+
+    assert outcomes[2][0] == 'error' and isinstance(outcomes[2][1], ValueError)
+    assert outcomes[4] == ('ok', "discarded")
+    assert [o for i, o in enumerate(outcomes) if i not in (2, 4)] == [('ok', i) for i in (0, 1, 3, 5)]
+    assert sorted(stored_ids()) == ["n0", "n1", "n3", "n5"]
+    assert committer.metrics['fallbacks'] >= 1
+
+def test_acknowledged_calls_survive_a_crash_before_files_are_written(monkeypatch):
+    committer = storage.GroupCommitter(window=0.05)
+    with monkeypatch.context() as patch:
+        # The commit is logged, then the process dies before applying it
+        patch.setattr(storage, "_atomic_write", lambda name, data, durable=True: None)
+        outcomes = submit_all(committer, [notify(i) for i in range(5)])
+    assert outcomes == [('ok', i) for i in range(5)]
+    assert stored_ids() == []
+
+    monkeypatch.setattr(storage, "_recovered", False)
+    storage._snapshots.clear()
+    assert sorted(stored_ids()) == [f"n{i}" for i in range(5)]
+
+@pytest.mark.parametrize("batch_size", [1, 3])
+def test_batches_never_exceed_their_limit(batch_size):
+    committer = storage.GroupCommitter(window=0.05, max_batch=batch_size)
+
+    outcomes = submit_all(committer, [notify(i) for i in range(7)])
+
+    assert outcomes == [('ok', i) for i in range(7)]
+    assert sorted(stored_ids()) == sorted(f"n{i}" for i in range(7))
+    assert committer.metrics['max_batch'] <= batch_size
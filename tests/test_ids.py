@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import ids
+from storage import in_transaction, transaction
+
+def node_of(record_id):
+    return (record_id >> (ids.SLOT_BITS + ids.SEQUENCE_BITS)) & ids.MAX_NODE
+
+@pytest.fixture
+def leases(monkeypatch):
+    """Record each lease taken, and whether a transaction was open at the time"""
+    taken = []
+    def lease(current=None, now=None):
+        taken.append(in_transaction())
+        return 7
+    monkeypatch.setattr(ids, "lease_node_id", lease)
+    monkeypatch.setattr(ids, "_renewer", {'thread': "started"})
+    return taken
+
+def test_processes_lease_different_nodes(monkeypatch):
+    monkeypatch.setattr(ids, "_node_owner", lambda: "host:1")
+    first = ids.lease_node_id()
+    monkeypatch.setattr(ids, "_node_owner", lambda: "host:2")
+    second = ids.lease_node_id()
+    
+    assert first != second
+    # Renewing keeps the node while the lease is ours
+    assert ids.lease_node_id(second) == second
+
+def test_expired_node_lease_is_taken_over(monkeypatch):
+    now = datetime(2026, 1, 1, 12, 0)
+    monkeypatch.setattr(ids, "_node_owner", lambda: "host:1")
+    node = ids.lease_node_id(now=now)
+    
+    monkeypatch.setattr(ids, "_node_owner", lambda: "host:2")
+    assert ids.lease_node_id(now=now) != node
+    later = now + timedelta(seconds=ids.NODE_LEASE_SECONDS + 1)
+    assert ids.lease_node_id(now=later) == node
+    
+    # The first process finds its node taken and moves to another
+    monkeypatch.setattr(ids, "_node_owner", lambda: "host:1")
+    assert ids.lease_node_id(node, now=later) != node
+
+def test_ids_carry_the_leased_node(monkeypatch):
+    monkeypatch.setattr(ids, "_node", {'id': None, 'renew_at_ms': 0, 'expires_ms': 0})
+    
+    node = node_of(ids.next_id())
+    
+    assert node == ids._node['id']
+    assert ids.lease_node_id(node) == node
+
+def test_first_lease_is_taken_before_a_transaction_locks(monkeypatch, leases):
+    monkeypatch.setattr(ids, "_node", {'id': None, 'renew_at_ms': 0, 'expires_ms': 0})
+    
+    with transaction("notifications"):
+        assert node_of(ids.next_id()) == 7
+    
+    assert leases == [False]
+
+def test_minting_inside_a_transaction_never_renews(monkeypatch, leases):
+    far = ids._now_ms() + 60_000
+    monkeypatch.setattr(ids, "_node", {'id': 3, 'renew_at_ms': far, 'expires_ms': far})
+    
+    with transaction("notifications"):
+        ids._node['renew_at_ms'] = 0  # falls due mid-transaction
+        assert node_of(ids.next_id()) == 3
+    assert leases == []
+    
+    # The next transaction renews before taking its locks
+    with transaction("notifications"):
+        pass
+    assert leases == [False]
@@ -0,0 +1,74 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import inventory
+from storage import transaction
+
+BANK = "City Bank"
+
+def days_ago(days):
+    return (datetime.now() - timedelta(days=days)).isoformat()
+
+def stock_lots(*lots):
+    """Credit O+ lots of (ml, days since collection) to BANK"""
+    inventory.ensure_shard(BANK)
+    with transaction(inventory.ledger_name(BANK)) as uow:
+        for quantity, age in lots:
+            inventory.credit(uow, "O+", BANK, quantity, collected=days_ago(age))
+
+def take(quantity):
+    with transaction(inventory.ledger_name(BANK)) as uow:
+        inventory.debit(uow, "O+", BANK, quantity)
+
+def lot_quantities():
+    return [lot['quantity'] for lot in inventory.get_lots(BANK, "O+")]
+
+def test_debits_take_the_lots_that_expire_first():
+    stock_lots((300, 2), (200, 30), (250, 10))
+    
+    take(350)
+    
+    # The 30-day lot goes first, then the 10-day one, whatever order they came in
+    assert lot_quantities() == [100, 300]
+    assert inventory.get_stock(BANK)["O+"] == 400
+
+def test_expired_lots_are_neither_counted_nor_debited():
+    stock_lots((400, 50), (150, 5))
+    
+    assert inventory.get_stock(BANK)["O+"] == 150
+    assert inventory.get_stock()["O+"] == 150
+    with pytest.raises(inventory.InsufficientStock):
+        take(200)
+    take(150)
+    assert inventory.get_stock(BANK)["O+"] == 0
+
+def test_sweep_writes_off_only_expired_lots():
+    stock_lots((400, 50), (100, 43), (150, 5))
+    
+    assert inventory.sweep_expired_lots() == {BANK: {"O+": 500}}
+    
+    assert lot_quantities() == [150]
+    assert inventory.get_stock(BANK)["O+"] == 150
+    assert inventory.sweep_expired_lots() == {}
+    # Once the shelf life runs out the last lot goes too
+    later = datetime.now() + timedelta(days=inventory.SHELF_LIFE_DAYS)
+    assert inventory.sweep_expired_lots(now=later) == {BANK: {"O+": 150}}
+
+def test_opening_balances_are_dated_from_the_legacy_file(data_dir):
+    data_dir.mkdir()
+    legacy = data_dir / "blood_inventory.json"
+    legacy.write_text(json.dumps({"O+": 500, "A-": 200}))
+    written = datetime.now() - timedelta(days=inventory.SHELF_LIFE_DAYS + 1)
+    os.utime(legacy, (written.timestamp(), written.timestamp()))
+    
+    inventory.migrate_legacy_inventory()
+    
+    lots = inventory.get_lots(inventory.UNASSIGNED_BANK)
+    assert {lot['blood_group'] for lot in lots} == {"O+", "A-"}
+    assert all(lot['age_known'] is False for lot in lots)
+    assert all(lot['collected'] == written.isoformat() for lot in lots)
+    # Stock of unknown age past its shelf life is not offered as usable
+    assert inventory.get_stock(inventory.UNASSIGNED_BANK) == inventory.empty_totals()
@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta
+
+import outreach
+from blood_management import request_blood
+from outreach import advance_outreach, get_outreach_status
+from request_management import update_request_status
+from storage import read_collection, write_collection
+
+def donor(username, lat=None, lng=None):
+    return {'username': username, 'user_type': "donor", 'blood_group': "O-",
+            'email': f"{username}@example.com", 'lat': lat, 'lng': lng}
+
+def contacted_emails():
+    return [n['recipient'] for n in read_collection("notifications") if n['type'] == "email"]
+
+def located_request():
+    result = request_blood("rec1", "A+", 1000, "Critical", date.today() + timedelta(days=2),
+                           "surgery", "555", lat=12.97, lng=77.59)
+    return result['request_id']
+
+def test_located_request_reaches_donors_without_a_location_in_growing_waves():
+    write_collection("users", [donor(f"donor{i}") for i in range(100)])
+    request_id = located_request()
+    now = datetime.now()
+    
+    # No ring holds anyone, yet the first wave stays at its usual size
+    assert advance_outreach(now) == {'waves': 1, 'donors': 5, 'closed': 0}
+    assert advance_outreach(now + timedelta(hours=1)) == {'waves': 1, 'donors': 10, 'closed': 0}
+    assert len(set(contacted_emails())) == 15
+    assert get_outreach_status(request_id)['wave'] == 2
+
+def test_empty_rings_widen_the_reach_without_growing_the_wave():
+    write_collection("users", [donor(f"far{i}", 15.5, 77.59) for i in range(20)])
+    request_id = located_request()
+    
+    assert advance_outreach() == {'waves': 1, 'donors': 5, 'closed': 0}
+    status = get_outreach_status(request_id)
+    assert status['wave'] == 1 and status['radius_km'] == 320
+
+def test_request_cancelled_while_its_wave_is_picked_gets_no_wave(monkeypatch):
+    write_collection("users", [donor(f"donor{i}") for i in range(20)])
+    request_id = located_request()
+    next_wave = outreach._next_wave
+    
+    def cancel_meanwhile(*args):
+        assert update_request_status(request_id, "cancelled")
+        return next_wave(*args)
+    monkeypatch.setattr(outreach, "_next_wave", cancel_meanwhile)
+    
+    assert advance_outreach() == {'waves': 0, 'donors': 0, 'closed': 1}
+    assert contacted_emails() == []
+
+def test_donors_without_a_location_come_after_located_ones():
+    write_collection("users", [donor("far", 13.9, 77.59), donor("near", 12.98, 77.6), donor("unlocated")])
+    request_id = located_request()
+    now = datetime.now()
+    
+    advance_outreach(now)
+    assert contacted_emails() == ["near@example.com"]
+    
+    advance_outreach(now + timedelta(hours=1))
+    assert contacted_emails() == ["near@example.com", "far@example.com"]
+    
+    advance_outreach(now + timedelta(hours=2))
+    assert contacted_emails() == ["near@example.com", "far@example.com", "unlocated@example.com"]
+    
+    # Nobody is left to contact, so the next deadline closes the outreach
+    assert advance_outreach(now + timedelta(hours=3))['closed'] == 1
+    assert get_outreach_status(request_id) is None
@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import ids
+import storage
+
+def id_at(when):
+    """Make a request ID minted at ``when``"""
+    millis = int(when.timestamp() * 1000)
+    return f"REQ_{(millis - ids.EPOCH_MS) << ids.TIME_SHIFT:0{ids.ID_DIGITS}d}"
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    def use(name):
+        monkeypatch.setenv("TZ", name)
+        time.tzset()
+    yield use
+    monkeypatch.undo()
+    time.tzset()
+
+def test_partition_month_does_not_depend_on_the_local_timezone(local_timezone):
+    request_id = id_at(datetime(2026, 1, 31, 23, 30, tzinfo=timezone.utc))
+    
+    for name in ("Asia/Tokyo", "America/Los_Angeles", "UTC"):
+        local_timezone(name)
+        assert storage.partition_of("requests", request_id) == "requests/2026-01"
+
+def test_records_filed_under_local_months_are_moved(local_timezone):
+    late = id_at(datetime(2026, 1, 31, 23, 30, tzinfo=timezone.utc))
+    early = id_at(datetime(2026, 1, 10, tzinfo=timezone.utc))
+    # Filed by a process running in Tokyo under the old local-time months,
+    # and January since sealed
+    storage.write_collection("requests/2026-01", [{'id': early, 'status': 'fulfilled'}])
+    storage.write_collection("requests/2026-02", [{'id': late, 'status': 'pending'}])
+    storage.write_collection("requests/manifest", {'migrated': True, 'partitions': {
+        '2026-01': {'count': 1, 'sealed': True, 'compressed': False},
+        '2026-02': {'count': 1, 'sealed': False, 'compressed': False},
+    }})
+    storage._partitioned.discard("requests")
+    
+    assert storage.read_record("requests", late)[0]['status'] == 'pending'
+    assert storage.compare_and_swap("requests", late, 0, {'id': late, 'status': 'expired'})
+    
+    manifest = storage.read_collection("requests/manifest")
+    assert manifest['utc_months']
+    assert {month: entry['count'] for month, entry in manifest['partitions'].items()} == {'2026-01': 2, '2026-02': 0}
+    # January changed, so it is open until sealing comes round again
+    assert not manifest['partitions']['2026-01']['sealed']
+    assert [r['id'] for r in storage.read_collection("requests")] == [early, late]
+
+def test_readers_never_see_a_commit_half_applied(monkeypatch):
+    january = id_at(datetime(2026, 1, 10, tzinfo=timezone.utc))
+    february = id_at(datetime(2026, 2, 10, tzinfo=timezone.utc))
+    storage.write_collection("requests", [{'id': january, 'status': 'pending'},
+                                          {'id': february, 'status': 'pending'}])
+    seen = []
+    write = storage._atomic_write
+    
+    def write_then_read(name, data, durable=True):
+        write(name, data, durable)
+        if name == "requests/2026-01":
+            # Another thread reads while only one partition is written
+            reader = threading.Thread(target=lambda: seen.append(storage.read_collection("requests")))
+            reader.start()
+            reader.join(0.1)
+            seen.append(reader)
+    monkeypatch.setattr(storage, "_atomic_write", write_then_read)
+    
+    with storage.transaction("requests") as uow:
+        for record in uow.get("requests"):
+            record['status'] = 'fulfilled'
+    seen[0].join()
+    
+    assert [r['status'] for r in seen[1]] == ['fulfilled', 'fulfilled']
+
+def test_a_single_file_collection_is_split_into_months(data_dir):
+    january = id_at(datetime(2026, 1, 10, tzinfo=timezone.utc))
+    march = id_at(datetime(2026, 3, 2, tzinfo=timezone.utc))
+    legacy = [{'id': march, 'status': 'pending'},
+              {'id': "OLD-1", 'date': "2025-11-20T08:00:00", 'status': 'fulfilled'},
+              {'id': january, 'status': 'cancelled'},
+              {'status': 'fulfilled'}]
+    data_dir.mkdir()
+    (data_dir / "requests.json").write_text(json.dumps(legacy))
+    
+    assert storage.list_partitions("requests") == [storage.LEGACY_PARTITION, "2025-11", "2026-01", "2026-03"]
+    
+    # Oldest month first; records with no time at all come before every month
+    assert storage.read_collection("requests") == [legacy[3], legacy[1], legacy[2], legacy[0]]
+    assert storage.read_record("requests", march)[0]['status'] == 'pending'
+    assert [r['id'] for r in storage.read_partitioned("requests", since="2026-01")] == [january, march]
+    manifest = storage.read_collection("requests/manifest")
+    assert manifest['migrated'] and manifest['utc_months']
+    assert {month: entry['count'] for month, entry in manifest['partitions'].items()} == {
+        storage.LEGACY_PARTITION: 1, "2025-11": 1, "2026-01": 1, "2026-03": 1
+    }
+    # The old file stays behind, untouched, as a backup
+    assert json.loads((data_dir / "requests.json").read_text()) == legacy
+
+def test_sealed_months_are_compressed_and_read_only(data_dir):
+    months = [datetime(2026, m, 5, tzinfo=timezone.utc) for m in (1, 2, 3, 4)]
+    ids_by_month = [id_at(when) for when in months]
+    statuses = ['fulfilled', 'pending', 'fulfilled', 'pending']
+    storage.write_collection("requests", [{'id': i, 'status': s} for i, s in zip(ids_by_month, statuses)])
+    
+    sealed = storage.seal_partitions("requests", before="2026-04",
+                                     can_seal=lambda records: all(r['status'] != 'pending' for r in records))
+    
+    assert sealed == ["2026-01", "2026-03"]
+    assert storage.list_partitions("requests", sealed=True) == ["2026-01", "2026-03"]
+    assert storage.list_partitions("requests", sealed=False) == ["2026-02", "2026-04"]
+    assert (data_dir / "requests" / "2026-01.json.gz").exists()
+    assert not (data_dir / "requests" / "2026-01.json").exists()
+    storage._snapshots.clear()
+    assert [r['id'] for r in storage.read_collection("requests")] == ids_by_month
+    with pytest.raises(storage.SealedPartition):
+        storage.compare_and_swap("requests", ids_by_month[0], 0, {'id': ids_by_month[0], 'status': 'expired'})
+    # Open months still take writes
+    assert storage.compare_and_swap("requests", ids_by_month[1], 0, {'id': ids_by_month[1], 'status': 'expired'})
+    assert storage.seal_partitions("requests", before="2026-04") == ["2026-02"]
@@ -0,0 +1,36 @@
+from records import Request, RequestStatus, User
+
+LEGACY_REQUEST = {
+    'id': "req_1", 'requester': "rec1", 'blood_group': "A+", 'quantity': 450,
+    'urgency': "High", 'required_date': "2024-01-10", 'reason': "surgery",
+    'contact_info': "555", 'date': "2024-01-01T10:00:00", 'status': "pending",
+    'ward': "B2",
+}
+
+LEGACY_USER = {
+    'username': "donor1", 'email': "donor1@example.com", 'phone': "555",
+    'password': "hash", 'user_type': "donor", 'registration_date': "2023-05-01",
+    'blood_group': "O-", 'age': 30, 'fulfilled_from': None,
+}
+
+def test_legacy_dicts_round_trip_unchanged():
+    assert Request.from_storage(LEGACY_REQUEST).to_storage() == LEGACY_REQUEST
+    assert User.from_storage(LEGACY_USER).to_storage() == LEGACY_USER
+
+def test_explicit_nulls_are_kept():
+    stored = dict(LEGACY_REQUEST, lat=None, lng=None, fulfilled_from=None)
+
+    assert Request.from_storage(stored).to_storage() == stored
+
+def test_fields_set_after_loading_are_stored():
+    request = Request.from_storage(LEGACY_REQUEST)
+    request.status = RequestStatus.FULFILLED
+    request.version = 1
+
+    assert request.to_storage() == dict(LEGACY_REQUEST, status="fulfilled", version=1)
+
+def test_new_records_leave_out_unset_optional_fields():
+    stored = Request(id="req_2", requester="rec1", blood_group="B+").to_storage()
+
+    assert 'fulfilled_from' not in stored and 'updated_at' not in stored
+    assert stored['lat'] is None and stored['version'] == 0
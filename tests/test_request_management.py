@@ -0,0 +1,137 @@
+from datetime import date, timedelta
+
+import pytest
+
+import request_management
+from auth import register_user
+from blood_management import donate_blood, request_blood
+from inventory import get_stock
+from request_queue import QUEUE_LOG, URGENCY_ORDER, enqueue, iter_pending_ids
+from request_management import (
+    fulfill_request, get_pending_requests_for_donor, get_pending_requests_page, update_request_status
+)
+from storage import read_record, transaction
+
+BANK = "City Blood Bank"
+
+@pytest.fixture
+def request_id():
+    result = request_blood("rec1", "A+", 350, "High", date.today() + timedelta(days=3), "surgery", "555")
+    return result['request_id']
+
+def test_pending_request_can_be_cancelled(request_id):
+    assert update_request_status(request_id, "cancelled")
+    assert read_record("requests", request_id)[0]['status'] == "cancelled"
+
+@pytest.mark.parametrize("new_status", ["pending", "cancelled"])
+def test_fulfilled_request_cannot_change_status(request_id, new_status):
+    assert donate_blood("don1", "A+", 450, date.today(), BANK)
+    assert fulfill_request(request_id, BANK)['success']
+    
+    assert not update_request_status(request_id, new_status)
+    assert read_record("requests", request_id)[0]['status'] == "fulfilled"
+
+def test_requests_are_only_fulfilled_with_a_stock_debit(request_id):
+    assert donate_blood("don1", "A+", 450, date.today(), BANK)
+    
+    assert not update_request_status(request_id, "fulfilled")
+    assert read_record("requests", request_id)[0]['status'] == "pending"
+    assert get_stock(BANK)["A+"] == 450
+    
+    assert fulfill_request(request_id, BANK)['success']
+    assert read_record("requests", request_id)[0]['status'] == "fulfilled"
+    assert get_stock(BANK)["A+"] == 100
+
+def test_cancelled_request_cannot_be_reopened(request_id):
+    assert update_request_status(request_id, "cancelled")
+    
+    assert not update_request_status(request_id, "pending")
+    assert read_record("requests", request_id)[0]['status'] == "cancelled"
+
+@pytest.fixture
+def backlog():
+    """An O- donor, who can give to every group, and 23 requests in a known order"""
+    register_user("don1", "don1@example.com", "555", "pw", "Donor", blood_group="O-")
+    urgencies = ["Low", "Critical", "Medium", "High"]
+    groups = ["A+", "B-", "O+", "AB-"]
+    ids = []
+    for i in range(23):
+        required = date.today() + timedelta(days=1 + (i * 7) % 11)
+        result = request_blood("rec1", groups[i % 4], 100 + i, urgencies[i % 4], required, "surgery", "555")
+        ids.append(result['request_id'])
+    # Overdue, but not yet expired by the sweeper
+    request_blood("rec1", "A+", 100, "Critical", date.today() - timedelta(days=1), "surgery", "555")
+    return ids
+
+def page_ids(**kwargs):
+    page = get_pending_requests_page("don1", **kwargs)
+    return [request.id for request in page['requests']], page
+
+def test_pages_split_the_full_list_in_queue_order(backlog):
+    everything = [request.id for request in get_pending_requests_for_donor("don1")]
+    assert sorted(everything) == sorted(backlog)
+    
+    pages = [page_ids(page=n, page_size=5) for n in range(1, 6)]
+    
+    assert [ids for ids, _ in pages] == [everything[i:i + 5] for i in range(0, 23, 5)]
+    assert {(p['total'], p['pages']) for _, p in pages} == {(23, 5)}
+
+def test_pages_past_either_end_are_clamped(backlog):
+    last, page = page_ids(page=99, page_size=10)
+    
+    assert page['page'] == 3 and len(last) == 3
+    assert page_ids(page=0, page_size=10)[1]['page'] == 1
+
+@pytest.mark.parametrize("sort_by,key", [
+    ('required_date', lambda r: (r.required_date, URGENCY_ORDER[r.urgency.value])),
+    ('newest', lambda r: r.date),
+])
+def test_other_orders_match_sorting_the_full_list(backlog, sort_by, key):
+    everything = get_pending_requests_for_donor("don1")
+    expected = [r.id for r in sorted(everything, key=key, reverse=sort_by == 'newest')]
+    
+    pages = [page_ids(page=n, page_size=4, sort_by=sort_by)[0] for n in range(1, 7)]
+    
+    assert sum(pages, []) == expected
+
+def test_filters_narrow_the_total_and_the_pages(backlog):
+    cutoff = date.today() + timedelta(days=5)
+    everything = get_pending_requests_for_donor("don1")
+    expected = [r.id for r in everything
+                if r.urgency.value in ("Critical", "High") and r.blood_group.value != "B-"
+                and r.required_date <= cutoff.isoformat()]
+    
+    ids, page = page_ids(page_size=50, urgencies=["Critical", "High"],
+                         blood_groups=["A+", "O+", "AB-"], required_before=cutoff)
+    
+    assert ids == expected
+    assert page['total'] == len(expected) > 0
+    # Without a date cutoff the total comes from the queue's counts
+    assert page_ids(urgencies=["Critical"])[1]['total'] == 6
+
+def test_overdue_requests_expire_in_batches(monkeypatch):
+    today = date.today()
+    overdue = [request_blood("rec1", "A+", 100, "High", today - timedelta(days=d), "surgery", "555")['request_id']
+               for d in range(1, 6)]
+    current = request_blood("rec1", "A+", 100, "High", today, "surgery", "555")['request_id']
+    assert update_request_status(overdue[0], "cancelled")
+    batches = []
+    original = request_management.iter_overdue_ids
+    monkeypatch.setattr(request_management, "iter_overdue_ids",
+                        lambda cutoff, limit: batches.append(original(cutoff, limit)) or batches[-1])
+    
+    assert request_management.expire_overdue_requests(batch_size=2) == 4
+    
+    assert [len(batch) for batch in batches] == [2, 2, 0]
+    assert [read_record("requests", i)[0]['status'] for i in overdue] == ["cancelled"] + ["expired"] * 4
+    assert read_record("requests", current)[0]['status'] == "pending"
+    assert iter_pending_ids() == [current]
+    assert request_management.expire_overdue_requests() == 0
+
+def test_queued_ids_without_a_request_are_dropped_by_expiry():
+    with transaction(QUEUE_LOG) as uow:
+        enqueue(uow, {'id': "REQ_gone", 'urgency': "Low", 'required_date': "2020-01-01",
+                      'date': "2020-01-01", 'blood_group': "A+"})
+    
+    assert request_management.expire_overdue_requests() == 0
+    assert iter_pending_ids() == []
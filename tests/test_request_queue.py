@@ -0,0 +1,86 @@
+import random
+
+import request_queue
+from request_queue import IndexedHeap, QUEUE_LOG, QUEUE_SNAPSHOT, enqueue, dequeue, iter_pending_ids
+from storage import read_snapshot, transaction
+
+def pending(request_id, urgency, required_date, group="A+"):
+    return {'id': request_id, 'urgency': urgency, 'required_date': required_date,
+            'date': f"2026-01-01T00:00:{request_id[-2:]}", 'blood_group': group, 'status': 'pending'}
+
+def queue(*requests):
+    with transaction(QUEUE_LOG) as uow:
+        for request in requests:
+            enqueue(uow, request)
+
+def drop(*request_ids):
+    with transaction(QUEUE_LOG) as uow:
+        for request_id in request_ids:
+            dequeue(uow, request_id)
+
+def reopen(monkeypatch):
+    """Forget the in-process queue, as a new process would"""
+    monkeypatch.setattr(request_queue, '_state', request_queue._fresh_state())
+
+def test_heap_matches_a_sorted_list_through_random_operations():
+    rng = random.Random(3)
+    heap = IndexedHeap()
+    reference = {}
+    for _ in range(2000):
+        item_id = f"r{rng.randrange(60)}"
+        if rng.random() < 0.3:
+            heap.remove(item_id)
+            reference.pop(item_id, None)
+        else:
+            # Queue keys end with the request id, so they never tie
+            key = (rng.randrange(4), rng.randrange(30), item_id)
+            heap.push(item_id, key)
+            reference[item_id] = key
+        expected = sorted((key, item_id) for item_id, key in reference.items())
+        assert heap.peek() == (expected[0] if expected else None)
+    
+    assert list(heap.iter_entries()) == expected
+    assert len(heap) == len(reference)
+
+def test_requests_come_out_by_urgency_then_required_date():
+    queue(pending("r01", "Low", "2026-01-02"), pending("r02", "Critical", "2026-01-09"),
+          pending("r03", "High", "2026-01-03"), pending("r04", "Critical", "2026-01-04"),
+          pending("r05", "Unknown", "2026-01-01"))
+    
+    assert iter_pending_ids() == ["r04", "r02", "r03", "r01", "r05"]
+    # Re-queueing moves a request rather than duplicating it
+    queue(pending("r01", "Critical", "2026-01-01"))
+    drop("r03", "missing")
+    assert iter_pending_ids() == ["r01", "r04", "r02", "r05"]
+
+def test_compaction_keeps_the_order_for_new_readers(monkeypatch):
+    monkeypatch.setattr(request_queue, 'SNAPSHOT_EVERY', 10)
+    queue(*(pending(f"r{i:02}", ["Low", "High", "Critical"][i % 3], f"2026-01-{i + 1:02}", ["A+", "O-"][i % 2])
+            for i in range(12)))
+    drop("r04", "r07")
+    before = iter_pending_ids()
+    
+    request_queue.maybe_compact()
+    assert read_snapshot(QUEUE_SNAPSHOT)['seq'] == 14
+    queue(pending("r20", "Critical", "2026-01-01"))
+    drop("r00")
+    expected = ["r20"] + [i for i in before if i != "r00"]
+    
+    reopen(monkeypatch)
+    assert iter_pending_ids() == expected
+    assert request_queue.count_pending(["O-"]) == 5
+    # Readers with an in-process copy pick up the later log tail too
+    assert request_queue.iter_pending_entries(["A+"], limit=2)[0][1] == "r20"
+
+def test_queue_is_built_once_from_stored_requests(monkeypatch):
+    stored = [pending("r01", "Low", "2026-01-02"), pending("r02", "High", "2026-01-03"),
+              dict(pending("r03", "Critical", "2026-01-01"), status='fulfilled')]
+    monkeypatch.setattr(request_queue, 'read_collection', lambda name: stored)
+    
+    assert iter_pending_ids() == ["r02", "r01"]
+    
+    reopen(monkeypatch)
+    monkeypatch.setattr(request_queue, '_initialized', False)
+    stored.append(pending("r04", "Critical", "2026-01-05"))
+    assert iter_pending_ids() == ["r02", "r01"]  # not rebuilt from requests again
+    assert request_queue.pending_count() == 2
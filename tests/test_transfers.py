@@ -0,0 +1,55 @@
+import itertools
+import random
+
+import numpy as np
+
+from transfers import solve_transport
+
+INF = np.inf
+
+def brute_force(cost, supply, demand):
+    """(most that can move, cheapest cost of moving it) over every integer plan"""
+    cells = [(r, c) for r, c in itertools.product(range(len(supply)), range(len(demand)))
+             if np.isfinite(cost[r][c])]
+    best = (0, 0.0)
+    def place(k, left, room, moved, total):
+        nonlocal best
+        if k == len(cells):
+            best = min(best, (moved, total), key=lambda b: (-b[0], b[1]))
+            return
+        r, c = cells[k]
+        for amount in range(min(left[r], room[c]) + 1):
+            left[r] -= amount
+            room[c] -= amount
+            place(k + 1, left, room, moved + amount, total + amount * cost[r][c])
+            left[r] += amount
+            room[c] += amount
+    place(0, list(supply), list(demand), 0, 0.0)
+    return best
+
+def check_plan(cost, supply, demand):
+    flow = solve_transport(cost, supply, demand)
+    assert (flow >= 0).all()
+    assert (flow.sum(axis=1) <= supply).all()
+    assert (flow.sum(axis=0) <= demand).all()
+    assert not flow[~np.isfinite(np.asarray(cost, dtype=float))].any()
+    used = flow > 0
+    return int(flow.sum()), float((flow[used] * np.asarray(cost, dtype=float)[used]).sum())
+
+def test_stranded_supply_leaves_the_dearest_rows_unserved():
+    cost = [[43, 14], [28, INF], [35, 4], [9, 50], [INF, 31], [INF, INF]]
+    supply = [1, 8, 5, 5, 7, 20]
+    demand = [16, 13]
+
+    assert check_plan(cost, supply, demand) == (26, 520.0)
+
+def test_plans_match_brute_force():
+    rng = random.Random(7)
+    for _ in range(150):
+        rows, cols = rng.randint(1, 3), rng.randint(1, 3)
+        cost = [[INF if rng.random() < 0.3 else rng.randint(1, 20) for _ in range(cols)]
+                for _ in range(rows)]
+        supply = [rng.randint(0, 3) for _ in range(rows)]
+        demand = [rng.randint(0, 3) for _ in range(cols)]
+
+        assert check_plan(cost, supply, demand) == brute_force(cost, supply, demand), (cost, supply, demand)
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import worker
+from storage import StorageError
+from worker import CronTrigger, IntervalTrigger, Scheduler
+
+def make_scheduler(calls):
+    scheduler = Scheduler(owner="worker-1")
+    scheduler.add_job("sweep", lambda: calls.append("sweep"), IntervalTrigger(3600))
+    scheduler.add_job("digest", lambda: calls.append("digest"), CronTrigger("0 8 * * *"))
+    return scheduler
+
+def test_only_interval_jobs_run_at_startup():
+    calls = []
+    scheduler = make_scheduler(calls)
+    
+    assert scheduler.run_pending(now=datetime(2026, 3, 2, 10, 30)) == ["sweep"]
+    assert scheduler.jobs["digest"].next_run == datetime(2026, 3, 3, 8, 0)
+
+def test_cron_job_runs_when_its_time_comes():
+    calls = []
+    scheduler = make_scheduler(calls)
+    start = datetime(2026, 3, 2, 7, 58)
+    scheduler.run_pending(now=start)
+    
+    assert scheduler.run_pending(now=start + timedelta(minutes=1)) == []
+    assert scheduler.run_pending(now=start + timedelta(minutes=2)) == ["digest"]
+    assert calls == ["sweep", "digest"]
+
+def test_restart_does_not_repeat_a_cron_job():
+    calls = []
+    moment = datetime(2026, 3, 2, 8, 0)
+    scheduler = make_scheduler(calls)
+    scheduler.run_pending(now=moment - timedelta(minutes=1))
+    scheduler.run_pending(now=moment)
+    
+    # A replacement worker started right after the run keeps to the schedule
+    restarted = make_scheduler(calls)
+    restarted.run_pending(now=moment + timedelta(minutes=5))
+    
+    assert calls.count("digest") == 1
+    assert restarted.jobs["digest"].next_run == moment + timedelta(days=1)
+
+def test_run_all_runs_every_job():
+    calls = []
+    
+    assert make_scheduler(calls).run_pending(now=datetime(2026, 3, 2, 10, 30), run_all=True) == ["sweep", "digest"]
+
+def test_lease_store_errors_are_counted_and_retried(monkeypatch):
+    calls = []
+    scheduler = make_scheduler(calls)
+    moment = datetime(2026, 3, 2, 10, 30)
+    
+    def unavailable(*args, **kwargs):
+        raise StorageError("Collection 'worker_jobs' is unreadable")
+    monkeypatch.setattr(worker, "acquire_lease", unavailable)
+    assert scheduler.run_pending(now=moment) == []
+    assert scheduler.jobs["sweep"].metrics['lease_errors'] == 1
+    assert "unreadable" in scheduler.jobs["sweep"].metrics['last_lease_error']
+    
+    # Finishing fails too, but the job ran and the worker keeps going
+    monkeypatch.undo()
+    monkeypatch.setattr(worker, "finish_lease", unavailable)
+    assert scheduler.run_pending(now=moment + timedelta(seconds=30)) == ["sweep"]
+    assert calls == ["sweep"]
+    assert scheduler.jobs["sweep"].metrics['lease_errors'] == 2
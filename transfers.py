@@ -0,0 +1,237 @@
+import heapq
+import threading
+import numpy as np
+from storage import read_snapshot
+from inventory import BLOOD_GROUPS, get_stock_by_bank
+
+EARTH_RADIUS_KM = 6371
+
+# Stock each bank should hold of every group; anything above is surplus
+DEFAULT_TARGET_ML = 1000
+
+def haversine_matrix(lat1, lng1, lat2, lng2):
+    """Get the great-circle distance in km between every pair of two coordinate arrays"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lng1, lat2, lng2))
+    dlat = lat2[None, :] - lat1[:, None]
+    dlng = lng2[None, :] - lng1[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1)[:, None] * np.cos(lat2)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+# Bank-to-bank distances for blood_banks.json, in file order. Banks are only
+# ever appended, so a new bank adds one row and column instead of a rebuild.
+_matrix = {'names': [], 'lat': np.empty(0), 'lng': np.empty(0), 'km': np.empty((0, 0))}
+_matrix_lock = threading.Lock()
+
+def get_distance_matrix():
+    """Get (bank names, distance matrix in km) for every bank in blood_banks.json"""
+    banks = read_snapshot("blood_banks")
+    names = [bank['name'] for bank in banks]
+    with _matrix_lock:
+        known = len(_matrix['names'])
+        if names[:known] != _matrix['names']:
+            known = 0  # banks were edited or removed; start over
+            _matrix.update(names=[], lat=np.empty(0), lng=np.empty(0), km=np.empty((0, 0)))
+        if len(names) > known:
+            new_lat = np.array([bank['lat'] for bank in banks[known:]], dtype=float)
+            new_lng = np.array([bank['lng'] for bank in banks[known:]], dtype=float)
+            lat = np.concatenate([_matrix['lat'], new_lat])
+            lng = np.concatenate([_matrix['lng'], new_lng])
+            new_rows = haversine_matrix(new_lat, new_lng, lat, lng)
+            km = np.zeros((len(names), len(names)))
+            km[:known, :known] = _matrix['km']
+            km[known:, :] = new_rows
+            km[:known, known:] = new_rows[:, :known].T
+            _matrix.update(names=names, lat=lat, lng=lng, km=km)
+        return list(_matrix['names']), _matrix['km']
+
+def _target_for(targets, bank, blood_group):
+    if isinstance(targets, dict):
+        target = targets.get(bank, targets.get('default', DEFAULT_TARGET_ML))
+        return target.get(blood_group, DEFAULT_TARGET_ML) if isinstance(target, dict) else target
+    return targets
+
+def _shortest_path(cost, flow, row_potential, col_potential, remaining, starts):
+    """Find the cheapest residual path from a supply row to a demand column with room.
+
+    Dijkstra on reduced costs over the bipartite residual graph, starting
+    from every row in ``starts`` (row -> reduced distance from the source):
+    a row reaches every column at once (vectorized), a column reaches back
+    only the rows already shipping to it. Potentials only change on settled
+    nodes and stay finite, so moves that are not allowed (cost inf) are
+    never relaxed. Stops at the nearest column with demand left.
+    Returns (path as alternating row/column indices, settled rows/columns
+    with their distances), or None if no such column is reachable.
+    """
+    num_cols = cost.shape[1]
+    col_dist = np.full(num_cols, np.inf)
+    col_prev = np.full(num_cols, -1)
+    col_done = np.zeros(num_cols, dtype=bool)
+    open_cols = col_dist.copy()  # col_dist with settled columns masked out
+    row_dist = dict(starts)
+    row_prev = {}
+    row_done = {}
+    row_heap = [(d, row) for row, d in starts.items()]
+    heapq.heapify(row_heap)
+    while True:
+        while row_heap and row_heap[0][1] in row_done:
+            heapq.heappop(row_heap)
+        col = int(np.argmin(open_cols))
+        if row_heap and row_heap[0][0] <= open_cols[col]:
+            d, row = heapq.heappop(row_heap)
+            row_done[row] = d
+            reduced = d + cost[row] + row_potential[row] - col_potential
+            better = (reduced < col_dist) & ~col_done
+            open_cols[better] = col_dist[better] = reduced[better]
+            col_prev[better] = row
+            continue
+        if not np.isfinite(open_cols[col]):
+            return None
+        col_done[col] = True
+        open_cols[col] = np.inf
+        if remaining[col] > 0:
+            break
+        d = col_dist[col]
+        for row in np.flatnonzero(flow[:, col]):
+            row = int(row)
+            if row in row_done:
+                continue
+            nd = d - cost[row, col] + col_potential[col] - row_potential[row]
+            if nd < row_dist.get(row, np.inf):
+                row_dist[row] = nd
+                row_prev[row] = col
+                heapq.heappush(row_heap, (nd, row))
+
+    path = [col]
+    row = int(col_prev[col])
+    while True:
+        path.append(row)
+        if row not in row_prev:
+            break
+        back = row_prev[row]
+        path.append(back)
+        row = int(col_prev[back])
+    path.reverse()
+    return path, row_done, np.flatnonzero(col_done), col_dist
+
+def _successive_paths(cost, supply, demand, one_row):
+    """Run successive shortest paths with potentials from a virtual source.
+
+    With ``one_row`` every search starts from the first row with supply
+    left, so it stays near its start; gives up (None) as soon as that row
+    cannot ship everything. Otherwise searches start from every row with
+    supply left and run until nothing more can move.
+    """
+    flow = np.zeros(cost.shape, dtype=np.int64)
+    row_potential = np.zeros(cost.shape[0])
+    col_potential = np.zeros(cost.shape[1])
+    source_potential = 0.0
+    left = supply.copy()
+    remaining = demand.copy()
+    while True:
+        rows = np.flatnonzero(left > 0)
+        if not len(rows):
+            return flow
+        if one_row:
+            rows = rows[:1]
+        starts = {int(row): source_potential - row_potential[row] for row in rows}
+        found = _shortest_path(cost, flow, row_potential, col_potential, remaining, starts)
+        if found is None:
+            return None if one_row else flow
+        path, row_done, cols_done, col_dist = found
+        target = path[-1]
+        reach = col_dist[target]
+        for row, d in row_done.items():
+            row_potential[row] += d - reach
+        col_potential[cols_done] += col_dist[cols_done] - reach
+        source_potential -= reach
+
+        # path is row, col, row, col, ...: forward moves at even steps,
+        # cancelled moves on the way back at odd ones
+        push = min(int(left[path[0]]), int(remaining[target]))
+        for k in range(1, len(path) - 1, 2):
+            push = min(push, int(flow[path[k + 1], path[k]]))
+        for k in range(0, len(path) - 1, 2):
+            flow[path[k], path[k + 1]] += push
+        for k in range(1, len(path) - 1, 2):
+            flow[path[k + 1], path[k]] -= push
+        remaining[target] -= push
+        left[path[0]] -= push
+
+def solve_transport(cost, supply, demand):
+    """Get the cheapest plan moving as much supply to demand as possible.
+
+    ``cost`` is a rows x columns matrix (np.inf where a move is not allowed).
+    Works by successive shortest paths with potentials from the side with
+    less to move. Serving one supply row at a time keeps every search near
+    its start and is optimal when all of it moves; when moves that are not
+    allowed strand some supply, the plan is redone searching from every row
+    at once, so the rows that do ship are the cheapest ones. Returns the
+    integer flow matrix.
+    """
+    cost = np.asarray(cost, dtype=float)
+    supply = np.asarray(supply, dtype=np.int64)
+    demand = np.asarray(demand, dtype=np.int64)
+    if supply.sum() > demand.sum():
+        return solve_transport(cost.T, demand, supply).T
+
+    flow = _successive_paths(cost, supply, demand, one_row=True)
+    if flow is None:
+        flow = _successive_paths(cost, supply, demand, one_row=False)
+    return flow
+
+def _plan_group(surplus, deficit, km, max_km):
+    """Move one group's surplus to its deficits over the shortest total distance"""
+    sources = sorted(i for i in surplus if surplus[i] > 0)
+    sinks = sorted(j for j in deficit if deficit[j] > 0)
+    if not sources or not sinks:
+        return []
+
+    distances = km[np.ix_(sources, sinks)]
+    cost = distances if max_km is None else np.where(distances <= max_km, distances, np.inf)
+    flow = solve_transport(cost, [surplus[i] for i in sources], [deficit[j] for j in sinks])
+    return [
+        (sources[s], sinks[d], int(flow[s, d]), float(distances[s, d]))
+        for s, d in zip(*np.nonzero(flow))
+    ]
+
+def plan_transfers(stock_by_bank=None, targets=DEFAULT_TARGET_ML, max_km=None):
+    """Plan stock moves from banks above their target to banks below it.
+
+    ``targets`` is one ml level for every bank and group, or a dict of bank
+    name to a level or a per-group dict (with an optional 'default' entry).
+    Each group is solved as a transportation problem over the cached
+    distance matrix, moving as much as possible with the least total
+    distance. Only banks listed in blood_banks.json take part. Returns the
+    ``transfers`` list and the ml still short per group after them.
+    """
+    if stock_by_bank is None:
+        stock_by_bank = get_stock_by_bank()
+    names, km = get_distance_matrix()
+    index = {name: i for i, name in enumerate(names)}
+
+    transfers = []
+    shortfall = {}
+    for blood_group in BLOOD_GROUPS:
+        surplus, deficit = {}, {}
+        for bank, groups in stock_by_bank.items():
+            if bank not in index:
+                continue
+            gap = groups.get(blood_group, 0) - _target_for(targets, bank, blood_group)
+            if gap > 0:
+                surplus[index[bank]] = gap
+            elif gap < 0:
+                deficit[index[bank]] = -gap
+        moved = 0
+        for i, j, quantity, distance in _plan_group(surplus, deficit, km, max_km):
+            transfers.append({
+                'blood_group': blood_group,
+                'from_bank': names[i],
+                'to_bank': names[j],
+                'quantity': quantity,
+                'distance_km': round(distance, 2)
+            })
+            moved += quantity
+        shortfall[blood_group] = sum(deficit.values()) - moved
+
+    transfers.sort(key=lambda t: (t['blood_group'], t['from_bank'], t['distance_km']))
+    return {'transfers': transfers, 'shortfall': shortfall}
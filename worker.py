@@ -0,0 +1,266 @@
+import argparse
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from storage import read_collection, transaction, checkpoint, compact_change_feeds
+
+# Run state of every job, shared by all worker replicas. A job only runs in
+# the replica holding its lease; the lease is kept until the job is next
+# due, so replicas on the same schedule skip runs another one already did.
+JOBS_COLLECTION = "worker_jobs"
+DEFAULT_LEASE_SECONDS = 300
+POLL_SECONDS = 1.0
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class IntervalTrigger:
+    """Fire every ``seconds`` seconds"""
+
+    run_at_startup = True
+
+    def __init__(self, seconds):
+        self.interval = timedelta(seconds=seconds)
+
+    def next_after(self, moment):
+        return moment + self.interval
+
+def _parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        spec, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if spec == '*':
+            start, end = low, high
+        elif '-' in spec:
+            start, end = (int(v) for v in spec.split('-'))
+        else:
+            start = int(spec)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field '{field}' is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronTrigger:
+    """Fire on a five-field cron schedule: minute hour day-of-month month day-of-week.
+
+    Fields accept ``*``, numbers, ranges, lists and ``/step``; day-of-week
+    counts from 0 = Sunday. As in cron, when both day fields are restricted a
+    day matching either one fires.
+    """
+
+    run_at_startup = False
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' needs five fields")
+        self.expression = expression
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _parse_cron_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Skip whole days and hours that cannot match; four years covers every schedule
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+
+class Job:
+    """A named periodic task with its trigger and run metrics"""
+
+    def __init__(self, name, func, trigger, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.lease_seconds = lease_seconds
+        self.next_run = None
+        self.metrics = {
+            'runs': 0, 'failures': 0, 'skipped': 0,
+            'last_seconds': None, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            'last_result': None, 'last_error': None, 'lease_errors': 0, 'last_lease_error': None
+        }
+
+def acquire_lease(job_name, seconds, owner=WORKER_ID, now=None):
+    """Take a job's lease if it is free, expired or already ours"""
+    now = now or datetime.now()
+    with transaction(JOBS_COLLECTION) as uow:
+        jobs = uow.get(JOBS_COLLECTION) or {}
+        record = jobs.get(job_name, {})
+        if record.get('owner') not in (None, owner) and record.get('lease_until', '') > now.isoformat():
+            uow.discard()
+            return False
+        record.update(owner=owner, lease_until=(now + timedelta(seconds=seconds)).isoformat(),
+                      started_at=now.isoformat())
+        jobs[job_name] = record
+        uow.set(JOBS_COLLECTION, jobs)
+    return True
+
+def finish_lease(job_name, hold_until, outcome, owner=WORKER_ID):
+    """Record a run's outcome and keep the lease until the job is next due"""
+    with transaction(JOBS_COLLECTION) as uow:
+        jobs = uow.get(JOBS_COLLECTION) or {}
+        record = jobs.get(job_name, {})
+        if record.get('owner') != owner:
+            uow.discard()  # the lease expired mid-run and another worker took it
+            return
+        record.update(outcome, lease_until=hold_until.isoformat(), finished_at=datetime.now().isoformat())
+        jobs[job_name] = record
+        uow.set(JOBS_COLLECTION, jobs)
+
+def get_job_status():
+    """Get the shared run state of every job"""
+    return read_collection(JOBS_COLLECTION) or {}
+
+class Scheduler:
+    """Runs due jobs one at a time, each under a lease held through storage"""
+
+    def __init__(self, owner=WORKER_ID):
+        self.owner = owner
+        self.jobs = {}
+
+    def add_job(self, name, func, trigger, lease_seconds=DEFAULT_LEASE_SECONDS):
+        job = Job(name, func, trigger, lease_seconds)
+        self.jobs[name] = job
+        return job
+
+    def run_pending(self, now=None, run_all=False):
+        """Run every job that is due, or every job with ``run_all``; returns the names of jobs that ran"""
+        now = now or datetime.now()
+        ran = []
+        for job in self.jobs.values():
+            if job.next_run is None:
+                # Interval jobs run once at startup; cron jobs keep to their
+                # schedule, so a restart does not e.g. send the digest again
+                job.next_run = now if job.trigger.run_at_startup else job.trigger.next_after(now)
+            if job.next_run > now and not run_all:
+                continue
+            due, job.next_run = job.next_run, job.trigger.next_after(now)
+            try:
+                leased = acquire_lease(job.name, job.lease_seconds, self.owner, now)
+            except Exception:
+                # The shared job state is unavailable; try again next poll
+                self._lease_failed(job)
+                job.next_run = due
+                continue
+            if not leased:
+                job.metrics['skipped'] += 1
+                continue
+            self._run(job)
+            ran.append(job.name)
+        return ran
+
+    def _run(self, job):
+        metrics = job.metrics
+        started = time.perf_counter()
+        outcome = {'last_error': None}
+        try:
+            metrics['last_result'] = outcome['last_result'] = job.func()
+            metrics['last_error'] = None
+        except Exception:
+            metrics['failures'] += 1
+            metrics['last_error'] = outcome['last_error'] = traceback.format_exc(limit=5)
+        elapsed = time.perf_counter() - started
+        metrics['runs'] += 1
+        metrics['last_seconds'] = elapsed
+        metrics['total_seconds'] += elapsed
+        metrics['max_seconds'] = max(metrics['max_seconds'], elapsed)
+        outcome['last_seconds'] = round(elapsed, 6)
+        try:
+            finish_lease(job.name, job.next_run, outcome, self.owner)
+        except Exception:
+            # The lease simply runs out; results that are not JSON are not kept
+            self._lease_failed(job)
+
+    def _lease_failed(self, job):
+        job.metrics['lease_errors'] += 1
+        job.metrics['last_lease_error'] = traceback.format_exc(limit=5)
+
+    def get_metrics(self):
+        """Get per-job run counts and timings for this process"""
+        return {name: dict(job.metrics, next_run=job.next_run) for name, job in self.jobs.items()}
+
+    def run_forever(self, poll_seconds=POLL_SECONDS):
+        """Run jobs as they come due until interrupted"""
+        try:
+            while True:
+                self.run_pending()
+                time.sleep(poll_seconds)
+        except KeyboardInterrupt:
+            pass
+
+def compact_storage():
+    """Snapshot busy inventory shards, compact the request queue, outreach logs and change feeds, and checkpoint the WAL"""
+    from inventory import list_banks, maybe_snapshot
+    from request_queue import maybe_compact
+    import outreach
+
+    snapshots = sum(1 for bank in list_banks() if maybe_snapshot(bank))
+    maybe_compact()
+    outreach.maybe_compact()
+    dropped = compact_change_feeds()
+    checkpoint()
+    return {'snapshots': snapshots, 'feed_events_dropped': sum(dropped.values())}
+
+def build_scheduler(owner=WORKER_ID):
+    """Create a scheduler with the standard maintenance jobs"""
+    from notifications import purge_expired_otps
+    from request_management import expire_overdue_requests, send_donor_digests
+    from inventory import sweep_expired_lots
+    from outreach import advance_outreach
+    from alerts import check_all_stock_alerts
+    from forecast import run_forecast
+    from blood_management import seal_history
+
+    scheduler = Scheduler(owner)
+    scheduler.add_job("purge_expired_otps", purge_expired_otps, IntervalTrigger(300))
+    scheduler.add_job("advance_outreach", advance_outreach, IntervalTrigger(30))
+    scheduler.add_job("expire_overdue_requests", expire_overdue_requests, IntervalTrigger(900))
+    scheduler.add_job("sweep_expired_lots", sweep_expired_lots, CronTrigger("0 * * * *"))
+    # Alerts are checked on every stock change; this catches up after a crash
+    scheduler.add_job("check_stock_alerts", check_all_stock_alerts, IntervalTrigger(600))
+    scheduler.add_job("compact_storage", compact_storage, IntervalTrigger(600))
+    scheduler.add_job("send_donor_digests", send_donor_digests, CronTrigger("0 8 * * *"))
+    scheduler.add_job("run_forecast", run_forecast, CronTrigger("30 2 * * *"))
+    scheduler.add_job("seal_history", seal_history, CronTrigger("0 3 1 * *"))
+    return scheduler
+
+def main():
+    parser = argparse.ArgumentParser(description="Run BloodBondHelper background jobs")
+    parser.add_argument("--once", action="store_true", help="run every job once and exit")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="seconds between schedule checks")
+    args = parser.parse_args()
+
+    scheduler = build_scheduler()
+    if args.once:
+        scheduler.run_pending(run_all=True)
+        for name, metrics in scheduler.get_metrics().items():
+            status = "failed" if metrics['last_error'] else "ok"
+            print(f"{name}: {status} in {metrics['last_seconds'] or 0:.3f}s -> {metrics['last_result']}")
+    else:
+        scheduler.run_forever(args.poll)
+
+if __name__ == "__main__":
+    main()